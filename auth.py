@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from user_registry import UserRegistry
+
+HASH_ALGORITHM: str = 'pbkdf2_sha256'
+
+
+def hash_password(password: str, iterations: int) -> str:
+    """
+    Возвращает хеш пароля в формате
+    'pbkdf2_sha256$<итерации>$<соль>$<хеш>'.
+    """
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return f'{HASH_ALGORITHM}${iterations}${salt.hex()}${digest.hex()}'
+
+
+def exit_with_parent(parent_pid: int) -> None:
+    """
+    Инициализатор процесса пула: процесс завершается вслед
+    за родительским (иначе после остановки сервера по сигналу
+    процессы пула остаются работать).
+    """
+    def watch() -> None:
+        while os.getppid() == parent_pid:
+            time.sleep(1)
+        os._exit(0)
+
+    threading.Thread(target=watch, daemon=True).start()
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """
+    Проверка пароля по сохраненному хешу.
+    Пароли, сохраненные до введения хеширования (открытым текстом),
+    сравниваются напрямую.
+    """
+    if not password_hash.startswith(f'{HASH_ALGORITHM}$'):
+        return hmac.compare_digest(password.encode(), password_hash.encode())
+    _, iterations, salt, digest = password_hash.split('$')
+    return hmac.compare_digest(
+        hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), int(iterations)),
+        bytes.fromhex(digest),
+    )
+
+
+class Authenticator:
+    """
+    Аутентификация и регистрация пользователей на стороне сервера.
+    Хеширование паролей выполняется в пуле процессов и не блокирует
+    цикл событий; успешно проверенные пары логин/пароль
+    кешируются на короткое время.
+    """
+    def __init__(
+        self,
+        users: UserRegistry,
+        iterations: int,
+        cache_ttl: int,
+        workers: int | None = None,
+    ) -> None:
+        """
+        Инициализация аутентификатора.
+        """
+        self.users = users
+        self.iterations = iterations
+        self.cache_ttl = cache_ttl
+        self.pool = ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=exit_with_parent,
+            initargs=(os.getpid(),),
+        )
+        self.verified: dict[bytes, tuple[str, float]] = {}
+
+    def cache_key(self, username: str, password: str) -> bytes:
+        """
+        Ключ кеша проверенных учетных данных (пароль в открытом виде не хранится).
+        """
+        return hashlib.sha256(f'{username}\0{password}'.encode()).digest()
+
+    def remember(self, username: str, password: str, password_hash: str) -> None:
+        """
+        Добавление проверенных учетных данных в кеш.
+        """
+        now = time.monotonic()
+        if len(self.verified) > 10000:
+            self.verified = {
+                key: value for key, value in self.verified.items() if value[1] > now
+            }
+        self.verified[self.cache_key(username, password)] = (
+            password_hash, now + self.cache_ttl,
+        )
+
+    async def login(self, username: str, password: str) -> bool:
+        """
+        Проверка логина и пароля пользователя.
+        """
+        user = await self.users.lookup(username)
+        if user is None:
+            return False
+        password_hash: str = user['password']
+        cached = self.verified.get(self.cache_key(username, password))
+        if cached is not None and cached[0] == password_hash and cached[1] > time.monotonic():
+            return True
+
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(
+            self.pool, verify_password, password, password_hash,
+        ):
+            return False
+        if not password_hash.startswith(f'{HASH_ALGORITHM}$'):
+            password_hash = await loop.run_in_executor(
+                self.pool, hash_password, password, self.iterations,
+            )
+            await self.users.set_password(username, password_hash)
+        self.remember(username, password, password_hash)
+        return True
+
+    async def register(self, username: str, password: str) -> bool:
+        """
+        Регистрация нового пользователя.
+        Возвращает False, если имя пользователя уже занято.
+        """
+        if await self.users.lookup(username) is not None:
+            return False
+        password_hash = await asyncio.get_running_loop().run_in_executor(
+            self.pool, hash_password, password, self.iterations,
+        )
+        if not await self.users.register(username, password_hash):
+            return False
+        self.remember(username, password, password_hash)
+        return True
+
+    def close(self) -> None:
+        """
+        Остановка пула процессов.
+        """
+        self.pool.shutdown(cancel_futures=True)
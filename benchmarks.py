@@ -0,0 +1,1182 @@
+import argparse
+import asyncio
+import datetime
+import gc
+import json
+import os
+import pty
+import random
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from typing import Any, AsyncIterator, Callable, NamedTuple
+
+from client import Client
+from compression import CompressionAlgorithm, FrameCompressor, FrameDecompressor
+from framing import (
+    HEADER, MAX_FRAME_SIZE, READ_CHUNK_SIZE, FrameDecoder, FrameType, encode_frame, read_frames,
+)
+from loadgen import LOAD_PASSWORD, server_cpu, server_rss, spawn_server, wait_for_port
+from message_log import LogRecordType, MessageLog, empty_state
+from message_store import DEFAULT_ROOM, MessageStore
+from outbound import OutboundQueue
+from rooms import Room
+from scheduler import Scheduler
+from search_index import SearchIndex, parse_query
+from server import Server
+from user_registry import save_users
+
+Report = dict[str, Any]
+
+SEARCH_QUERIES: tuple[str, ...] = (
+    'w0', 'w5000', 'w3 w7', 'w1 w2 w3', '"w0 w1"', 'from:user5', 'from:user5 w0',
+    'w19999 w0', 'w0 page:100', 'w3 w7 page:100',
+)
+# Сообщение замера передачи порта: номер клиента и номер сообщения.
+HANDOVER_MESSAGE = re.compile(rb'h(\d+)-(\d+)')
+SAMPLE_MESSAGE: str = (
+    '[{}] (18.10.26 10:00:00) someone: the quick brown fox jumps over the lazy dog'
+)
+
+
+class LegacyMessage(NamedTuple):
+    """
+    Прежнее представление сообщения: дата и готовый текст,
+    который кодируется при каждой отправке.
+    """
+    date: datetime.datetime
+    index: int
+    text: str
+
+
+def legacy_message(index: int, author: str, body: str) -> LegacyMessage:
+    """
+    Сообщение в прежнем представлении (дата форматируется для каждого
+    сообщения).
+    """
+    date = datetime.datetime.fromtimestamp(index / 1000)
+    return LegacyMessage(
+        date, index, f'[{index}] ({date.strftime("%d.%m.%y %H:%M:%S")}) {author}: {body}',
+    )
+
+
+class NullWriter:
+    """
+    Соединение клиента, которое принимает данные без отправки.
+    """
+    def write(self, data: bytes) -> None:
+        pass
+
+    async def drain(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+async def uninstrumented_broadcast(server: Server, message: str | bytes, room: Room) -> None:
+    """
+    Server.broadcast_message без замера времени в метриках
+    (для сравнения в bench_metrics).
+    """
+    payload: bytes = encode_frame(FrameType.CHAT, message)
+    for outbound in list(room.members.values()):
+        await outbound.put(payload)
+
+
+def per_second(count: int, seconds: float) -> float:
+    """
+    Количество операций в секунду (с округлением).
+    """
+    return round(count / seconds, 1)
+
+
+def bench_framing(args: argparse.Namespace) -> Report:
+    """
+    Пропускная способность протокола кадров: кодирование
+    и разбор messages кадров, полученных частями по READ_CHUNK_SIZE байт
+    (с декодированием нагрузки из UTF-8, как в клиенте).
+    """
+    messages = [SAMPLE_MESSAGE.format(index) for index in range(args.messages)]
+    started = time.perf_counter()
+    stream = b''.join(encode_frame(FrameType.CHAT, message) for message in messages)
+    encode_time = time.perf_counter() - started
+
+    decoder = FrameDecoder()
+    decoded: int = 0
+    started = time.perf_counter()
+    for position in range(0, len(stream), READ_CHUNK_SIZE):
+        decoder.feed(stream[position:position + READ_CHUNK_SIZE])
+        for _, payload in decoder.frames():
+            str(payload, 'utf-8')
+            decoded += 1
+    decode_time = time.perf_counter() - started
+    return {
+        'messages': decoded,
+        'encode_per_second': per_second(args.messages, encode_time),
+        'decode_per_second': per_second(decoded, decode_time),
+        'decode_mib_per_second': round(len(stream) / decode_time / 2 ** 20, 1),
+    }
+
+
+def fill_store(store: MessageStore, count: int, created_at: float = 0.0) -> float:
+    """
+    Добавление count сообщений (по одному в миллисекунду начиная
+    с created_at). Возвращает затраченное время.
+    """
+    started = time.perf_counter()
+    for index in range(count):
+        store.append(
+            index, created_at + index / 1000, f'user{index % 1000}', f'message number {index}',
+        )
+    return time.perf_counter() - started
+
+
+def bench_store(args: argparse.Namespace) -> Report:
+    """
+    Хранилище сообщений с messages сообщениями (без поискового
+    индекса): добавление, поиск по номеру, выборка истории для
+    повторного подключения и удаление по времени жизни.
+    """
+    count = args.messages
+    store = MessageStore(count, 3600)
+    append_time = fill_store(store, count)
+
+    started = time.perf_counter()
+    for index in range(count):
+        store.payload(index)
+    lookup_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(100):
+        store.since(count - 101)
+    since_time = time.perf_counter() - started
+
+    # Половина сообщений старше времени жизни: удаляются одним вызовом.
+    started = time.perf_counter()
+    expired = store.expire(3600 + count / 2000)
+    expire_time = time.perf_counter() - started
+    return {
+        'messages': count,
+        'append_us': round(append_time / count * 1e6, 3),
+        'lookup_us': round(lookup_time / count * 1e6, 3),
+        'history_100_us': round(since_time / 100 * 1e6, 3),
+        'expired': expired,
+        'expire_us_per_message': round(expire_time / max(expired, 1) * 1e6, 3),
+    }
+
+
+def directory_size(directory: str) -> int:
+    """
+    Размер файлов каталога в байтах.
+    """
+    with os.scandir(directory) as entries:
+        return sum(entry.stat().st_size for entry in entries if entry.is_file())
+
+
+def bench_log(args: argparse.Namespace) -> Report:
+    """
+    Журнал сообщений: запись messages сообщений чата пачками
+    по batch записей (group commit, fsync по политике fsync) со сменой
+    сегментов по segment_size байт и время восстановления состояния
+    при запуске - после сбоя (последний сегмент со снимком
+    и записями) и после плавной остановки (сжатый снимок checkpoint()).
+    В снимке, как у сервера, - последние history сообщений.
+    """
+    history: deque[list[Any]] = deque(maxlen=args.history)
+
+    def snapshot() -> dict[str, Any]:
+        return {
+            **empty_state(),
+            'room_indexes': {DEFAULT_ROOM: history[-1][0] + 1 if history else 0},
+            'chat_messages': list(history),
+        }
+
+    async def write(log: MessageLog) -> int:
+        written: int = 0
+        for index in range(args.messages):
+            record = [
+                index, 1e9 + index / 1000, f'user{index % 1000}', f'message {index}',
+                None, DEFAULT_ROOM,
+            ]
+            log.append(LogRecordType.CHAT, record)
+            history.append(record)
+            if index % args.batch == args.batch - 1 or index == args.messages - 1:
+                written += sum(map(len, log.pending))
+                await log.flush()
+        return written
+
+    with tempfile.TemporaryDirectory() as directory:
+        log = MessageLog(directory, snapshot, args.segment_size, 3, 0.0, args.fsync, 1.0)
+        log.open()
+        started = time.perf_counter()
+        written = asyncio.run(write(log))
+        log.close()
+        write_time = time.perf_counter() - started
+        disk = directory_size(directory)
+
+        started = time.perf_counter()
+        state = log.recover()
+        recover_time = time.perf_counter() - started
+        assert state['room_indexes'][DEFAULT_ROOM] == args.messages
+
+        log.checkpoint()
+        started = time.perf_counter()
+        log.recover()
+        checkpoint_recover_time = time.perf_counter() - started
+        return {
+            'messages': args.messages,
+            'fsync': args.fsync,
+            'write_per_second': per_second(args.messages, write_time),
+            'write_mib_per_second': round(written / write_time / 2 ** 20, 1),
+            'segments_kept_mib': round(disk / 2 ** 20, 1),
+            'recover_ms': round(recover_time * 1e3, 1),
+            'recovered_messages': len(state['chat_messages']),
+            'checkpoint_recover_ms': round(checkpoint_recover_time * 1e3, 1),
+        }
+
+
+def traced_memory(build: Callable[[], Any]) -> tuple[Any, int]:
+    """
+    Результат build() и память, выделенная при его построении.
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, memory
+
+
+def bench_messages(args: argparse.Namespace) -> Report:
+    """
+    Представление сообщений до и после перехода на MessageStore
+    (LegacyMessage и MessageStore): память messages хранимых сообщений,
+    процессорное время на сохранение и рассылку нового сообщения
+    recipients получателям и на отправку истории из 100 сообщений.
+    """
+    count, recipients = args.messages, args.recipients
+    body = 'the quick brown fox jumps over the lazy dog, message number'
+
+    def legacy_messages() -> list[LegacyMessage]:
+        return [legacy_message(index, f'user{index % 1000}', body) for index in range(count)]
+
+    def store_messages() -> MessageStore:
+        store = MessageStore(count + 1, 3600)
+        for index in range(count):
+            store.append(index, index / 1000, f'user{index % 1000}', body)
+        return store
+
+    legacy, legacy_memory = traced_memory(legacy_messages)
+    store, store_memory = traced_memory(store_messages)
+    queues: list[list[bytes]] = [[] for _ in range(recipients)]
+    rounds = 2000
+
+    started = time.process_time()
+    for index in range(count, count + rounds):
+        message = legacy_message(index, 'sender', body)
+        legacy.append(message)
+        payload = encode_frame(FrameType.CHAT, message.text)
+        for queue in queues:
+            queue.append(payload)
+            queue.clear()
+    legacy_broadcast = time.process_time() - started
+
+    started = time.process_time()
+    for index in range(count, count + rounds):
+        payload = encode_frame(FrameType.CHAT, store.append(index, index / 1000, 'sender', body))
+        for queue in queues:
+            queue.append(payload)
+            queue.clear()
+    store_broadcast = time.process_time() - started
+
+    started = time.process_time()
+    for _ in range(rounds):
+        b''.join(encode_frame(FrameType.HISTORY, message.text) for message in legacy[-100:])
+    legacy_history = time.process_time() - started
+
+    started = time.process_time()
+    for _ in range(rounds):
+        b''.join(
+            HEADER.pack(len(payload), FrameType.HISTORY) + payload for payload in store.last(100)
+        )
+    store_history = time.process_time() - started
+    return {
+        'messages': count,
+        'recipients': recipients,
+        'bytes_per_message': {
+            'before': round(legacy_memory / count), 'after': round(store_memory / count),
+        },
+        'broadcast_us': {
+            'before': round(legacy_broadcast / rounds * 1e6, 2),
+            'after': round(store_broadcast / rounds * 1e6, 2),
+        },
+        'history_100_us': {
+            'before': round(legacy_history / rounds * 1e6, 2),
+            'after': round(store_history / rounds * 1e6, 2),
+        },
+    }
+
+
+def random_bodies(count: int, vocabulary: int, seed: int = 7) -> list[str]:
+    """
+    Тексты сообщений из 6-14 слов с частотами по закону Ципфа
+    (слово w0 встречается чаще всех).
+    """
+    rnd = random.Random(seed)
+    words = [f'w{number}' for number in range(vocabulary)]
+    weights = [1 / (number + 1) for number in range(vocabulary)]
+    return [' '.join(rnd.choices(words, weights, k=rnd.randint(6, 14))) for _ in range(count)]
+
+
+def bench_search(args: argparse.Namespace) -> Report:
+    """
+    Поисковый индекс по messages сообщениям: скорость индексации
+    при добавлении, память индекса и время первой страницы результатов
+    (search_page_size сообщений) для запросов SEARCH_QUERIES.
+    """
+    count, page_size = args.messages, args.page_size
+    bodies = random_bodies(5000, 20000)
+    authors = [f'user{number}' for number in range(1000)]
+
+    def fill(store: MessageStore) -> float:
+        started = time.perf_counter()
+        for index in range(count):
+            store.append(index, index / 1000, authors[index % 1000], bodies[index % 5000])
+        return time.perf_counter() - started
+
+    plain_time = fill(MessageStore(count, 3600))
+    gc.collect()
+    store = MessageStore(count, 3600, search_index=SearchIndex())
+    indexed_time = fill(store)
+
+    tracemalloc.start()
+    index = SearchIndex()
+    for number in range(count):
+        index.add(number, authors[number % 1000], bodies[number % 5000])
+    index_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del index
+
+    queries: dict[str, str] = {}
+    for text in SEARCH_QUERIES:
+        query = parse_query(text)
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            found = store.search(query, query.page * page_size + 1)
+        elapsed = (time.perf_counter() - started) / args.repeat
+        queries[text] = f'{elapsed * 1e3:.3f} ms ({len(found)} found)'
+    return {
+        'messages': count,
+        'append_us': round(plain_time / count * 1e6, 3),
+        'append_indexed_us': round(indexed_time / count * 1e6, 3),
+        'indexed_per_second': per_second(count, indexed_time),
+        'index_terms': len(store.search_index),
+        'index_mib': round(index_memory / 2 ** 20, 1),
+        'index_bytes_per_message': round(index_memory / count, 1),
+        'query_latency': queries,
+    }
+
+
+def bench_server(directory: str, **settings: str) -> Server:
+    """
+    Сервер (без открытия порта), файлы которого находятся в каталоге
+    directory; settings - дополнительные переменные окружения с настройками.
+    """
+    database = os.path.join(directory, 'users_database.json')
+    if not os.path.exists(database):
+        with open(database, 'w') as file:
+            file.write('[]')
+    os.environ.update({
+        'USER_DATABASE_FILENAME': database,
+        'MESSAGE_LOG_DIR': os.path.join(directory, 'message_log'),
+        'PRIVATE_SPILL_DIR': os.path.join(directory, 'private_spill'),
+        'USER_CURSORS_DIR': os.path.join(directory, 'user_cursors'),
+        **settings,
+    })
+    return Server()
+
+
+def close_server(server: Server) -> None:
+    """
+    Закрытие журнала, курсоров и пула хеширования сервера из bench_server.
+    """
+    server.message_log.close()
+    server.cursors.close()
+    server.auth.close()
+
+
+def percentiles_ms(seconds: list[float]) -> dict[str, float]:
+    """
+    Медиана, 99-й процентиль и максимум замеров в миллисекундах.
+    """
+    return {
+        'p50': round(statistics.median(seconds) * 1e3, 3),
+        'p99': round(statistics.quantiles(seconds, n=100, method='inclusive')[98] * 1e3, 3),
+        'max': round(max(seconds) * 1e3, 3),
+    }
+
+
+async def broadcast_rounds(server: Server, rounds: int, messages: int) -> dict[str, float]:
+    """
+    Процессорное время на сообщение (мкс) с метриками и без них:
+    счетчик входящих сообщений и гистограмма времени рассылки
+    включаются и отключаются поочередно по rounds раз.
+    """
+    instrumented = server.broadcast_message
+    index = server.rooms[DEFAULT_ROOM].next_index
+    timings: dict[bool, list[float]] = {True: [], False: []}
+    for _ in range(rounds):
+        for enabled in (True, False):
+            server.broadcast_message = instrumented if enabled else (
+                lambda message, room: uninstrumented_broadcast(server, message, room)
+            )
+            started = time.process_time()
+            for _ in range(messages):
+                if enabled:
+                    server.message_counts['chat'] += 1
+                await server.deliver_chat_message(
+                    DEFAULT_ROOM, index, time.time(), 'sender', f'message number {index}', None,
+                )
+                index += 1
+                # Задачи записи очередей получателей.
+                await asyncio.sleep(0)
+            timings[enabled].append((time.process_time() - started) / messages * 1e6)
+    server.broadcast_message = instrumented
+    return {
+        'instrumented_us': statistics.median(timings[True]),
+        'uninstrumented_us': statistics.median(timings[False]),
+    }
+
+
+def bench_metrics(args: argparse.Namespace) -> Report:
+    """
+    Накладные расходы метрик на пути рассылки: сохранение сообщения
+    общего чата и рассылка recipients получателям (очереди исходящих
+    сообщений с NullWriter) с метриками и без них. Сервер создается
+    в процессе бенчмарка, его файлы - во временном каталоге.
+    """
+    async def run(directory: str) -> dict[str, float]:
+        server = bench_server(directory, MAX_CHAT_MESSAGES='1000', MESSAGE_TTL='3600')
+        room = server.rooms[DEFAULT_ROOM]
+        for number in range(args.recipients):
+            room.members[f'user{number}'] = OutboundQueue(NullWriter(), 1000, 'drop_oldest')
+        try:
+            return await broadcast_rounds(server, args.rounds, args.messages)
+        finally:
+            for outbound in room.members.values():
+                outbound.close()
+            close_server(server)
+
+    with tempfile.TemporaryDirectory() as directory:
+        timings = asyncio.run(run(directory))
+    return {
+        'recipients': args.recipients,
+        'messages': args.rounds * args.messages,
+        'instrumented_us': round(timings['instrumented_us'], 3),
+        'uninstrumented_us': round(timings['uninstrumented_us'], 3),
+        'overhead_percent': round(
+            100 * (timings['instrumented_us'] / timings['uninstrumented_us'] - 1), 2,
+        ),
+    }
+
+
+async def fill_private_queues(server: Server, recipients: int, depth: int) -> float:
+    """
+    Постановка depth приватных сообщений каждому из recipients
+    отключенных получателей (журнал сбрасывается на диск после
+    каждой тысячи получателей). Возвращает затраченное время.
+    """
+    started = time.perf_counter()
+    for number in range(recipients):
+        recipient = f'user{number}'
+        for index in range(depth):
+            server.queue_private_message(
+                recipient, f'(18.10.26 10:00:00) sender: private message number {index}',
+            )
+        if number % 1000 == 999:
+            await server.message_log.flush()
+    await server.message_log.flush()
+    return time.perf_counter() - started
+
+
+def bench_private(args: argparse.Namespace) -> Report:
+    """
+    Очереди приватных сообщений: память сервера (RSS) и место на диске
+    для recipients отключенных получателей с depth сообщениями у каждого
+    (сверх лимитов очереди сообщения вытесняются на диск) и время
+    отправки накопленных сообщений при повторном подключении
+    (send_unread_messages) для reconnects из них.
+    """
+    async def run(directory: str) -> Report:
+        # Журнал без fsync и без смены сегментов: замеряются очереди,
+        # а не запись снимков состояния.
+        server = bench_server(
+            directory, MESSAGE_LOG_FSYNC='never', MESSAGE_LOG_SEGMENT_SIZE=str(2 ** 40),
+        )
+        server.message_log.open()
+        try:
+            gc.collect()
+            rss_before = server_rss(os.getpid())
+            enqueue_time = await fill_private_queues(server, args.recipients, args.depth)
+            gc.collect()
+            rss_growth = server_rss(os.getpid()) - rss_before
+            queued = args.recipients * args.depth
+            in_memory, spilled = len(server.private_messages), server.private_messages.spilled
+
+            cursors = {DEFAULT_ROOM: server.rooms[DEFAULT_ROOM].next_index - 1}
+            step = max(args.recipients // args.reconnects, 1)
+            latencies: list[float] = []
+            for number in range(0, args.recipients, step)[:args.reconnects]:
+                started = time.perf_counter()
+                await server.send_unread_messages(
+                    f'user{number}', NullWriter(), dict(cursors), None,
+                )
+                latencies.append(time.perf_counter() - started)
+            return {
+                'recipients': args.recipients,
+                'messages_per_recipient': args.depth,
+                'in_memory': in_memory,
+                'rss_growth_mib': round(rss_growth / 2 ** 20, 1),
+                'rss_bytes_per_message': round(rss_growth / queued, 1),
+                'spilled_mib': round(spilled / 2 ** 20, 1),
+                'enqueue_us': round(enqueue_time / queued * 1e6, 2),
+                'reconnects': len(latencies),
+                'reconnect_ms': percentiles_ms(latencies),
+            }
+        finally:
+            close_server(server)
+
+    with tempfile.TemporaryDirectory() as directory:
+        return asyncio.run(run(directory))
+
+
+def legacy_recipient_exists(filename: str, recipient: str) -> bool:
+    """
+    Проверка получателя до появления UserRegistry: БД пользователей
+    читается и просматривается целиком для каждого сообщения.
+    """
+    with open(filename, 'r') as file:
+        users: list[dict[str, Any]] = json.load(file)
+    return any(user['username'] == recipient for user in users)
+
+
+def bench_registry(args: argparse.Namespace) -> Report:
+    """
+    Задержка обработки приватного сообщения отключенному получателю
+    (Server.send_private_message) при users зарегистрированных
+    пользователях: messages сообщений зарегистрированным получателям
+    и столько же - незарегистрированным (проверка изменения файла БД).
+    Для сравнения - проверка получателя чтением всей БД, как до UserRegistry.
+    """
+    async def run(directory: str) -> Report:
+        database = os.path.join(directory, 'users_database.json')
+        save_users(database, [
+            {'username': f'user{number}', 'password': 'x', 'last_visit': None, 'claims': []}
+            for number in range(args.users)
+        ])
+        started = time.perf_counter()
+        server = bench_server(directory, MESSAGE_LOG_FSYNC='never')
+        load_time = time.perf_counter() - started
+        rnd = random.Random(3)
+        latencies: dict[str, list[float]] = {'registered': [], 'unregistered': []}
+        try:
+            for number in range(args.messages):
+                for kind, recipient in (
+                    ('registered', f'user{rnd.randrange(args.users)}'),
+                    ('unregistered', f'nobody{number}'),
+                ):
+                    started = time.perf_counter()
+                    await server.send_private_message(
+                        f'@{recipient} private message {number}', 'sender', NullWriter(),
+                    )
+                    latencies[kind].append(time.perf_counter() - started)
+        finally:
+            close_server(server)
+        legacy: list[float] = []
+        for _ in range(args.legacy_messages):
+            started = time.perf_counter()
+            legacy_recipient_exists(database, f'user{rnd.randrange(args.users)}')
+            legacy.append(time.perf_counter() - started)
+        return {
+            'users': args.users,
+            'registry_load_ms': round(load_time * 1e3, 1),
+            'messages': args.messages,
+            'registered_ms': percentiles_ms(latencies['registered']),
+            'unregistered_ms': percentiles_ms(latencies['unregistered']),
+            'legacy_lookup_ms': percentiles_ms(legacy),
+        }
+
+    with tempfile.TemporaryDirectory() as directory:
+        return asyncio.run(run(directory))
+
+
+class HandoverClient:
+    """
+    Клиент замера передачи порта (bench_handover): после отключения
+    сервером переподключается и запоминает номера полученных сообщений
+    вида 'h<номер клиента>-<номер сообщения>' (в том числе из истории).
+    """
+    def __init__(self, number: int, port: int) -> None:
+        """
+        Инициализация клиента.
+        """
+        self.number = number
+        self.client = Client('127.0.0.1', port, compression=())
+        self.writer: asyncio.StreamWriter | None = None
+        self.connected = asyncio.Event()
+        self.seen: set[tuple[int, int]] = set()
+        self.sent: int = 0
+        self.notices: int = 0
+        self.disconnected_at: float | None = None
+        self.reconnected_at: float | None = None
+
+    async def connect(self, command: str) -> AsyncIterator[tuple[FrameType, memoryview]]:
+        """
+        Вход (command='login') или регистрация с повтором, пока сервер
+        не примет подключение.
+        """
+        while True:
+            try:
+                frames, self.writer = await self.client.connect(
+                    command, f'hb{self.number}', LOAD_PASSWORD,
+                )
+                return frames
+            except (ConnectionError, OSError):
+                await asyncio.sleep(0.05)
+
+    async def receive(self, frames: AsyncIterator[tuple[FrameType, memoryview]]) -> None:
+        """
+        Учет полученных сообщений и уведомлений о перезапуске до отключения.
+        """
+        try:
+            async for frame_type, payload in frames:
+                if frame_type == FrameType.SERVER and b'restarting' in bytes(payload):
+                    self.notices += 1
+                for match in HANDOVER_MESSAGE.finditer(payload):
+                    self.seen.add((int(match[1]), int(match[2])))
+        except ConnectionError:
+            pass
+        self.connected.clear()
+        if self.disconnected_at is None:
+            self.disconnected_at = time.perf_counter()
+
+    async def run(self, semaphore: asyncio.Semaphore, rooms: int) -> None:
+        """
+        Регистрация, вход в комнату и переподключения после отключения.
+        """
+        async with semaphore:
+            frames = await self.connect('register')
+        self.writer.write(encode_frame(FrameType.CHAT, f'@join r{self.number % rooms}'))
+        while True:
+            self.connected.set()
+            await self.receive(frames)
+            frames = await self.connect('login')
+            self.reconnected_at = time.perf_counter()
+
+    async def send(self) -> None:
+        """
+        Одно сообщение в комнату в секунду, пока клиент подключен.
+        """
+        await asyncio.sleep(self.number % 100 / 100)
+        while True:
+            await self.connected.wait()
+            self.writer.write(encode_frame(FrameType.CHAT, f'h{self.number}-{self.sent}'))
+            self.sent += 1
+            await asyncio.sleep(1)
+
+
+def handover_deliveries(clients: list[HandoverClient], rooms: int) -> dict[str, int]:
+    """
+    Принятые сервером сообщения (вернувшиеся отправителю) и их доставка
+    остальным участникам комнаты.
+    """
+    sent = accepted = expected = missing = 0
+    for client in clients:
+        members = clients[client.number % rooms::rooms]
+        for number in range(client.sent):
+            sent += 1
+            if (client.number, number) not in client.seen:
+                continue
+            accepted += 1
+            for member in members:
+                expected += 1
+                missing += (client.number, number) not in member.seen
+    return {
+        'sent': sent,
+        'accepted': accepted,
+        'not_accepted': sent - accepted,
+        'deliveries': expected - missing,
+        'deliveries_expected': expected,
+    }
+
+
+def bench_handover(args: argparse.Namespace) -> Report:
+    """
+    Перезапуск сервера с передачей порта под нагрузкой: clients
+    подключений в комнатах по clients / rooms участников, senders
+    из них отправляют по сообщению в секунду. Через seconds секунд
+    запускается новый процесс сервера (HANDOVER_SOCKET_PATH), клиенты,
+    отключенные прежним, переподключаются. Отчет: время до завершения
+    прежнего процесса и до переподключения всех клиентов, время
+    без связи у клиента, потерянные принятые сообщения. Сообщения,
+    не прочитанные прежним процессом до отключения клиента
+    (not_accepted), подтверждением не считаются.
+    """
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    os.environ.setdefault('MESSAGE_TTL', '600')
+    os.environ.setdefault('MAX_ROOMS', str(args.rooms + 1))
+
+    async def run(directory: str) -> Report:
+        old = spawn_server('127.0.0.1', args.port, directory, handover=True)
+        new: subprocess.Popen[bytes] | None = None
+        clients = [HandoverClient(number, args.port) for number in range(args.clients)]
+        tasks: list[asyncio.Task[None]] = []
+        try:
+            await wait_for_port('127.0.0.1', args.port, 30)
+            semaphore = asyncio.Semaphore(200)
+            tasks += [asyncio.create_task(client.run(semaphore, args.rooms)) for client in clients]
+            await asyncio.gather(*(client.connected.wait() for client in clients))
+            tasks += [asyncio.create_task(client.send()) for client in clients[:args.senders]]
+            await asyncio.sleep(args.seconds)
+
+            started = time.perf_counter()
+            new = spawn_server('127.0.0.1', args.port, directory, handover=True)
+            await asyncio.to_thread(old.wait)
+            old_exited = time.perf_counter() - started
+            while not all(client.reconnected_at for client in clients):
+                await asyncio.sleep(0.01)
+            all_back = time.perf_counter() - started
+            await asyncio.sleep(args.seconds)
+            for task in tasks:
+                task.cancel()
+            await asyncio.sleep(2)
+        finally:
+            for task in tasks:
+                task.cancel()
+            for process in (old, new):
+                if process is not None and process.poll() is None:
+                    process.terminate()
+                    process.wait()
+        downtime = [client.reconnected_at - client.disconnected_at for client in clients]
+        return {
+            'clients': args.clients,
+            'old_process_exited_s': round(old_exited, 2),
+            'first_client_back_s': round(
+                min(client.reconnected_at for client in clients) - started, 2,
+            ),
+            'all_clients_back_s': round(all_back, 2),
+            'client_downtime_ms': percentiles_ms(downtime),
+            'restart_notices': sum(bool(client.notices) for client in clients),
+            'messages': handover_deliveries(clients, args.rooms),
+        }
+
+    with tempfile.TemporaryDirectory() as directory:
+        return asyncio.run(run(directory))
+
+
+def bench_scheduler(args: argparse.Namespace) -> Report:
+    """
+    Планировщик с timers отложенными вызовами, сроки которых равномерно
+    распределены по span секундам: время постановки и отмены таймера,
+    опоздание срабатывания и процессорное время цикла событий, пока
+    таймеры срабатывают и пока они только ожидают (сроки через час),
+    в сравнении с прежней проверкой всех сроков по таймеру.
+    """
+    async def run() -> Report:
+        scheduler = Scheduler()
+        scheduler.start()
+        lateness: list[float] = []
+
+        def fired(deadline: float) -> None:
+            lateness.append(time.monotonic() - deadline)
+
+        cancelled = [
+            scheduler.call_later(3600 + number * 1e-4, fired, 0.0)
+            for number in range(args.timers)
+        ]
+        started = time.perf_counter()
+        for timer in cancelled:
+            scheduler.cancel(timer)
+        cancel_time = time.perf_counter() - started
+        # Срок первого таймера - после постановки всех таймеров.
+        rnd = random.Random(7)
+        start = time.monotonic() + 2.0
+        deadlines = [start + rnd.random() * args.span for _ in range(args.timers)]
+        started = time.perf_counter()
+        for deadline in deadlines:
+            scheduler.call_at(deadline, fired, deadline)
+        schedule_time = time.perf_counter() - started
+
+        cpu = time.process_time()
+        await asyncio.sleep(start + args.span + 2 * scheduler.resolution - time.monotonic())
+        firing_cpu = time.process_time() - cpu
+        for deadline in deadlines:
+            scheduler.call_at(deadline + 3600, fired, deadline)
+        cpu = time.process_time()
+        await asyncio.sleep(args.idle)
+        idle_cpu = time.process_time() - cpu
+        scheduler.stop()
+
+        # Прежняя проверка банов: просмотр всех сроков по таймеру.
+        bans = {f'user{number}': time.time() + 3600 for number in range(args.timers)}
+        started = time.perf_counter()
+        for user in bans:
+            if datetime.datetime.now().timestamp() > bans[user]:
+                pass
+        return {
+            'timers': args.timers,
+            'fired': len(lateness),
+            'schedule_ns': round(schedule_time / args.timers * 1e9),
+            'cancel_ns': round(cancel_time / args.timers * 1e9),
+            'lateness_ms': percentiles_ms(lateness),
+            'firing_cpu_percent': round(100 * firing_cpu / args.span, 1),
+            'firing_cpu_ns_per_timer': round(firing_cpu / args.timers * 1e9),
+            'idle_cpu_percent': round(100 * idle_cpu / args.idle, 2),
+            'legacy_scan_ms': round((time.perf_counter() - started) * 1e3, 1),
+        }
+
+    return asyncio.run(run())
+
+
+class ByteWriter:
+    """
+    Соединение клиента, которое сохраняет отправленные данные.
+    """
+    def __init__(self) -> None:
+        self.chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> None:
+        self.chunks.append(data)
+
+    async def drain(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def client_decode_time(data: bytes, decompressor: FrameDecompressor | None) -> float:
+    """
+    Процессорное время клиента на разбор полученных данных
+    (с распаковкой и декодированием текста из UTF-8).
+    """
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    started = time.process_time()
+    frames = read_frames(reader, FrameDecoder())
+    if decompressor is not None:
+        frames = decompressor.frames(frames)
+    async for _, payload in frames:
+        str(payload, 'utf-8')
+    return time.process_time() - started
+
+
+async def compression_costs(
+    server: Server,
+    algorithm: CompressionAlgorithm | None,
+    args: argparse.Namespace,
+    live: list[list[bytes]],
+) -> Report:
+    """
+    Байты и процессорное время сервера и клиента при подключении
+    (история комнаты и приватные сообщения) и на сообщение живого трафика
+    (пачки live, сжимаемые в контексте последнего подключения).
+    """
+    counts = {'raw': 0, 'compressed': 0}
+    writer = ByteWriter()
+    sent = server_time = client_time = 0.0
+    compressor: FrameCompressor | None = None
+    decompressor: FrameDecompressor | None = None
+    for number in range(args.reconnects):
+        for index in range(args.private):
+            server.queue_private_message(
+                'reader', f'(18.10.26 10:00:00) user{index}: private message {number} {index}',
+            )
+        if algorithm is not None:
+            compressor = FrameCompressor(
+                algorithm, server.compression_level, server.compression_threshold,
+                server.compression_window_bits, counts,
+            )
+            decompressor = FrameDecompressor(algorithm, MAX_FRAME_SIZE)
+        started = time.process_time()
+        await server.send_unread_messages('reader', writer, {DEFAULT_ROOM: None}, compressor)
+        server_time += time.process_time() - started
+        data = writer.take()
+        sent += len(data)
+        client_time += await client_decode_time(data, decompressor)
+
+    started = time.process_time()
+    batches = [b''.join(batch) for batch in live]
+    if compressor is not None:
+        batches = [compressor.pack(batch) for batch in batches]
+    live_server_time = time.process_time() - started
+    live_client_time = sum([
+        await client_decode_time(batch, decompressor) for batch in batches
+    ])
+    messages = sum(map(len, live))
+    return {
+        'bytes_per_reconnect': round(sent / args.reconnects),
+        'server_us_per_reconnect': round(server_time / args.reconnects * 1e6, 1),
+        'client_us_per_reconnect': round(client_time / args.reconnects * 1e6, 1),
+        'live_bytes_per_message': round(sum(map(len, batches)) / messages, 1),
+        'live_server_us_per_message': round(live_server_time / messages * 1e6, 2),
+        'live_client_us_per_message': round(live_client_time / messages * 1e6, 2),
+    }
+
+
+def bench_compression(args: argparse.Namespace) -> Report:
+    """
+    Сжатие трафика клиентов ('plain' - без сжатия, 'zlib', 'zlib-stream'):
+    байты и процессорное время сервера и клиента на подключение,
+    при котором отправляются history сообщений комнаты и private приватных
+    сообщений, и на сообщение живого трафика пачками по live_batch
+    сообщений. Настройки сжатия берутся из окружения (как у сервера).
+    """
+    bodies = random_bodies(args.history + args.live_messages, 5000)
+    live = [
+        encode_frame(FrameType.CHAT, SAMPLE_MESSAGE.format(index).replace(
+            'the quick brown fox jumps over the lazy dog', body,
+        ))
+        for index, body in enumerate(bodies[args.history:])
+    ]
+    live_batches = [
+        live[start:start + args.live_batch] for start in range(0, len(live), args.live_batch)
+    ]
+
+    async def run(directory: str) -> Report:
+        server = bench_server(directory, MAX_CHAT_MESSAGES=str(args.history))
+        server.message_log.open()
+        try:
+            for index, body in enumerate(bodies[:args.history]):
+                await server.add_chat_message(DEFAULT_ROOM, f'user{index % 50}', body)
+            report: Report = {
+                'history_messages': args.history,
+                'private_messages': args.private,
+                'reconnects': args.reconnects,
+                'live_batch': args.live_batch,
+            }
+            for algorithm in (None, 'zlib', 'zlib-stream'):
+                report[algorithm or 'plain'] = await compression_costs(
+                    server, algorithm, args, live_batches,
+                )
+            return report
+        finally:
+            close_server(server)
+
+    with tempfile.TemporaryDirectory() as directory:
+        return asyncio.run(run(directory))
+
+
+async def stream_messages(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    rate: int,
+    seconds: float,
+    finished: asyncio.Future[float],
+) -> None:
+    """
+    Сервер для bench_client: принимает вход клиента и отправляет
+    ему rate сообщений чата в секунду (пачками раз в 10 мс)
+    в течение seconds секунд.
+    """
+    await anext(read_frames(reader, FrameDecoder()), None)
+    writer.write(encode_frame(FrameType.AUTH, 'OK'))
+    await asyncio.sleep(1)
+    batch, total = max(rate // 100, 1), int(rate * seconds)
+    sent: int = 0
+    started = time.monotonic()
+    while sent < total:
+        writer.write(b''.join(
+            encode_frame(FrameType.CHAT, SAMPLE_MESSAGE.format(sent + number))
+            for number in range(batch)
+        ))
+        sent += batch
+        await writer.drain()
+        await asyncio.sleep(max(started + sent / rate - time.monotonic(), 0))
+    finished.set_result(time.monotonic() - started)
+
+
+async def measure_client(rate: int, seconds: float, headless: bool) -> Report:
+    """
+    Процессорное время client.py, получающего rate сообщений в секунду.
+    Клиент выводит сообщения в псевдотерминал (или, в режиме headless,
+    в канал), вывод читается и отбрасывается.
+    """
+    loop = asyncio.get_running_loop()
+    finished: asyncio.Future[float] = loop.create_future()
+    server = await asyncio.start_server(
+        lambda reader, writer: stream_messages(reader, writer, rate, seconds, finished),
+        '127.0.0.1',
+        0,
+    )
+    port = server.sockets[0].getsockname()[1]
+    command = [
+        sys.executable, os.path.join(os.path.dirname(__file__) or '.', 'client.py'),
+        '--port', str(port), '--no-compression',
+    ]
+    if headless:
+        command.append('--headless')
+        output, terminal = os.pipe()
+    else:
+        output, terminal = pty.openpty()
+    client = subprocess.Popen(
+        command, stdin=subprocess.PIPE, stdout=terminal, stderr=subprocess.DEVNULL,
+    )
+    os.close(terminal)
+    shown: list[int] = [0]
+
+    def read_output() -> None:
+        try:
+            data = os.read(output, READ_CHUNK_SIZE)
+        except OSError:
+            data = b''
+        if not data:
+            loop.remove_reader(output)
+        shown[0] += data.count(b'\n')
+
+    loop.add_reader(output, read_output)
+    try:
+        client.stdin.write(b'bench password\n')
+        client.stdin.flush()
+        await asyncio.sleep(0.5)
+        # server_cpu() суммирует время любого процесса и его потомков.
+        cpu_time = -server_cpu(client.pid)
+        duration = await finished
+        await asyncio.sleep(0.5)
+        cpu_time += server_cpu(client.pid)
+    finally:
+        loop.remove_reader(output)
+        client.kill()
+        client.wait()
+        os.close(output)
+        server.close()
+    return {
+        'mode': 'headless (pipe)' if headless else 'terminal (pty)',
+        'messages': int(rate * seconds),
+        'lines_shown': shown[0],
+        'messages_per_second': per_second(int(rate * seconds), duration),
+        'client_cpu_percent': round(100 * cpu_time / duration, 1),
+        'client_cpu_us_per_message': round(cpu_time / (rate * seconds) * 1e6, 2),
+    }
+
+
+def bench_client(args: argparse.Namespace) -> Report:
+    """
+    Нагрузка на клиент при потоке входящих сообщений (см. measure_client).
+    """
+    return asyncio.run(measure_client(args.rate, args.seconds, args.headless))
+
+
+def add_benchmark(
+    commands: Any,
+    function: Callable[[argparse.Namespace], Report],
+    description: str,
+) -> argparse.ArgumentParser:
+    """
+    Подкоманда запуска бенчмарка function (имя - без префикса 'bench_').
+    """
+    command = commands.add_parser(function.__name__.removeprefix('bench_'), help=description)
+    command.set_defaults(run=function)
+    return command
+
+
+def main() -> None:
+    """
+    Запуск микробенчмарков из командной строки.
+    """
+    parser = argparse.ArgumentParser(description='Chat server micro-benchmarks.')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    commands = parser.add_subparsers(required=True)
+    framing = add_benchmark(commands, bench_framing, 'frame encoding and decoding throughput')
+    framing.add_argument('--messages', type=int, default=1_000_000)
+    store = add_benchmark(commands, bench_store, 'message store append, lookup and expiry')
+    store.add_argument('--messages', type=int, default=1_000_000)
+    messages = add_benchmark(
+        commands, bench_messages, 'memory and broadcast cost of the message representation',
+    )
+    messages.add_argument('--messages', type=int, default=1_000_000)
+    messages.add_argument('--recipients', type=int, default=100)
+    metrics = add_benchmark(commands, bench_metrics, 'overhead of metrics on the broadcast path')
+    metrics.add_argument('--recipients', type=int, default=100)
+    metrics.add_argument('--messages', type=int, default=2000, help='messages per round')
+    metrics.add_argument('--rounds', type=int, default=10)
+    client = add_benchmark(commands, bench_client, 'client CPU usage under incoming messages')
+    client.add_argument('--rate', type=int, default=5000, help='incoming messages per second')
+    client.add_argument('--seconds', type=float, default=10.0)
+    client.add_argument('--headless', action='store_true', help='run client.py --headless')
+    log = add_benchmark(commands, bench_log, 'message log write throughput and recovery time')
+    log.add_argument('--messages', type=int, default=10_000_000)
+    log.add_argument('--batch', type=int, default=1000, help='records per flush')
+    log.add_argument('--segment-size', type=int, default=8 * 1024 * 1024)
+    log.add_argument('--history', type=int, default=100, help='messages in each snapshot')
+    log.add_argument('--fsync', choices=('always', 'interval', 'never'), default='interval')
+    handover = add_benchmark(
+        commands, bench_handover, 'restart with socket handover under load',
+    )
+    handover.add_argument('--clients', type=int, default=5000)
+    handover.add_argument('--senders', type=int, default=1000,
+                          help='clients sending one message per second')
+    handover.add_argument('--rooms', type=int, default=1000)
+    handover.add_argument('--seconds', type=float, default=5.0,
+                          help='load before and after the restart')
+    handover.add_argument('--port', type=int, default=8150)
+    compression = add_benchmark(
+        commands, bench_compression, 'bytes and CPU of plain, zlib and zlib-stream traffic',
+    )
+    compression.add_argument('--history', type=int, default=100,
+                             help='room messages sent on each reconnect')
+    compression.add_argument('--private', type=int, default=10,
+                             help='private messages sent on each reconnect')
+    compression.add_argument('--reconnects', type=int, default=1000)
+    compression.add_argument('--live-messages', type=int, default=100_000)
+    compression.add_argument('--live-batch', type=int, default=10,
+                             help='live messages written to the client at once')
+    scheduler = add_benchmark(
+        commands, bench_scheduler, 'timer scheduling cost and firing accuracy',
+    )
+    scheduler.add_argument('--timers', type=int, default=1_000_000)
+    scheduler.add_argument('--span', type=float, default=10.0,
+                           help='seconds over which the deadlines are spread')
+    scheduler.add_argument('--idle', type=float, default=5.0,
+                           help='seconds of waiting with far deadlines pending')
+    private = add_benchmark(
+        commands, bench_private, 'offline private queues: memory and reconnect delivery',
+    )
+    private.add_argument('--recipients', type=int, default=100_000)
+    private.add_argument('--depth', type=int, default=50, help='messages per recipient')
+    private.add_argument('--reconnects', type=int, default=1000)
+    registry = add_benchmark(
+        commands, bench_registry, 'private message latency with many registered users',
+    )
+    registry.add_argument('--users', type=int, default=100_000)
+    registry.add_argument('--messages', type=int, default=2000)
+    registry.add_argument('--legacy-messages', type=int, default=20,
+                          help='lookups by reading the whole database')
+    search = add_benchmark(commands, bench_search, 'search indexing, memory and query latency')
+    search.add_argument('--messages', type=int, default=1_000_000)
+    search.add_argument('--page-size', type=int, default=10)
+    search.add_argument('--repeat', type=int, default=20, help='runs of each query')
+    args = parser.parse_args()
+
+    report = args.run(args)
+    if args.json:
+        print(json.dumps(report, indent=4))
+        return
+    for key, value in report.items():
+        print(f'{key:>26}: {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable
+
+from framing import FrameDecoder, FrameType, encode_frame, read_frames
+from outbound import OutboundQueue
+
+logger = logging.getLogger(__name__)
+
+BUS_QUEUE_SIZE: int = 10000
+
+
+def encode_event(event: dict[str, Any]) -> bytes:
+    """
+    Кодирование события шины в кадр.
+    """
+    return encode_frame(
+        FrameType.BUS, json.dumps(event, ensure_ascii=False, separators=(',', ':')),
+    )
+
+
+class MessageBus:
+    """
+    Шина событий между рабочими процессами сервера (Unix-сокет).
+    Работает в процессе-запускателе: пересылает события от одного
+    процесса остальным и назначает сквозные номера сообщениям
+    каждой комнаты, чтобы у всех процессов был один порядок сообщений.
+    """
+    def __init__(self, path: str, workers: int) -> None:
+        """
+        Инициализация шины.
+        workers - количество рабочих процессов, которых нужно дождаться
+        перед началом работы.
+        """
+        self.path = path
+        self.workers = workers
+        self.queues: dict[int, OutboundQueue] = {}
+        self.room_indexes: dict[str, int] = {}
+        # Номер первого сообщения комнат, неизвестных шине (комнаты,
+        # удаленные рабочими процессами до перезапуска, см. Server.reclaim_room).
+        self.room_index_floor: int = 0
+
+    async def worker_connected(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """
+        Обработка событий от рабочего процесса.
+        """
+        worker_id: int | None = None
+        try:
+            async for _, payload in read_frames(reader, FrameDecoder()):
+                event: dict[str, Any] = json.loads(bytes(payload))
+                if event['type'] == 'hello':
+                    worker_id = event['worker']
+                    await self.worker_hello(worker_id, event, writer)
+                    continue
+                if event['type'] == 'chat':
+                    event['index'] = self.room_indexes.get(event['room'], self.room_index_floor)
+                    self.room_indexes[event['room']] = event['index'] + 1
+                data = encode_event(event)
+                for target_id, queue in list(self.queues.items()):
+                    if target_id != worker_id or event['type'] == 'chat':
+                        await queue.put(data)
+        finally:
+            logger.info(f'---Worker {worker_id} left the bus---')
+            if worker_id is not None:
+                self.queues.pop(worker_id).close()
+            else:
+                writer.close()
+
+    async def worker_hello(
+        self,
+        worker_id: int,
+        event: dict[str, Any],
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """
+        Регистрация рабочего процесса: учет номеров сообщений его комнат
+        и сообщение о готовности, когда подключились все процессы
+        (процессу, перезапущенному позже, - сразу).
+        """
+        self.queues[worker_id] = OutboundQueue(writer, BUS_QUEUE_SIZE, 'backpressure')
+        for room, next_index in event['room_indexes'].items():
+            self.room_indexes[room] = max(self.room_indexes.get(room, 0), next_index)
+        self.room_index_floor = max(self.room_index_floor, event.get('room_index_floor', 0))
+        if len(self.queues) == self.workers:
+            for queue in self.queues.values():
+                await queue.put(encode_event({'type': 'ready'}))
+        elif len(self.queues) > self.workers:
+            await self.queues[worker_id].put(encode_event({'type': 'ready'}))
+
+    async def serve(self) -> None:
+        """
+        Запуск шины.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        server = await asyncio.start_unix_server(self.worker_connected, self.path)
+        async with server:
+            await server.serve_forever()
+
+
+class BusClient:
+    """
+    Подключение рабочего процесса к шине событий.
+    """
+    def __init__(
+        self,
+        path: str,
+        worker_id: int,
+        handler: Callable[[dict[str, Any]], Awaitable[None]],
+    ) -> None:
+        """
+        Инициализация подключения.
+        handler - обработчик событий, полученных от других процессов.
+        """
+        self.path = path
+        self.worker_id = worker_id
+        self.handler = handler
+
+    async def connect(self, room_indexes: dict[str, int], room_index_floor: int) -> None:
+        """
+        Подключение к шине и ожидание готовности всех рабочих процессов.
+        room_indexes - номера следующих сообщений комнат,
+        room_index_floor - номер первого сообщения новых комнат.
+        """
+        while True:
+            try:
+                reader, self.writer = await asyncio.open_unix_connection(self.path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(0.1)
+        self.frames = read_frames(reader, FrameDecoder())
+        self.publish({
+            'type': 'hello',
+            'worker': self.worker_id,
+            'room_indexes': room_indexes,
+            'room_index_floor': room_index_floor,
+        })
+        async for _, payload in self.frames:
+            if json.loads(bytes(payload))['type'] == 'ready':
+                break
+
+    def publish(self, event: dict[str, Any]) -> None:
+        """
+        Отправка события остальным рабочим процессам.
+        """
+        self.writer.write(encode_event(event))
+
+    async def listen(self) -> None:
+        """
+        Обработка событий, полученных от шины.
+        """
+        async for _, payload in self.frames:
+            await self.handler(json.loads(bytes(payload)))
+        raise ConnectionError('message bus closed the connection')
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Literal, cast
+
+from framing import FrameDecoder, FrameType
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+logger = logging.getLogger(__name__)
+
+ServerBackend = Literal['streams', 'protocol']
+# Объем полученных, но еще не разобранных данных, после которого
+# чтение из сокета приостанавливается.
+READ_BUFFER_LIMIT: int = 256 * 1024
+
+
+def install_uvloop() -> bool:
+    """
+    Использование цикла событий uvloop, если он установлен.
+    Возвращает False, если используется стандартный цикл asyncio.
+    """
+    if uvloop is None:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+class ProtocolWriter:
+    """
+    Запись в транспорт с тем же интерфейсом, что у StreamWriter
+    (write, drain, close, get_extra_info), поэтому обработчики команд
+    не зависят от выбранной реализации сервера.
+    Записи копятся в буфере и передаются транспорту одной записью
+    в drain(); drain() ждет, только если транспорт приостановил
+    запись (его буфер выше верхней отметки).
+    """
+    def __init__(self, transport: asyncio.Transport) -> None:
+        """
+        Инициализация записи в транспорт.
+        """
+        self.transport = transport
+        self.buffer: list[bytes] = []
+        self.paused: bool = False
+        self.lost: bool = False
+        self.waiter: asyncio.Future[None] | None = None
+
+    def write(self, data: bytes) -> None:
+        """
+        Добавление данных в буфер.
+        """
+        self.buffer.append(data)
+
+    def flush(self) -> None:
+        """
+        Передача накопленных данных транспорту.
+        """
+        if self.buffer:
+            data = self.buffer[0] if len(self.buffer) == 1 else b''.join(self.buffer)
+            self.buffer.clear()
+            if not self.lost:
+                self.transport.write(data)
+
+    async def drain(self) -> None:
+        """
+        Отправка буфера и ожидание, пока транспорт не опустошит
+        свой буфер до нижней отметки (если он выше верхней).
+        """
+        self.flush()
+        if self.lost:
+            raise ConnectionResetError('Connection lost')
+        if self.paused:
+            if self.waiter is None:
+                self.waiter = asyncio.get_running_loop().create_future()
+            await self.waiter
+
+    def close(self) -> None:
+        """
+        Отправка буфера и закрытие соединения.
+        """
+        self.flush()
+        self.transport.close()
+
+    def is_closing(self) -> bool:
+        return self.transport.is_closing()
+
+    def get_extra_info(self, name: str, default: Any = None) -> Any:
+        return self.transport.get_extra_info(name, default)
+
+    def pause_writing(self) -> None:
+        self.paused = True
+
+    def resume_writing(self) -> None:
+        """
+        Буфер транспорта опустился до нижней отметки.
+        """
+        self.paused = False
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+        self.waiter = None
+
+    def connection_lost(self) -> None:
+        """
+        Соединение закрыто: ожидающие drain() получают ошибку.
+        """
+        self.lost = True
+        self.buffer.clear()
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_exception(ConnectionResetError('Connection lost'))
+        self.waiter = None
+
+
+class ChatProtocol(asyncio.Protocol):
+    """
+    Подключение клиента на основе asyncio.Protocol (без StreamReader
+    и StreamWriter). Полученные данные копятся до запроса следующих
+    кадров обработчиком и разбираются тем же FrameDecoder, что и в
+    read_frames(); запись выполняется через ProtocolWriter с отметками
+    буфера записи high_water и low_water.
+    """
+    def __init__(
+        self,
+        handler: Callable[[AsyncIterator[tuple[FrameType, memoryview]], Any], Awaitable[None]],
+        max_frame_size: int,
+        high_water: int,
+        low_water: int,
+    ) -> None:
+        """
+        Инициализация подключения.
+        handler(frames, writer) - обработчик клиента, как для asyncio.start_server.
+        """
+        self.handler = handler
+        self.decoder = FrameDecoder(max_frame_size)
+        self.high_water = high_water
+        self.low_water = low_water
+        self.chunks: list[bytes] = []
+        self.pending: int = 0
+        self.reading_paused: bool = False
+        self.eof: bool = False
+        self.waiter: asyncio.Future[None] | None = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        """
+        Запуск обработчика клиента.
+        """
+        # Транспорты uvloop не наследуют asyncio.Transport, но реализуют его методы.
+        self.transport = cast(asyncio.Transport, transport)
+        self.transport.set_write_buffer_limits(self.high_water, self.low_water)
+        self.writer = ProtocolWriter(self.transport)
+        self.task = asyncio.get_running_loop().create_task(
+            self.handler(self.frames(), self.writer)
+        )
+        self.task.add_done_callback(self.handler_done)
+
+    def handler_done(self, task: asyncio.Task[None]) -> None:
+        """
+        Закрытие соединения после завершения обработчика.
+        """
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Unhandled exception in client handler', exc_info=task.exception())
+        self.writer.close()
+
+    def data_received(self, data: bytes) -> None:
+        self.chunks.append(data)
+        self.pending += len(data)
+        if self.pending > READ_BUFFER_LIMIT and not self.reading_paused:
+            self.reading_paused = True
+            self.transport.pause_reading()
+        self.wake()
+
+    def eof_received(self) -> bool:
+        """
+        Клиент закончил передачу: соединение остается открытым,
+        пока обработчик не ответит на уже полученные кадры.
+        """
+        self.eof = True
+        self.wake()
+        return True
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self.eof = True
+        self.wake()
+        self.writer.connection_lost()
+
+    def pause_writing(self) -> None:
+        self.writer.pause_writing()
+
+    def resume_writing(self) -> None:
+        self.writer.resume_writing()
+
+    def wake(self) -> None:
+        """
+        Пробуждение обработчика, ожидающего данных.
+        """
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+        self.waiter = None
+
+    async def frames(self) -> AsyncIterator[tuple[FrameType, memoryview]]:
+        """
+        Кадры от клиента до закрытия соединения. Новые данные
+        передаются декодеру, только когда обработчик запросил
+        следующий кадр, поэтому нагрузка предыдущего кадра
+        (memoryview буфера декодера) остается действительной.
+        """
+        decoder = self.decoder
+        while True:
+            if not self.chunks:
+                if self.eof:
+                    return
+                # Ответы, записанные без drain(), отправляются перед ожиданием.
+                self.writer.flush()
+                self.waiter = asyncio.get_running_loop().create_future()
+                await self.waiter
+                continue
+            data = self.chunks[0] if len(self.chunks) == 1 else b''.join(self.chunks)
+            self.chunks.clear()
+            self.pending = 0
+            if self.reading_paused:
+                self.reading_paused = False
+                self.transport.resume_reading()
+            decoder.feed(data)
+            for frame in decoder.frames():
+                yield frame
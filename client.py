@@ -1,12 +1,22 @@
+import argparse
 import asyncio
-import datetime
-import json
 import os
 import sys
+from collections import deque
 from dataclasses import dataclass
-from typing import Any
+from typing import AsyncIterator, TextIO
 
-from server import load_user_database
+from compression import (
+    COMPRESS_OPTION,
+    COMPRESSION_ALGORITHMS,
+    CompressionAlgorithm,
+    FrameDecompressor,
+)
+from framing import MAX_FRAME_SIZE, FrameDecoder, FrameType, encode_frame, read_frames
+
+# Минимальный интервал между выводами входящих сообщений на экран (секунды).
+RENDER_INTERVAL: float = 1 / 60
+STDIN_CHUNK_SIZE: int = 64 * 1024
 
 
 @dataclass
@@ -25,101 +35,261 @@ def clear_console() -> None:
     os.system('cls' if os.name == 'nt' else 'clear')
 
 
+class StdinReader:
+    """
+    Чтение строк stdin без блокировки цикла событий.
+    Данные читаются, когда дескриптор готов к чтению (add_reader);
+    если цикл событий не может следить за stdin (обычный файл,
+    Windows), строки читаются в пуле потоков.
+    """
+    def __init__(self, stdin: TextIO = sys.stdin) -> None:
+        """
+        Инициализация чтения stdin.
+        """
+        self.stdin = stdin
+        self.loop = asyncio.get_running_loop()
+        self.lines: deque[str] = deque()
+        self.partial: bytes = b''
+        self.eof: bool = False
+        self.waiter: asyncio.Future[None] | None = None
+        self.fd: int | None = stdin.fileno()
+        try:
+            self.loop.add_reader(self.fd, self.read_ready)
+        except (NotImplementedError, PermissionError):
+            self.fd = None
+
+    def read_ready(self) -> None:
+        """
+        Чтение доступных данных и разбиение их на строки.
+        """
+        try:
+            data = os.read(self.fd, STDIN_CHUNK_SIZE)
+        except BlockingIOError:
+            return
+        if not data:
+            self.eof = True
+            if self.partial:
+                self.lines.append(str(self.partial, 'utf-8', 'replace'))
+            self.close()
+        else:
+            *lines, self.partial = (self.partial + data).split(b'\n')
+            self.lines.extend(str(line, 'utf-8', 'replace').rstrip('\r') for line in lines)
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def readline(self) -> str | None:
+        """
+        Следующая строка без перевода строки (None в конце ввода).
+        """
+        if self.fd is None and not self.lines and not self.eof:
+            line = await self.loop.run_in_executor(None, self.stdin.readline)
+            if not line:
+                self.eof = True
+                return None
+            return line.rstrip('\r\n')
+        while not self.lines:
+            if self.eof:
+                return None
+            self.waiter = self.loop.create_future()
+            await self.waiter
+        return self.lines.popleft()
+
+    def close(self) -> None:
+        """
+        Прекращение слежения за stdin.
+        """
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            self.fd = None
+
+
+class Renderer:
+    """
+    Вывод входящих сообщений пачками: строки копятся и выводятся
+    одной записью не чаще раза в interval секунд, после пачки
+    выводится приглашение к вводу.
+    """
+    def __init__(self, stdout: TextIO, prompt: str, interval: float = RENDER_INTERVAL) -> None:
+        """
+        Инициализация вывода.
+        """
+        self.stdout = stdout
+        self.prompt = prompt
+        self.interval = interval
+        self.pending: list[str] = []
+        self.flushed_at: float = 0.0
+        self.handle: asyncio.TimerHandle | None = None
+
+    def add(self, text: str) -> None:
+        """
+        Добавление строки к следующей пачке.
+        """
+        self.pending.append(text)
+        if self.handle is None:
+            self.handle = asyncio.get_running_loop().call_at(
+                self.flushed_at + self.interval, self.flush,
+            )
+
+    def flush(self) -> None:
+        """
+        Вывод накопленных строк и приглашения к вводу.
+        """
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        self.flushed_at = asyncio.get_running_loop().time()
+        if self.pending:
+            self.pending.append(self.prompt)
+            self.stdout.write(''.join(self.pending))
+            self.stdout.flush()
+            self.pending.clear()
+
+    def write(self, text: str) -> None:
+        """
+        Немедленный вывод текста (после накопленных строк).
+        """
+        self.flush()
+        self.stdout.write(text)
+        self.stdout.flush()
+
+
 class Client:
-    def __init__(self, server_host: str, server_port: int):
+    def __init__(
+        self,
+        server_host: str,
+        server_port: int,
+        headless: bool = False,
+        compression: tuple[CompressionAlgorithm, ...] = COMPRESSION_ALGORITHMS,
+    ):
         """
         Инициализация объекта класса Клиент.
+        headless - режим для сценариев и каналов: без цветов, приглашений
+        и очистки экрана, ввод завершается концом stdin.
+        compression - алгоритмы сжатия, предлагаемые серверу (пустой - без сжатия).
         """
         self.server_host: str = server_host
         self.server_port: int = server_port
-        self.colors: TerminalColors = TerminalColors()
-        self.COMMAND_PROMPT: str = self.colors.YELLOW + '>>> ' + self.colors.RESET
+        self.headless: bool = headless
+        self.compression = compression
+        # Декодер кадров последнего подключения (считает полученные байты).
+        self.decoder: FrameDecoder | None = None
+        self.colors: TerminalColors = TerminalColors(*([''] * 5) if headless else ())
+        self.COMMAND_PROMPT: str = (
+            '' if headless else self.colors.YELLOW + '>>> ' + self.colors.RESET
+        )
+        self.line_start: str = '' if headless else '\r'
+        line_start = self.line_start
+        self.message_prefixes: dict[FrameType, str] = {
+            FrameType.PRIVATE: self.colors.YELLOW + line_start + '--PRIVATE-- ',
+            FrameType.HELP: self.colors.RED + line_start + '-- ',
+            FrameType.SERVER: self.colors.YELLOW + line_start + '--SERVER-- ',
+            FrameType.HISTORY: self.colors.BLUE + line_start + '--HISTORY-- ',
+            FrameType.CHAT: self.colors.GREEN + line_start,
+        }
+        self.message_suffix: str = self.colors.RESET + '\n'
 
-    async def send_message(self, writer: asyncio.StreamWriter) -> None:
+    async def send_message(
+        self,
+        writer: asyncio.StreamWriter,
+        stdin: StdinReader,
+        renderer: Renderer,
+    ) -> None:
         """
-        Отправка сообщения.
+        Отправка сообщений, введенных пользователем. После @exit
+        или в конце ввода сервер получает EOF и закрывает соединение,
+        ответив на все отправленные команды.
         """
         while True:
-            message: str = await self.get_user_input(self.COMMAND_PROMPT)
-            writer.write((message).encode())
+            message: str | None = await stdin.readline()
+            if message is None:
+                break
+            writer.write(encode_frame(FrameType.CHAT, message))
             await writer.drain()
 
             if message == '@exit':
-                sys.stdout.write(self.colors.RED + '\r-- Bye! --\n' + self.colors.RESET)
+                renderer.write(
+                    self.colors.RED + self.line_start + '-- Bye! --\n' + self.colors.RESET
+                )
                 break
-        writer.close()
+            renderer.write(self.COMMAND_PROMPT)
+        if writer.can_write_eof():
+            writer.write_eof()
+        else:
+            writer.close()
 
-    async def handle_message(self, reader: asyncio.StreamReader) -> None:
+    async def handle_message(
+        self,
+        frames: AsyncIterator[tuple[FrameType, memoryview]],
+        renderer: Renderer,
+    ) -> None:
         """
         Обработка входящих сообщений.
         """
-        sys.stdout.write(
-            self.colors.RED
-            + '\r-- Welcome to Chat! -> use @help to see instructions.\n'
-            + self.colors.RESET
-        )
-        sys.stdout.flush()
-        while True:
-            data: bytes = await reader.readline()
-            if not data:
-                break
-            message: str = data.decode().strip()
-            if message.startswith('Private!'):
-                if message.removeprefix("Private!").strip() != "":
-                    sys.stdout.write(
-                        self.colors.YELLOW
-                        + f'\r--PRIVATE-- {message.removeprefix("Private!")}\n'
-                        + self.COMMAND_PROMPT
-                    )
-            elif message.startswith('help!'):
-                if message.removeprefix("help!").strip() != "":
-                    sys.stdout.write(
-                        self.colors.RED
-                        + f'\r-- {message.removeprefix("help!")}\n'
-                        + self.COMMAND_PROMPT
-                    )
-            elif message.startswith('Server!'):
-                if message.removeprefix("Server!").strip() != "":
-                    sys.stdout.write(
-                        self.colors.YELLOW
-                        + f'\r--SERVER-- {message.removeprefix("Server!")}\n'
-                        + self.COMMAND_PROMPT
-                    )
-            elif message.startswith('History!'):
-                if message.removeprefix("History!").strip() != "":
-                    sys.stdout.write(
-                        self.colors.BLUE
-                        + f'\r--HISTORY-- {message.removeprefix("History!")}\n'
-                        + self.COMMAND_PROMPT
-                    )
-            else:
-                if message.removeprefix("Chat!").strip() != "":
-                    sys.stdout.write(
-                        self.colors.GREEN
-                        + f'\r{message.removeprefix("Chat!")}\n'
-                        + self.COMMAND_PROMPT
-                    )
-            if message == 'exit':
-                break
+        if not self.headless:
+            renderer.write(
+                self.colors.RED
+                + self.line_start
+                + '-- Welcome to Chat! -> use @help to see instructions.\n'
+                + self.colors.RESET
+                + self.COMMAND_PROMPT
+            )
+        prefixes, suffix = self.message_prefixes, self.message_suffix
+        try:
+            async for frame_type, payload in frames:
+                prefix: str | None = prefixes.get(frame_type)
+                message: str = str(payload, 'utf-8', 'replace').strip()
+                if prefix is not None and message != "":
+                    renderer.add(prefix + message + suffix)
+        finally:
+            renderer.flush()
 
-    async def get_user_input(self, prompt: str) -> str:
+    async def connect(
+        self,
+        command: str,
+        username: str,
+        password: str,
+    ) -> tuple[AsyncIterator[tuple[FrameType, memoryview]], asyncio.StreamWriter]:
         """
-        Получение ввода пользователя.
+        Установка связи с сервером, вход (command='login')
+        или регистрация (command='register').
+        Возвращает поток входящих кадров (сжатые кадры в нем уже
+        распакованы) и writer соединения; при отказе сервера
+        возбуждает ConnectionError с его ответом.
         """
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, input, prompt)
+        reader, writer = await asyncio.open_connection(self.server_host, self.server_port)
+        offer: str = (
+            f' {COMPRESS_OPTION}{",".join(self.compression)}' if self.compression else ''
+        )
+        writer.write(encode_frame(FrameType.AUTH, f'{command} {username} {password}{offer}'))
+        await writer.drain()
+
+        self.decoder = FrameDecoder()
+        frames = read_frames(reader, self.decoder)
+        answer = await anext(frames, None)
+        status: str = str(answer[1], 'utf-8') if answer else 'Connection closed by server!'
+        if answer is None or answer[0] != FrameType.AUTH or status.split(' ')[0] != 'OK':
+            writer.close()
+            raise ConnectionError(status)
+        option: str = status.removeprefix('OK').strip()
+        if option.startswith(COMPRESS_OPTION):
+            algorithm = option[len(COMPRESS_OPTION):]
+            frames = FrameDecompressor(algorithm, MAX_FRAME_SIZE).frames(frames)
+        return frames, writer
 
     async def start(self) -> None:
         """
         Запуск клиента, установка связи с сервером.
         """
-        reader, writer = await asyncio.open_connection(self.server_host, self.server_port)
-        nickname: str = await self.get_user_input(
-            "--------------------------------------------------------------\n"
-            "Enter your nickname and password '<nickname> <password>'.\n"
-            "If you forgot the password, please contact the administrator.\n"
-            "If you want to register, enter 'new <nickname> <password>'.\n"
-        )
+        stdin = StdinReader()
+        renderer = Renderer(sys.stdout, self.COMMAND_PROMPT)
+        if not self.headless:
+            renderer.write(
+                "--------------------------------------------------------------\n"
+                "Enter your nickname and password '<nickname> <password>'.\n"
+                "If you forgot the password, please contact the administrator.\n"
+                "If you want to register, enter 'new <nickname> <password>'.\n"
+            )
+        nickname: str = await stdin.readline() or ''
 
         user_info: list[str] = nickname.split()
         if len(user_info) not in (2, 3) or len(user_info) == 3 and user_info[0] != 'new':
@@ -128,57 +298,44 @@ class Client:
                 + 'Wrong command format! Try later!\n'
                 + self.colors.RESET
             )
-            writer.close()
-            sys.exit(0)
-
-        user_database: list[dict[str, Any]] = load_user_database('users_database.json')
-        authenticated: bool = False
+            sys.exit(1 if self.headless else 0)
 
-        if len(user_info) == 2:
-            username, password = user_info
-            for user in user_database:
-                if user['username'] == username and user['password'] == password:
-                    authenticated = True
-                    break
-        else:
-            _, username, password = user_info
-            if username not in (item["username"] for item in user_database):
-                new_user = {
-                    'username': username,
-                    'password': password,
-                    'last_visit': datetime.datetime.now().timestamp(),
-                }
-                user_database.append(new_user)
-                with open('users_database.json', 'w') as file:
-                    json.dump(user_database, file)
-                authenticated = True
+        try:
+            if len(user_info) == 2:
+                frames, writer = await self.connect('login', *user_info)
             else:
-                sys.stdout.write(
-                    self.colors.RED
-                    + 'This name already occupied!\n'
-                    + self.colors.RESET
-                )
-                writer.close()
-                sys.exit(0)
-        if not authenticated:
-            sys.stdout.write(
-                self.colors.RED
-                + 'Invalid username or password!\n'
-                + self.colors.RESET
-            )
-            writer.close()
-            sys.exit(0)
-
-        writer.write(username.encode() + b'\n')
-        await writer.drain()
+                frames, writer = await self.connect('register', *user_info[1:])
+        except ConnectionError as error:
+            sys.stdout.write(self.colors.RED + f'{error}\n' + self.colors.RESET)
+            sys.exit(1 if self.headless else 0)
 
-        clear_console()
-        send_task = asyncio.create_task(self.send_message(writer))
-        receive_task = asyncio.create_task(self.handle_message(reader))
+        if not self.headless:
+            clear_console()
+        send_task = asyncio.create_task(self.send_message(writer, stdin, renderer))
+        receive_task = asyncio.create_task(self.handle_message(frames, renderer))
         await asyncio.gather(send_task, receive_task)
+        stdin.close()
         writer.close()
 
 
-if __name__ == '__main__':
-    client: Client = Client(server_host='127.0.0.1', server_port=8000)
+def main() -> None:
+    """
+    Запуск клиента из командной строки.
+    """
+    parser = argparse.ArgumentParser(description='Chat client.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--no-compression', action='store_true',
+                        help='do not offer compression of history and message batches')
+    parser.add_argument('--headless', action='store_true',
+                        help='plain output without colors and prompts for scripts and pipes: '
+                             'the first stdin line is the login, the rest are messages')
+    args = parser.parse_args()
+    client: Client = Client(
+        args.host, args.port, args.headless, () if args.no_compression else COMPRESSION_ALGORITHMS,
+    )
     asyncio.run(client.start())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import zlib
+from typing import Any, AsyncIterator, Literal
+
+from framing import HEADER, FrameDecoder, FrameType
+
+CompressionAlgorithm = Literal['zlib', 'zlib-stream']
+# Алгоритмы, которые предлагает клиент (в порядке предпочтения).
+COMPRESSION_ALGORITHMS: tuple[CompressionAlgorithm, ...] = ('zlib-stream', 'zlib')
+COMPRESS_OPTION: str = 'compress='
+# Потоковое сжатие хранит состояние для каждого подключения:
+# около 2 ** (window_bits + 2) + 2 ** (STREAM_MEM_LEVEL + 9) байт.
+STREAM_MEM_LEVEL: int = 5
+
+
+def negotiate_compression(
+    offered: str,
+    enabled: list[CompressionAlgorithm],
+) -> CompressionAlgorithm | None:
+    """
+    Выбор алгоритма сжатия по предложению клиента 'compress=<алг.>,<алг.>':
+    первый из включенных на сервере алгоритмов, который предложил клиент.
+    """
+    if not offered.startswith(COMPRESS_OPTION):
+        return None
+    algorithms = offered[len(COMPRESS_OPTION):].split(',')
+    return next((algorithm for algorithm in enabled if algorithm in algorithms), None)
+
+
+class FrameCompressor:
+    """
+    Сжатие пачек кадров, отправляемых клиенту: пачка не короче threshold
+    байт заменяется кадром COMPRESSED с ее сжатыми данными (deflate),
+    более короткие пачки отправляются как есть.
+    'zlib' сжимает каждую пачку отдельно, 'zlib-stream' - одним потоком
+    на подключение (Z_SYNC_FLUSH после пачки), поэтому повторы из прошлых
+    пачек (имена, даты) сжимаются и в коротких пачках живого трафика.
+    Сжатые пачки нужно отправлять в порядке вызовов pack().
+    """
+    def __init__(
+        self,
+        algorithm: CompressionAlgorithm,
+        level: int,
+        threshold: int,
+        window_bits: int,
+        counts: dict[str, int],
+    ) -> None:
+        """
+        Инициализация сжатия.
+        counts - счетчики байт до ('raw') и после ('compressed') сжатия.
+        """
+        self.algorithm = algorithm
+        self.level = level
+        self.threshold = threshold
+        self.window_bits = window_bits
+        self.counts = counts
+        self.stream: Any = None
+
+    def pack(self, data: bytes) -> bytes:
+        """
+        Пачка кадров для отправки: сжатая или исходная.
+        """
+        if len(data) < self.threshold:
+            return data
+        if self.algorithm == 'zlib':
+            compressed = zlib.compress(data, self.level, -self.window_bits)
+        else:
+            if self.stream is None:
+                self.stream = zlib.compressobj(
+                    self.level, zlib.DEFLATED, -self.window_bits, STREAM_MEM_LEVEL,
+                )
+            compressed = self.stream.compress(data) + self.stream.flush(zlib.Z_SYNC_FLUSH)
+        frame = HEADER.pack(len(compressed), FrameType.COMPRESSED) + compressed
+        self.counts['raw'] += len(data)
+        self.counts['compressed'] += len(frame)
+        return frame
+
+
+class FrameDecompressor:
+    """
+    Распаковка кадров COMPRESSED на стороне клиента.
+    """
+    def __init__(self, algorithm: CompressionAlgorithm, max_frame_size: int) -> None:
+        """
+        Инициализация распаковки.
+        """
+        self.algorithm = algorithm
+        self.decoder = FrameDecoder(max_frame_size)
+        # Окно 2 ** 15 подходит для любого окна сжатия.
+        self.stream = zlib.decompressobj(-15) if algorithm == 'zlib-stream' else None
+
+    async def frames(
+        self,
+        frames: AsyncIterator[tuple[FrameType, memoryview]],
+    ) -> AsyncIterator[tuple[FrameType, memoryview]]:
+        """
+        Поток кадров, в котором кадры COMPRESSED заменены
+        кадрами из их распакованных данных.
+        """
+        decoder = self.decoder
+        async for frame_type, payload in frames:
+            if frame_type != FrameType.COMPRESSED:
+                yield frame_type, payload
+                continue
+            if self.stream is None:
+                data = zlib.decompress(payload, -15)
+            else:
+                data = self.stream.decompress(payload)
+            decoder.feed(data)
+            for frame in decoder.frames():
+                yield frame
@@ -0,0 +1,116 @@
+import asyncio
+import struct
+from enum import IntEnum
+from typing import AsyncIterator, Iterator
+
+HEADER = struct.Struct('!IB')
+MAX_FRAME_SIZE: int = 1 << 20
+READ_CHUNK_SIZE: int = 1 << 16
+
+
+class FrameType(IntEnum):
+    """
+    Тип кадра протокола.
+    """
+    AUTH = 1
+    CHAT = 2
+    PRIVATE = 3
+    HISTORY = 4
+    SERVER = 5
+    HELP = 6
+    BUS = 7
+    # Сжатая пачка кадров (см. compression.py).
+    COMPRESSED = 8
+
+
+FRAME_TYPES: dict[int, FrameType] = {frame_type.value: frame_type for frame_type in FrameType}
+
+
+class FrameError(ValueError):
+    """
+    Ошибка разбора кадра (неизвестный тип или превышен размер кадра).
+    """
+
+
+def encode_frame(frame_type: FrameType, payload: str | bytes) -> bytes:
+    """
+    Кодирование кадра: длина полезной нагрузки (4 байта),
+    тип кадра (1 байт) и сама нагрузка.
+    """
+    if isinstance(payload, str):
+        payload = payload.encode()
+    return HEADER.pack(len(payload), frame_type) + payload
+
+
+class FrameDecoder:
+    """
+    Декодер потока кадров.
+    Данные накапливаются в переиспользуемом буфере, нагрузка кадров
+    возвращается как memoryview без копирования и действительна
+    до следующего вызова feed(). received - количество полученных байт.
+    """
+    def __init__(self, max_frame_size: int = MAX_FRAME_SIZE) -> None:
+        """
+        Инициализация декодера.
+        """
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray(READ_CHUNK_SIZE)
+        self.start: int = 0
+        self.end: int = 0
+        self.received: int = 0
+
+    def feed(self, data: bytes) -> None:
+        """
+        Добавление полученных данных в буфер.
+        """
+        size = len(data)
+        self.received += size
+        if self.end + size > len(self.buffer):
+            pending = self.end - self.start
+            if pending + size > len(self.buffer):
+                buffer = bytearray(max(pending + size, 2 * len(self.buffer)))
+            else:
+                buffer = self.buffer
+            buffer[:pending] = self.buffer[self.start:self.end]
+            self.buffer = buffer
+            self.start, self.end = 0, pending
+        self.buffer[self.end:self.end + size] = data
+        self.end += size
+
+    def frames(self) -> Iterator[tuple[FrameType, memoryview]]:
+        """
+        Возвращает все полностью полученные кадры.
+        """
+        buffer, start, end = self.buffer, self.start, self.end
+        view = memoryview(buffer)
+        unpack_from, header_size = HEADER.unpack_from, HEADER.size
+        while end - start >= header_size:
+            length, frame_type = unpack_from(buffer, start)
+            if length > self.max_frame_size:
+                raise FrameError(f'frame of {length} bytes exceeds {self.max_frame_size}')
+            if frame_type not in FRAME_TYPES:
+                raise FrameError(f'unknown frame type {frame_type}')
+            frame_end = start + header_size + length
+            if frame_end > end:
+                break
+            self.start = frame_end
+            yield FRAME_TYPES[frame_type], view[start + header_size:frame_end]
+            start = frame_end
+        if self.start == self.end:
+            self.start = self.end = 0
+
+
+async def read_frames(
+    reader: asyncio.StreamReader,
+    decoder: FrameDecoder,
+) -> AsyncIterator[tuple[FrameType, memoryview]]:
+    """
+    Чтение кадров из потока до его закрытия.
+    """
+    while True:
+        data = await reader.read(READ_CHUNK_SIZE)
+        if not data:
+            return
+        decoder.feed(data)
+        for frame in decoder.frames():
+            yield frame
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+
+logger = logging.getLogger(__name__)
+
+HANDOVER_REQUEST: bytes = b'takeover'
+HANDOVER_REFUSED: bytes = b'refused'
+HANDOVER_DONE: bytes = b'done'
+MAX_SOCKETS: int = 16
+MAX_REQUEST_SIZE: int = 4096
+
+Address = tuple[str, int]
+
+
+def listen_addresses(host: str, port: int) -> set[Address]:
+    """
+    Адреса, на которых сервер с настройками host и port принимает
+    подключения (как их возвращает getsockname() слушающих сокетов).
+    """
+    infos = socket.getaddrinfo(
+        host or None, port, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE,
+    )
+    return {(info[4][0], info[4][1]) for info in infos}
+
+
+def socket_address(sock: socket.socket) -> Address:
+    """
+    Адрес слушающего сокета (без flowinfo и scope_id для IPv6).
+    """
+    address = sock.getsockname()
+    return address[0], address[1]
+
+
+def take_over(path: str, host: str, port: int, timeout: float) -> list[socket.socket]:
+    """
+    Получение слушающих сокетов у работающего сервера через unix-сокет
+    передачи (path). Возвращает пустой список, если сервер не запущен
+    или слушает другой адрес, чем host:port этого процесса.
+    После получения сокетов ожидает, пока прежний сервер отключит
+    клиентов и запишет снимок состояния (не дольше timeout секунд):
+    новые подключения до этого ждут в очереди слушающего сокета.
+    """
+    addresses = listen_addresses(host, port)
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        connection.close()
+        return []
+    with connection:
+        connection.settimeout(timeout)
+        connection.sendall(HANDOVER_REQUEST + b' ' + json.dumps(sorted(addresses)).encode())
+        reply, fds, _, _ = socket.recv_fds(connection, len(HANDOVER_REQUEST), MAX_SOCKETS)
+        sockets = [socket.socket(fileno=fd) for fd in fds]
+        if reply != HANDOVER_REQUEST or not sockets:
+            logger.info('---Server on %s does not listen on %s:%s---', path, host, port)
+            return []
+        if any(socket_address(sock) not in addresses for sock in sockets):
+            # Прежний сервер проверяет адреса сам; сюда попадают только
+            # сокеты от несовместимой версии сервера.
+            logger.warning('---Received sockets do not match %s:%s---', host, port)
+            for sock in sockets:
+                sock.close()
+            return []
+        try:
+            connection.recv(len(HANDOVER_DONE))
+        except TimeoutError:
+            logger.info('---Previous server did not finish in %s seconds---', timeout)
+    return sockets
+
+
+def is_listening(path: str) -> bool:
+    """
+    Принимает ли подключения unix-сокет path (или это файл
+    от остановленного процесса).
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+def bind_handover_socket(path: str) -> socket.socket:
+    """
+    Открытие unix-сокета передачи. Файл, оставшийся от остановленного
+    процесса, заменяется; сокет работающего сервера не трогается.
+    """
+    if os.path.exists(path):
+        if is_listening(path):
+            raise FileExistsError(f'{path} is used by another server')
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        listener.bind(path)
+        listener.listen()
+    except OSError:
+        listener.close()
+        raise
+    listener.setblocking(False)
+    return listener
+
+
+async def receive_request(connection: socket.socket) -> set[Address] | None:
+    """
+    Адреса, которые запрашивает новый процесс сервера
+    (None, если запрос некорректен).
+    """
+    data = await asyncio.get_running_loop().sock_recv(connection, MAX_REQUEST_SIZE)
+    request, _, addresses = data.partition(b' ')
+    if request != HANDOVER_REQUEST:
+        return None
+    try:
+        return {(host, port) for host, port in json.loads(addresses)}
+    except (ValueError, TypeError):
+        return None
+
+
+async def wait_for_handover(path: str, addresses: set[Address]) -> socket.socket:
+    """
+    Ожидание запроса на передачу сокетов от нового процесса сервера,
+    который слушает те же адреса (addresses); остальным запросам
+    отправляется отказ. Возвращает соединение с новым процессом
+    (для hand_over и finish_handover).
+    Если открыть сокет передачи не удалось, передача отключается
+    (ожидание продолжается до остановки сервера).
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        listener = bind_handover_socket(path)
+    except OSError as error:
+        logger.warning('---Handover socket %s is unavailable: %s---', path, error)
+        await loop.create_future()
+    try:
+        while True:
+            connection, _ = await loop.sock_accept(listener)
+            try:
+                requested = await receive_request(connection)
+                if requested is not None and addresses <= requested:
+                    return connection
+                if requested is not None:
+                    logger.warning('---Handover refused: %s != %s---', requested, addresses)
+                    await loop.sock_sendall(connection, HANDOVER_REFUSED)
+            except OSError as error:
+                logger.info('---Handover request failed: %s---', error)
+            connection.close()
+    finally:
+        listener.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def hand_over(connection: socket.socket, sockets: list[socket.socket]) -> None:
+    """
+    Передача слушающих сокетов новому процессу сервера.
+    """
+    connection.setblocking(True)
+    socket.send_fds(connection, [HANDOVER_REQUEST], [sock.fileno() for sock in sockets])
+
+
+def finish_handover(connection: socket.socket) -> None:
+    """
+    Сообщение новому процессу, что состояние сохранено.
+    """
+    try:
+        connection.sendall(HANDOVER_DONE)
+    except OSError:
+        pass
+    connection.close()
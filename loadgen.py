@@ -0,0 +1,648 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, AsyncIterator, get_args
+
+from client import Client
+from compression import COMPRESSION_ALGORITHMS, CompressionAlgorithm
+from framing import FrameType, encode_frame
+
+LOAD_PASSWORD: str = 'loadgen'
+TRAFFIC_TYPES: tuple[str, ...] = ('chat', 'private', 'comment', 'claim')
+FLOOD_BATCH: int = 50
+# Буфер приема медленного клиента (байт): заполняется после нескольких сообщений.
+SLOW_CLIENT_BUFFER: int = 4096
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек с логарифмическими корзинами
+    (16 корзин на каждую степень двойки, погрешность не более 6%).
+    Память не зависит от количества замеров.
+    """
+    def __init__(self) -> None:
+        """
+        Инициализация гистограммы.
+        """
+        self.counts: dict[int, int] = {}
+        self.total: int = 0
+        self.max: int = 0
+
+    def record(self, value: int) -> None:
+        """
+        Учет одного замера (целое неотрицательное значение).
+        """
+        shift = max(value.bit_length() - 5, 0)
+        key = (shift << 5) | (value >> shift)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent: float) -> int:
+        """
+        Значение, не превышаемое percent процентами замеров
+        (верхняя граница корзины).
+        """
+        border = percent / 100 * self.total
+        seen: int = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= border:
+                return min((((key & 31) + 1) << (key >> 5)) - 1, self.max)
+        return self.max
+
+
+def process_tree(pid: int) -> list[int]:
+    """
+    Процесс сервера и его дочерние процессы (рабочие процессы
+    и пул хеширования паролей).
+    """
+    pids: list[int] = [pid]
+    for current in pids:
+        try:
+            with open(f'/proc/{current}/task/{current}/children') as children:
+                pids.extend(int(child) for child in children.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def server_rss(pid: int) -> int:
+    """
+    Резидентная память сервера в байтах.
+    """
+    total: int = 0
+    for current in process_tree(pid):
+        try:
+            with open(f'/proc/{current}/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+def server_cpu(pid: int) -> float:
+    """
+    Процессорное время сервера (user + system) в секундах.
+    """
+    total: int = 0
+    for current in process_tree(pid):
+        try:
+            with open(f'/proc/{current}/stat') as stat:
+                fields = stat.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        total += int(fields[11]) + int(fields[12])
+    return total / os.sysconf('SC_CLK_TCK')
+
+
+class LoadClient(Client):
+    """
+    Клиент нагрузочного теста: вместо вывода в терминал
+    измеряет задержку доставки сообщений.
+    Каждое сообщение заканчивается меткой '#<time.monotonic_ns()>'
+    момента отправки, получатель вычитает ее из текущего времени.
+    """
+    def __init__(self, generator: 'LoadGenerator', number: int) -> None:
+        """
+        Инициализация клиента нагрузочного теста.
+        """
+        super().__init__(generator.host, generator.port, compression=generator.compression)
+        self.generator = generator
+        self.username: str = f'lg{number}'
+        self.writer: asyncio.StreamWriter | None = None
+        self.last_index: int = 0
+        self.sent_bytes: int = 0
+
+    async def login(self) -> AsyncIterator[tuple[FrameType, memoryview]]:
+        """
+        Регистрация пользователя нагрузочного теста
+        (или вход, если он уже зарегистрирован).
+        """
+        try:
+            frames, self.writer = await self.connect('register', self.username, LOAD_PASSWORD)
+        except ConnectionError:
+            frames, self.writer = await self.connect('login', self.username, LOAD_PASSWORD)
+        return frames
+
+    async def handle_message(
+        self,
+        frames: AsyncIterator[tuple[FrameType, memoryview]],
+    ) -> None:
+        """
+        Учет задержки доставки входящих сообщений.
+        """
+        generator = self.generator
+        try:
+            async for frame_type, payload in frames:
+                if frame_type != FrameType.CHAT and frame_type != FrameType.PRIVATE:
+                    continue
+                received_at = time.monotonic_ns()
+                tail = bytes(payload[-24:])
+                position = tail.rfind(b'#')
+                if position < 0:
+                    continue
+                sent_at = int(tail[position + 1:])
+                if generator.measure_from <= sent_at < generator.measure_until:
+                    generator.delivered[frame_type.name.lower()] += 1
+                    generator.latency.record((received_at - sent_at) // 1000)
+                if frame_type == FrameType.CHAT:
+                    head = bytes(payload[:64])
+                    if head[:1] == b'#':
+                        # Сообщение комнаты: '#<комната> [номер] ...'.
+                        head = head[head.find(b' ') + 1:]
+                    if head[:1] == b'[':
+                        self.last_index = int(head[1:head.index(b']')])
+        except ConnectionError:
+            pass
+        finally:
+            generator.disconnected += 1
+
+    async def send_traffic(self) -> None:
+        """
+        Отправка сообщений со средней частотой generator.rate в секунду
+        и заданным соотношением типов трафика.
+        """
+        generator = self.generator
+        interval: float = 1 / generator.rate
+        await asyncio.sleep(random.random() * interval)
+        while True:
+            kind: str = random.choices(TRAFFIC_TYPES, generator.weights)[0]
+            sent_at = time.monotonic_ns()
+            if kind == 'chat':
+                text = f'load #{sent_at}'
+            elif kind == 'private':
+                text = f'@lg{random.randrange(generator.clients)} load #{sent_at}'
+            elif kind == 'comment':
+                text = f'@comment{self.last_index} load #{sent_at}'
+            else:
+                text = f'@claim lg{random.randrange(generator.clients)}'
+            frame = encode_frame(FrameType.CHAT, text)
+            self.writer.write(frame)
+            self.sent_bytes += len(frame)
+            if generator.measure_from <= sent_at < generator.measure_until:
+                generator.sent[kind] += 1
+            await self.writer.drain()
+            await asyncio.sleep(interval * random.uniform(0.5, 1.5))
+
+    async def send_flood(self) -> None:
+        """
+        Поток сообщений общего чата с частотой generator.flood_rate
+        в секунду (пачками по FLOOD_BATCH кадров). Сообщения без метки
+        времени и в замер задержки не попадают.
+        """
+        generator = self.generator
+        batch: bytes = encode_frame(FrameType.CHAT, f'flood from {self.username}') * FLOOD_BATCH
+        interval: float = FLOOD_BATCH / generator.flood_rate
+        while True:
+            self.writer.write(batch)
+            self.sent_bytes += len(batch)
+            if generator.measure_from <= time.monotonic_ns() < generator.measure_until:
+                generator.flood_sent += FLOOD_BATCH
+            await self.writer.drain()
+            await asyncio.sleep(interval)
+
+
+class LoadGenerator:
+    """
+    Нагрузочный тест сервера: clients одновременных подключений,
+    каждое отправляет rate сообщений в секунду в соотношении mix.
+    Отчет: задержка доставки (p50/p99/p999), пропускная способность
+    и резидентная память сервера. Доля flood_fraction подключений
+    вместо обычного трафика отправляет flood_rate сообщений в секунду,
+    задержка при этом измеряется только для остальных подключений.
+    Если rooms больше 0, подключения распределяются по rooms комнатам
+    и пишут в них вместо общего чата. Доля slow_fraction подключений
+    не отправляет сообщений и не читает входящие (медленные клиенты,
+    которые не должны задерживать доставку остальным). Клиенты предлагают
+    серверу алгоритмы сжатия compression; в отчете - байты, переданные
+    в каждую сторону (после сжатия).
+    """
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        clients: int,
+        rate: float,
+        mix: dict[str, float],
+        duration: float,
+        warmup: float,
+        connect_concurrency: int,
+        server_pid: int | None = None,
+        flood_fraction: float = 0.0,
+        flood_rate: float = 1000.0,
+        rooms: int = 0,
+        slow_fraction: float = 0.0,
+        compression: tuple[CompressionAlgorithm, ...] = COMPRESSION_ALGORITHMS,
+    ) -> None:
+        """
+        Инициализация нагрузочного теста.
+        """
+        self.host = host
+        self.port = port
+        self.clients = clients
+        self.rate = rate
+        self.weights: list[float] = [mix.get(kind, 0) for kind in TRAFFIC_TYPES]
+        self.duration = duration
+        self.warmup = warmup
+        self.connect_concurrency = connect_concurrency
+        self.server_pid = server_pid
+        self.flood_fraction = flood_fraction
+        self.flood_rate = flood_rate
+        self.flood_sent: int = 0
+        self.rooms = rooms
+        self.slow_fraction = slow_fraction
+        self.compression = compression
+        self.measure_from: int = sys.maxsize
+        self.measure_until: int = sys.maxsize
+        self.sent: dict[str, int] = dict.fromkeys(TRAFFIC_TYPES, 0)
+        self.delivered: dict[str, int] = {'chat': 0, 'private': 0}
+        self.latency = LatencyHistogram()
+        self.login_latency = LatencyHistogram()
+        self.failed_logins: int = 0
+        self.disconnected: int = 0
+        self.rss_peak: int = 0
+
+    async def open_connection(
+        self,
+        client: LoadClient,
+        semaphore: asyncio.Semaphore,
+    ) -> AsyncIterator[tuple[FrameType, memoryview]] | None:
+        """
+        Подключение одного клиента (число одновременных подключений
+        ограничено, чтобы не переполнить очередь listen сервера).
+        """
+        async with semaphore:
+            started_at = time.monotonic_ns()
+            try:
+                frames = await client.login()
+            except (ConnectionError, OSError):
+                self.failed_logins += 1
+                return None
+            self.login_latency.record((time.monotonic_ns() - started_at) // 1000)
+            return frames
+
+    @staticmethod
+    def wire_bytes(clients: list[tuple[LoadClient, Any]]) -> tuple[int, int]:
+        """
+        Байты, отправленные клиентами и полученные ими от сервера.
+        """
+        return (
+            sum(client.sent_bytes for client, _ in clients),
+            sum(client.decoder.received for client, _ in clients),
+        )
+
+    async def sample_rss(self) -> None:
+        """
+        Периодический замер памяти сервера.
+        """
+        while True:
+            self.rss_peak = max(self.rss_peak, server_rss(self.server_pid))
+            await asyncio.sleep(0.5)
+
+    async def run(self) -> dict[str, Any]:
+        """
+        Проведение теста. Возвращает отчет.
+        """
+        semaphore = asyncio.Semaphore(self.connect_concurrency)
+        clients = [LoadClient(self, number) for number in range(self.clients)]
+        connect_started = time.perf_counter()
+        streams = await asyncio.gather(
+            *(self.open_connection(client, semaphore) for client in clients)
+        )
+        connect_time = time.perf_counter() - connect_started
+        connected = [
+            (client, frames) for client, frames in zip(clients, streams) if frames is not None
+        ]
+        rss_before = server_rss(self.server_pid) if self.server_pid else None
+        if self.rooms:
+            for number, (client, _) in enumerate(connected):
+                client.writer.write(
+                    encode_frame(FrameType.CHAT, f'@join room{number % self.rooms}')
+                )
+
+        slow = round(len(connected) * self.slow_fraction)
+        active = connected[:len(connected) - slow]
+        for client, _ in connected[len(active):]:
+            client.writer.get_extra_info('socket').setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, SLOW_CLIENT_BUFFER,
+            )
+
+        tasks: list[asyncio.Task[Any]] = []
+        if self.server_pid:
+            tasks.append(asyncio.create_task(self.sample_rss()))
+        readers = [
+            asyncio.create_task(client.handle_message(frames)) for client, frames in active
+        ]
+        started = time.monotonic_ns()
+        self.measure_from = started + int(self.warmup * 1e9)
+        self.measure_until = self.measure_from + int(self.duration * 1e9)
+        cpu_started = time.process_time()
+        flooders = round(len(active) * self.flood_fraction)
+        tasks += [
+            asyncio.create_task(
+                client.send_flood() if number < flooders else client.send_traffic()
+            )
+            for number, (client, _) in enumerate(active)
+        ]
+        await asyncio.sleep(self.warmup)
+        server_cpu_time = -server_cpu(self.server_pid) if self.server_pid else 0.0
+        sent_bytes, received_bytes = self.wire_bytes(connected)
+        await asyncio.sleep(self.duration)
+        if self.server_pid:
+            server_cpu_time += server_cpu(self.server_pid)
+        sent_bytes, received_bytes = (
+            after - before
+            for after, before in zip(self.wire_bytes(connected), (sent_bytes, received_bytes))
+        )
+        for task in tasks:
+            task.cancel()
+        await asyncio.sleep(min(self.duration, 2))
+        cpu_time = time.process_time() - cpu_started
+        disconnected = self.disconnected
+        for client, _ in connected:
+            client.writer.close()
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*tasks, *readers, return_exceptions=True)
+
+        sent = sum(self.sent.values())
+        return {
+            'clients': len(connected),
+            'rooms': self.rooms,
+            'flooders': flooders,
+            'slow_clients': slow,
+            'flood_sent_per_second': round(self.flood_sent / self.duration, 1),
+            'failed_logins': self.failed_logins,
+            'connect_seconds': round(connect_time, 3),
+            'login_latency_ms': {
+                f'p{percent:g}': self.login_latency.percentile(percent) / 1000
+                for percent in (50, 99)
+            },
+            'sent': self.sent,
+            'delivered': self.delivered,
+            'sent_per_second': round(sent / self.duration, 1),
+            'deliveries_per_second': round(sum(self.delivered.values()) / self.duration, 1),
+            'latency_ms': {
+                **{
+                    f'p{percent:g}': self.latency.percentile(percent) / 1000
+                    for percent in (50, 99, 99.9)
+                },
+                'max': self.latency.max / 1000,
+            },
+            'wire_bytes': {
+                'sent_per_second': round(sent_bytes / self.duration, 1),
+                'received_per_second': round(received_bytes / self.duration, 1),
+                'received_per_delivery': round(
+                    received_bytes / max(sum(self.delivered.values()), 1), 1,
+                ),
+            },
+            'disconnected_during_test': disconnected,
+            'loadgen_cpu_percent': round(
+                100 * cpu_time / (self.warmup + self.duration + min(self.duration, 2)), 1,
+            ),
+            'server_cpu_percent': round(100 * server_cpu_time / self.duration, 1),
+            'server_cpu_us_per_delivery': round(
+                1e6 * server_cpu_time / max(sum(self.delivered.values()), 1), 3,
+            ),
+            'server_rss_mib': None if rss_before is None else {
+                'before': round(rss_before / 2 ** 20, 1),
+                'peak': round(self.rss_peak / 2 ** 20, 1),
+            },
+        }
+
+
+def parse_compression(value: str) -> tuple[CompressionAlgorithm, ...]:
+    """
+    Разбор предлагаемых алгоритмов сжатия 'zlib-stream,zlib' ('none' - без сжатия).
+    """
+    if value == 'none':
+        return ()
+    algorithms = tuple(value.split(','))
+    for algorithm in algorithms:
+        if algorithm not in get_args(CompressionAlgorithm):
+            raise argparse.ArgumentTypeError(f'unknown compression algorithm {algorithm!r}')
+    return algorithms
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """
+    Разбор соотношения трафика вида 'chat=90,private=8,comment=2,claim=0'.
+    """
+    mix: dict[str, float] = {}
+    for item in value.split(','):
+        kind, _, weight = item.partition('=')
+        if kind not in TRAFFIC_TYPES:
+            raise argparse.ArgumentTypeError(f'unknown traffic type {kind!r}')
+        mix[kind] = float(weight)
+    return mix
+
+
+async def port_is_open(host: str, port: int) -> bool:
+    """
+    Принимает ли уже кто-то подключения на host:port.
+    """
+    try:
+        _, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        return False
+    writer.close()
+    return True
+
+
+async def wait_for_port(host: str, port: int, timeout: float) -> None:
+    """
+    Ожидание запуска сервера.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+        else:
+            writer.close()
+            return
+
+
+def spawn_server(
+    host: str,
+    port: int,
+    directory: str,
+    workers: int | None = None,
+    handover: bool = False,
+) -> subprocess.Popen[bytes]:
+    """
+    Запуск отдельного сервера для нагрузочного теста. Все файлы сервера
+    (БД пользователей, курсоры, журнал, файлы приватных сообщений, сокеты)
+    находятся во временном каталоге directory, порт администрирования
+    отключен, поэтому рядом работающий сервер не затрагивается.
+    workers - количество рабочих процессов (по умолчанию - из окружения).
+    Если handover, сервер принимает передачу порта через сокет в directory:
+    следующий сервер, запущенный с тем же directory, сменяет его.
+    """
+    database = os.path.join(directory, 'users_database.json')
+    if not os.path.exists(database):
+        with open(database, 'w') as file:
+            file.write('[]')
+    env = {
+        'PASSWORD_HASH_ITERATIONS': '1000',
+        # Все клиенты нагрузочного теста подключаются с одного адреса.
+        'IP_RATE_LIMITS': '{}',
+        **os.environ,
+        'HOST': host,
+        'PORT': str(port),
+        'USER_DATABASE_FILENAME': database,
+        'MESSAGE_LOG_DIR': os.path.join(directory, 'message_log'),
+        'PRIVATE_SPILL_DIR': os.path.join(directory, 'private_spill'),
+        'USER_CURSORS_DIR': os.path.join(directory, 'user_cursors'),
+        'BUS_SOCKET_PATH': os.path.join(directory, 'message_bus.sock'),
+        'HANDOVER_SOCKET_PATH': os.path.join(directory, 'handover.sock') if handover else '',
+        'ADMIN_PORT': '0',
+    }
+    if workers is not None:
+        env['WORKERS'] = str(workers)
+    return subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(__file__) or '.', 'server.py')],
+        env=env,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def run_load_test(
+    args: argparse.Namespace,
+    spawn: bool,
+    workers: int | None = None,
+) -> dict[str, Any]:
+    """
+    Нагрузочный тест с параметрами командной строки. Если spawn,
+    тест проводится на отдельном сервере (см. spawn_server), который
+    затем останавливается.
+    """
+    server: subprocess.Popen[bytes] | None = None
+    server_pid: int | None = args.server_pid
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            if spawn:
+                server = spawn_server(args.host, args.port, directory, workers)
+                server_pid = server.pid
+                asyncio.run(wait_for_port(args.host, args.port, 30))
+            return asyncio.run(LoadGenerator(
+                args.host,
+                args.port,
+                args.clients,
+                args.rate,
+                args.mix,
+                args.duration,
+                args.warmup,
+                args.connect_concurrency,
+                server_pid,
+                args.flood_fraction,
+                args.flood_rate,
+                args.rooms,
+                args.slow_fraction,
+                args.compression,
+            ).run())
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+
+def scale_workers(args: argparse.Namespace) -> dict[str, Any]:
+    """
+    Масштабирование по рабочим процессам: одинаковый тест на отдельных
+    серверах с 1..scale_workers рабочими процессами. Для каждого -
+    отправленные и доставленные сообщения в секунду, задержка p99,
+    процессорное время сервера и ускорение относительно одного процесса.
+    Генератор нагрузки работает в одном процессе: если его загрузка
+    (loadgen_cpu_percent) близка к 100%, ограничивает он, а не сервер.
+    """
+    report: dict[str, Any] = {'cpu_count': os.cpu_count()}
+    baseline: float | None = None
+    for workers in range(1, args.scale_workers + 1):
+        result = run_load_test(args, True, workers)
+        deliveries = result['deliveries_per_second']
+        baseline = baseline or deliveries
+        report[f'workers={workers}'] = {
+            'sent_per_second': result['sent_per_second'],
+            'deliveries_per_second': deliveries,
+            'speedup': round(deliveries / baseline, 2) if baseline else None,
+            'latency_p99_ms': result['latency_ms']['p99'],
+            'server_cpu_percent': result['server_cpu_percent'],
+            'loadgen_cpu_percent': result['loadgen_cpu_percent'],
+            'failed_logins': result['failed_logins'],
+        }
+    return report
+
+
+def main() -> None:
+    """
+    Запуск нагрузочного теста из командной строки.
+    """
+    parser = argparse.ArgumentParser(description='Load generator for the chat server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='messages per second sent by each client')
+    parser.add_argument('--mix', type=parse_mix, default='chat=90,private=8,comment=2,claim=0')
+    parser.add_argument('--duration', type=float, default=10.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--connect-concurrency', type=int, default=100)
+    parser.add_argument('--flood-fraction', type=float, default=0.0,
+                        help='fraction of connections that flood the chat')
+    parser.add_argument('--flood-rate', type=float, default=1000.0,
+                        help='messages per second sent by each flooding connection')
+    parser.add_argument('--slow-fraction', type=float, default=0.0,
+                        help='fraction of connections that never read incoming messages')
+    parser.add_argument('--rooms', type=int, default=0,
+                        help='spread connections over this many rooms (0 - general chat)')
+    parser.add_argument('--server-pid', type=int, help='pid of the server to report RSS for')
+    parser.add_argument('--spawn-server', action='store_true',
+                        help='start a throwaway server.py with its own user database '
+                             'and message log (settings are taken from the environment)')
+    parser.add_argument('--compression', type=parse_compression,
+                        default=','.join(COMPRESSION_ALGORITHMS),
+                        help="compression algorithms offered by clients ('none' - no compression)")
+    parser.add_argument('--scale-workers', type=int, default=0, metavar='N',
+                        help='run the test on throwaway servers with 1..N workers '
+                             'and report throughput for each')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    if (args.spawn_server or args.scale_workers) and asyncio.run(
+        port_is_open(args.host, args.port)
+    ):
+        parser.error(f'port {args.port} is already in use')
+    if args.scale_workers:
+        report = scale_workers(args)
+    else:
+        report = run_load_test(args, args.spawn_server)
+
+    if args.json:
+        print(json.dumps(report, indent=4))
+        return
+    for key, value in report.items():
+        print(f'{key:>26}: {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from enum import IntEnum
+from typing import Any, Callable, Literal
+
+from message_store import DEFAULT_ROOM
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct('!IIB')
+SEGMENT_SUFFIX: str = '.log'
+
+FsyncPolicy = Literal['always', 'interval', 'never']
+
+
+class LogRecordType(IntEnum):
+    """
+    Тип записи журнала.
+    """
+    SNAPSHOT = 1
+    CHAT = 2
+    PRIVATE = 3
+    PRIVATE_DELIVERED = 4
+    CLAIM = 5
+    BAN = 6
+    PRIVATE_EXPIRED = 7
+    # Снимок, сжатый zlib (пишется при плавной остановке сервера).
+    SNAPSHOT_ZLIB = 8
+
+
+SNAPSHOTS = (LogRecordType.SNAPSHOT, LogRecordType.SNAPSHOT_ZLIB)
+
+
+def empty_state() -> dict[str, Any]:
+    """
+    Состояние сервера при первом запуске (журнал пуст).
+    """
+    return {
+        'room_indexes': {},
+        'chat_messages': [],
+        'private_messages': {},
+        'claims': {},
+        'claimed_users': {},
+    }
+
+
+def apply_record(state: dict[str, Any], record_type: int, data: Any) -> None:
+    """
+    Применение записи журнала к состоянию сервера.
+    """
+    if record_type in SNAPSHOTS:
+        state.clear()
+        state.update(data)
+    elif record_type == LogRecordType.CHAT:
+        # Записи без комнаты сделаны до появления комнат (общий чат).
+        room = data[5] if len(data) > 5 else DEFAULT_ROOM
+        state['chat_messages'].append(data)
+        state.setdefault('room_indexes', {})[room] = data[0] + 1
+    elif record_type == LogRecordType.PRIVATE:
+        recipient, text = data
+        state['private_messages'].setdefault(recipient, []).append(text)
+    elif record_type == LogRecordType.PRIVATE_DELIVERED and isinstance(data, str):
+        # Запись прежнего формата: доставлена вся очередь получателя.
+        state['private_messages'].pop(data, None)
+    elif record_type in (LogRecordType.PRIVATE_DELIVERED, LogRecordType.PRIVATE_EXPIRED):
+        recipient, count = data
+        messages = state['private_messages'].get(recipient)
+        if messages is not None:
+            del messages[:count]
+            if not messages:
+                del state['private_messages'][recipient]
+    elif record_type == LogRecordType.CLAIM:
+        recipient, count = data
+        state['claims'][recipient] = count
+    elif record_type == LogRecordType.BAN:
+        recipient, until = data
+        state['claims'].pop(recipient, None)
+        state['claimed_users'][recipient] = until
+
+
+def fsync_directory(path: str) -> None:
+    """
+    Запись на диск изменений каталога (созданных и переименованных файлов).
+    """
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class MessageLog:
+    """
+    Журнал сообщений и событий модерации на локальном диске.
+    Журнал состоит из сегментов; каждый сегмент начинается со снимка
+    состояния сервера, поэтому при запуске достаточно прочитать
+    только последний сегмент. Записи копятся в памяти и сбрасываются
+    на диск пачкой (group commit).
+    """
+    def __init__(
+        self,
+        directory: str,
+        snapshot: Callable[[], dict[str, Any]],
+        segment_size: int,
+        segments_to_keep: int,
+        flush_interval: float,
+        fsync_policy: FsyncPolicy,
+        fsync_interval: float,
+    ) -> None:
+        """
+        Инициализация журнала.
+        snapshot - функция, возвращающая текущее состояние сервера.
+        """
+        self.directory = directory
+        self.snapshot = snapshot
+        self.segment_size = segment_size
+        self.segments_to_keep = segments_to_keep
+        self.flush_interval = flush_interval
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.pending: list[bytes] = []
+        self.file: Any = None
+        self.size: int = 0
+        self.last_fsync: float = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def segments(self) -> list[str]:
+        """
+        Пути к файлам сегментов в порядке создания.
+        """
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    @staticmethod
+    def encode_record(record_type: LogRecordType, data: Any) -> bytes:
+        """
+        Кодирование записи: длина, crc32 и тип записи, затем данные в JSON
+        (для SNAPSHOT_ZLIB - сжатые zlib).
+        """
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+        if record_type == LogRecordType.SNAPSHOT_ZLIB:
+            payload = zlib.compress(payload, 1)
+        return RECORD_HEADER.pack(len(payload), zlib.crc32(payload), record_type) + payload
+
+    @staticmethod
+    def read_segment(path: str) -> dict[str, Any] | None:
+        """
+        Восстановление состояния из сегмента (файл отображается в память).
+        Возвращает None, если сегмент не начинается со снимка состояния.
+        Чтение прекращается на первой недописанной или поврежденной записи.
+        """
+        if os.path.getsize(path) < RECORD_HEADER.size:
+            return None
+        state: dict[str, Any] | None = None
+        with open(path, 'rb') as file, mmap.mmap(
+            file.fileno(), 0, access=mmap.ACCESS_READ,
+        ) as data:
+            position, end = 0, len(data)
+            while end - position >= RECORD_HEADER.size:
+                length, checksum, record_type = RECORD_HEADER.unpack_from(data, position)
+                start = position + RECORD_HEADER.size
+                payload = data[start:start + length]
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    logger.info(f'message log {path}: torn record at offset {position}')
+                    break
+                if state is None:
+                    if record_type not in SNAPSHOTS:
+                        return None
+                    state = {}
+                if record_type == LogRecordType.SNAPSHOT_ZLIB:
+                    payload = zlib.decompress(payload)
+                apply_record(state, record_type, json.loads(payload))
+                position = start + length
+        return state
+
+    def recover(self) -> dict[str, Any]:
+        """
+        Восстановление состояния сервера по последнему целому сегменту.
+        """
+        for path in reversed(self.segments()):
+            state = self.read_segment(path)
+            if state is not None:
+                return state
+        return empty_state()
+
+    def open(self, snapshot_type: LogRecordType = LogRecordType.SNAPSHOT) -> None:
+        """
+        Начало нового сегмента со снимком текущего состояния.
+        Старые сегменты сверх segments_to_keep удаляются только после
+        записи снимка и каталога на диск (при любой политике fsync):
+        иначе сбой в этот момент мог бы оставить журнал без состояния.
+        """
+        segments = self.segments()
+        number = int(os.path.basename(segments[-1])[:-len(SEGMENT_SUFFIX)]) + 1 if segments else 0
+        if self.file is not None:
+            self.file.close()
+        self.file = open(
+            os.path.join(self.directory, f'{number:020d}{SEGMENT_SUFFIX}'), 'ab', buffering=0,
+        )
+        self.pending.clear()
+        snapshot = self.encode_record(snapshot_type, self.snapshot())
+        self.file.write(snapshot)
+        self.size = len(snapshot)
+        obsolete = segments[:max(len(segments) + 1 - self.segments_to_keep, 0)]
+        if obsolete:
+            os.fsync(self.file.fileno())
+            fsync_directory(self.directory)
+            self.last_fsync = time.monotonic()
+        for path in obsolete:
+            os.remove(path)
+
+    def append(self, record_type: LogRecordType, data: Any) -> None:
+        """
+        Добавление записи в очередь на запись.
+        """
+        self.pending.append(self.encode_record(record_type, data))
+
+    async def flush(self) -> None:
+        """
+        Запись накопленных записей на диск одной операцией
+        и fsync в соответствии с настройками.
+        """
+        if self.pending:
+            data = b''.join(self.pending)
+            self.pending.clear()
+            self.file.write(data)
+            self.size += len(data)
+            if self.fsync_policy == 'always' or (
+                self.fsync_policy == 'interval'
+                and time.monotonic() - self.last_fsync >= self.fsync_interval
+            ):
+                self.last_fsync = time.monotonic()
+                await asyncio.get_running_loop().run_in_executor(
+                    None, os.fsync, self.file.fileno(),
+                )
+        if self.size >= self.segment_size:
+            self.open()
+
+    async def flush_loop(self) -> None:
+        """
+        Периодический сброс журнала на диск.
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def checkpoint(self) -> None:
+        """
+        Новый сегмент из одного сжатого снимка состояния при плавной
+        остановке: следующий процесс восстанавливает состояние, не перечитывая
+        записи. Журнал закрывается.
+        """
+        self.open(LogRecordType.SNAPSHOT_ZLIB)
+        self.close()
+
+    def close(self) -> None:
+        """
+        Запись оставшихся записей и закрытие журнала.
+        """
+        if self.file is None:
+            return
+        if self.pending:
+            self.file.write(b''.join(self.pending))
+            self.pending.clear()
+        if self.fsync_policy != 'never':
+            os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
@@ -0,0 +1,274 @@
+import math
+import re
+import time
+from array import array
+from functools import lru_cache
+from itertools import islice
+from typing import Iterator, NamedTuple
+
+from search_index import AUTHOR_PREFIX, SearchIndex, SearchQuery, contains_phrase, terms_of
+
+LEGACY_HEADER = re.compile(r'(?:^Commenting <|\n)\[(\d+)\] \(')
+DEFAULT_ROOM: str = 'general'
+
+
+class ChatMessage(NamedTuple):
+    """
+    Сообщение общего чата.
+    created_at - время создания (timestamp с точностью до миллисекунд),
+    parent - номер комментируемого сообщения (или None).
+    """
+    index: int
+    created_at: float
+    author: str
+    body: str
+    parent: int | None
+
+
+@lru_cache(maxsize=64)
+def format_date(created_at: int) -> str:
+    """
+    Дата и время сообщения в формате 'дд.мм.гг ЧЧ:ММ:СС'
+    (сообщения, отправленные в одну секунду, используют одну строку).
+    """
+    return time.strftime('%d.%m.%y %H:%M:%S', time.localtime(created_at))
+
+
+def format_message(
+    index: int,
+    created_at: float,
+    author: str,
+    body: str,
+    parent: int | None,
+    room_prefix: str = '',
+) -> str:
+    """
+    Текст сообщения в том виде, в котором он отправляется клиентам.
+    Комментарий ссылается на исходное сообщение по номеру,
+    сообщения комнат (кроме общей) начинаются с '#<комната> '.
+    """
+    prefix = room_prefix if parent is None else f'{room_prefix}Commenting [{parent}]\n'
+    return f'{prefix}[{index}] ({format_date(int(created_at))}) {author}: {body}'
+
+
+def parse_legacy_message(index: int, text: str) -> tuple[str, str, int | None]:
+    """
+    Разбор сообщения в прежнем формате журнала (готовый текст,
+    комментарий содержит полный текст исходного сообщения).
+    Возвращает автора, текст сообщения и номер комментируемого сообщения.
+    """
+    prefix, _, own = text.rpartition(f'[{index}] (')
+    author, _, body = own[len('dd.mm.yy HH:MM:SS) '):].partition(': ')
+    # Номер комментируемого сообщения - последний заголовок '[номер] (' в его тексте.
+    headers = LEGACY_HEADER.findall(prefix)
+    return author, body, int(headers[-1]) if headers else None
+
+
+class MessageStore:
+    """
+    Хранилище сообщений общего чата.
+    Сообщения хранятся не объектами, а в параллельных массивах:
+    время создания (в миллисекундах), номер автора в таблице имен, номер комментируемого
+    сообщения, смещение текста и готовая для отправки клиентам нагрузка
+    кадра (текст, закодированный в UTF-8 один раз при добавлении).
+    Номера сообщений идут подряд, поэтому позиция сообщения
+    в массивах вычисляется по номеру; удаленные из начала записи
+    отбрасываются пачками. Если задан поисковый индекс, он обновляется
+    при добавлении и удалении сообщений.
+    """
+    def __init__(
+        self,
+        capacity: int,
+        ttl: int,
+        room_prefix: str = '',
+        search_index: SearchIndex | None = None,
+    ) -> None:
+        """
+        Инициализация хранилища.
+        capacity - максимальное количество хранимых сообщений,
+        ttl - время жизни сообщения в секундах,
+        room_prefix - начало текста сообщений комнаты.
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.room_prefix = room_prefix
+        self.search_index = search_index
+        self.authors: list[str] = []
+        self.author_ids: dict[str, int] = {}
+        self.created_at = array('q')
+        self.author = array('I')
+        self.parents = array('q')
+        self.body_offsets = array('I')
+        self.payloads: list[bytes] = []
+        # Позиция первого хранимого сообщения в массивах и его номер.
+        self.start: int = 0
+        self.first_index: int = 0
+
+    def __len__(self) -> int:
+        return len(self.payloads) - self.start
+
+    def __contains__(self, index: int) -> bool:
+        return self.position(index) is not None
+
+    def __iter__(self) -> Iterator[ChatMessage]:
+        for index in range(self.first_index, self.first_index + len(self)):
+            yield self.get(index)
+
+    @property
+    def last_index(self) -> int | None:
+        """
+        Номер последнего сообщения (или None, если хранилище пусто).
+        """
+        return self.first_index + len(self) - 1 if len(self) else None
+
+    def append(
+        self,
+        index: int,
+        created_at: float,
+        author: str,
+        body: str,
+        parent: int | None = None,
+    ) -> bytes:
+        """
+        Добавление сообщения. При превышении лимита удаляется
+        самое старое сообщение. Возвращает нагрузку кадра.
+        Если номер сообщения не следует за последним (например,
+        рабочий процесс пропустил часть сообщений), хранимые
+        сообщения отбрасываются.
+        """
+        count = len(self.payloads) - self.start
+        if not count or index != self.first_index + count:
+            self.drop(count)
+            self.first_index = index
+            count = 0
+        author_id = self.author_ids.get(author)
+        if author_id is None:
+            author_id = self.author_ids[author] = len(self.authors)
+            self.authors.append(author)
+        text = format_message(index, created_at, author, body, parent, self.room_prefix)
+        payload = text.encode()
+        # Округление вверх: сообщение не удаляется раньше срока.
+        self.created_at.append(math.ceil(created_at * 1000))
+        self.author.append(author_id)
+        self.parents.append(-1 if parent is None else parent)
+        self.body_offsets.append(len(payload) - len(body.encode()))
+        self.payloads.append(payload)
+        if self.search_index is not None:
+            self.search_index.add(index, author, body)
+        if count >= self.capacity:
+            self.drop(count + 1 - self.capacity)
+        return payload
+
+    def drop(self, count: int) -> None:
+        """
+        Удаление count самых старых сообщений. Массивы сдвигаются,
+        только когда удаленные записи занимают больше половины.
+        """
+        if self.search_index is not None:
+            if count >= len(self):
+                self.search_index.clear()
+            else:
+                authors, author = self.authors, self.author
+                for position in range(self.start, self.start + count):
+                    self.search_index.remove(authors[author[position]], self.body(position))
+        self.start += count
+        self.first_index += count
+        if self.start > 1024 and self.start * 2 > len(self.payloads) or not len(self):
+            for column in (
+                self.created_at, self.author, self.parents, self.body_offsets, self.payloads,
+            ):
+                del column[:self.start]
+            self.start = 0
+
+    def position(self, index: int) -> int | None:
+        """
+        Позиция сообщения в массивах (или None, если оно удалено).
+        """
+        offset = index - self.first_index
+        return self.start + offset if 0 <= offset < len(self) else None
+
+    def body(self, position: int) -> str:
+        """
+        Текст сообщения в позиции position.
+        """
+        return self.payloads[position][self.body_offsets[position]:].decode()
+
+    def payload(self, index: int) -> bytes | None:
+        """
+        Возвращает нагрузку кадра сообщения (или None, если оно удалено).
+        """
+        position = self.position(index)
+        return None if position is None else self.payloads[position]
+
+    def get(self, index: int) -> ChatMessage | None:
+        """
+        Возвращает сообщение по его номеру (или None, если оно удалено).
+        """
+        position = self.position(index)
+        if position is None:
+            return None
+        parent = self.parents[position]
+        return ChatMessage(
+            index,
+            self.created_at[position] / 1000,
+            self.authors[self.author[position]],
+            self.body(position),
+            None if parent < 0 else parent,
+        )
+
+    def oldest(self) -> ChatMessage | None:
+        """
+        Возвращает самое старое сообщение (или None, если хранилище пусто).
+        """
+        return self.get(self.first_index)
+
+    def last(self, count: int) -> list[bytes]:
+        """
+        Возвращает нагрузку кадров последних count сообщений.
+        """
+        return self.payloads[max(len(self.payloads) - count, self.start):]
+
+    def since(self, index: int) -> list[bytes]:
+        """
+        Возвращает нагрузку кадров сообщений с номером больше index.
+        """
+        if not len(self):
+            return []
+        return self.last(max(self.last_index - index, 0))
+
+    def expire(self, current_time: float) -> int:
+        """
+        Удаляет сообщения, время жизни которых истекло.
+        Возвращает количество удаленных сообщений.
+        """
+        border = math.floor((current_time - self.ttl) * 1000)
+        created_at, end = self.created_at, len(self.payloads)
+        position = self.start
+        while position < end and created_at[position] <= border:
+            position += 1
+        removed = position - self.start
+        if removed:
+            self.drop(removed)
+        return removed
+
+    def search(self, query: SearchQuery, limit: int) -> list[int]:
+        """
+        Номера не более limit последних сообщений (от новых к старым),
+        в которых есть все слова и фразы запроса (и автор, если он указан).
+        Без индекса поиск не выполняется.
+        """
+        if self.search_index is None:
+            return []
+        terms = list(query.terms)
+        if query.author is not None:
+            terms.append(AUTHOR_PREFIX + query.author)
+        found: Iterator[int] = self.search_index.match(terms)
+        if query.phrases:
+            found = (
+                index for index in found
+                if all(
+                    contains_phrase(terms_of(self.body(self.position(index))), phrase)
+                    for phrase in query.phrases
+                )
+            )
+        return list(islice(found, limit))
@@ -0,0 +1,258 @@
+import asyncio
+import bisect
+import sys
+import threading
+import time
+from typing import Any, Callable
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин (как в Prometheus).
+    """
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        """
+        Инициализация гистограммы.
+        """
+        self.buckets = buckets
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        Учет одного значения.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class HistogramFamily(dict[str, Histogram]):
+    """
+    Набор гистограмм с одной меткой; гистограмма создается
+    при первом обращении к значению метки.
+    """
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__()
+        self.buckets = buckets
+
+    def __missing__(self, label: str) -> Histogram:
+        histogram = self[label] = Histogram(self.buckets)
+        return histogram
+
+
+class CounterFamily(dict[str, int]):
+    """
+    Набор счетчиков с одной меткой.
+    """
+    def __missing__(self, label: str) -> int:
+        return 0
+
+
+def format_labels(label: str | None, value: str, extra: str = '') -> str:
+    """
+    Метки образца метрики в текстовом формате Prometheus.
+    """
+    labels = [f'{label}="{value}"'] if label else []
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+class SamplingProfiler:
+    """
+    Семплирующий профилировщик: отдельный поток раз в interval секунд
+    снимает стек потока цикла событий. Результат - стеки в свернутом
+    формате ('file:function;file:function count'), пригодном для
+    построения flame graph.
+    """
+    def __init__(self) -> None:
+        """
+        Инициализация профилировщика (в остановленном состоянии).
+        """
+        self.samples: dict[str, int] = {}
+        self.thread: threading.Thread | None = None
+        self.stopped = threading.Event()
+
+    def start(self, interval: float) -> None:
+        """
+        Запуск сбора стеков текущего потока.
+        """
+        if self.thread is not None:
+            return
+        self.samples = {}
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self.sample, args=(threading.get_ident(), interval), daemon=True,
+        )
+        self.thread.start()
+
+    def sample(self, thread_id: int, interval: float) -> None:
+        """
+        Цикл сбора стеков (выполняется в отдельном потоке).
+        """
+        while not self.stopped.wait(interval):
+            frame = sys._current_frames().get(thread_id)
+            stack: list[str] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_filename.rsplit("/", 1)[-1]}:{code.co_name}')
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self.samples[key] = self.samples.get(key, 0) + 1
+
+    def stop(self) -> str:
+        """
+        Остановка профилировщика. Возвращает собранные стеки.
+        """
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+        return ''.join(
+            f'{stack} {count}\n'
+            for stack, count in sorted(self.samples.items(), key=lambda item: -item[1])
+        )
+
+
+class Metrics:
+    """
+    Метрики сервера в текстовом формате Prometheus.
+    Счетчики и гистограммы обновляются на горячем пути простым
+    изменением словаря; значения gauge вычисляются только при запросе.
+    Метрики и профилировщик доступны по HTTP на отдельном локальном порту:
+    GET /metrics, GET /profiler/start?interval=<секунды>, GET /profiler/stop.
+    """
+    def __init__(self, profiler_interval: float) -> None:
+        """
+        Инициализация набора метрик.
+        """
+        self.families: list[tuple[str, str, str, str | None, Any]] = []
+        self.profiler = SamplingProfiler()
+        self.profiler_interval = profiler_interval
+        self.loop_lag = self.histogram(
+            'chat_event_loop_lag_seconds', 'Event loop scheduling delay.', None,
+        )['']
+
+    def counter(self, name: str, description: str, label: str) -> CounterFamily:
+        """
+        Регистрация счетчика с меткой label.
+        """
+        family = CounterFamily()
+        self.families.append((name, description, 'counter', label, family))
+        return family
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        label: str | None,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> HistogramFamily:
+        """
+        Регистрация гистограммы (label=None - гистограмма без меток,
+        обращение по пустой строке).
+        """
+        family = HistogramFamily(buckets)
+        self.families.append((name, description, 'histogram', label, family))
+        return family
+
+    def gauge(
+        self,
+        name: str,
+        description: str,
+        collect: Callable[[], float | dict[str, float]],
+        label: str | None = None,
+    ) -> None:
+        """
+        Регистрация gauge; collect вызывается при каждом запросе метрик
+        и возвращает число или словарь {значение метки: число}.
+        """
+        self.families.append((name, description, 'gauge', label, collect))
+
+    def render(self) -> str:
+        """
+        Все метрики в текстовом формате Prometheus.
+        """
+        lines: list[str] = []
+        for name, description, metric_type, label, source in self.families:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            if metric_type == 'gauge':
+                value = source()
+                samples = value.items() if isinstance(value, dict) else [('', value)]
+                for label_value, sample in samples:
+                    lines.append(f'{name}{format_labels(label, label_value)} {sample}')
+            elif metric_type == 'counter':
+                for label_value, sample in source.items():
+                    lines.append(f'{name}{format_labels(label, label_value)} {sample}')
+            else:
+                for label_value, histogram in source.items():
+                    cumulative: int = 0
+                    borders = [str(border) for border in histogram.buckets] + ['+Inf']
+                    for border, count in zip(borders, histogram.counts):
+                        cumulative += count
+                        bucket_labels = format_labels(label, label_value, f'le="{border}"')
+                        lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+                    labels = format_labels(label, label_value)
+                    lines.append(f'{name}_sum{labels} {histogram.sum}')
+                    lines.append(f'{name}_count{labels} {cumulative}')
+        lines.append('')
+        return '\n'.join(lines)
+
+    async def monitor_loop_lag(self, interval: float) -> None:
+        """
+        Замер задержки цикла событий: насколько позже заданного
+        просыпается задача, уснувшая на interval секунд.
+        """
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(interval)
+            self.loop_lag.observe(max(time.monotonic() - started - interval, 0))
+
+    async def handle_admin(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """
+        Обработка HTTP-запроса к порту администрирования.
+        """
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        url = urlsplit(request.split(b' ', 2)[1].decode('latin-1') if b' ' in request else '/')
+        status, body = '200 OK', ''
+        if url.path == '/metrics':
+            body = self.render()
+        elif url.path == '/profiler/start':
+            try:
+                interval = float(
+                    parse_qs(url.query).get('interval', [self.profiler_interval])[0]
+                )
+            except ValueError:
+                interval = self.profiler_interval
+            self.profiler.start(interval)
+            body = f'profiler started, interval {interval} s\n'
+        elif url.path == '/profiler/stop':
+            body = self.profiler.stop()
+        else:
+            status, body = '404 Not Found', 'not found\n'
+        data = body.encode()
+        writer.write(
+            f'HTTP/1.1 {status}\r\n'
+            'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+            f'Content-Length: {len(data)}\r\n'
+            'Connection: close\r\n\r\n'.encode() + data
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from typing import Literal
+
+from compression import FrameCompressor
+
+logger = logging.getLogger(__name__)
+
+OverflowPolicy = Literal['drop_oldest', 'disconnect', 'backpressure']
+# Границы корзин гистограммы наибольшей глубины очереди подключения.
+DEPTH_BUCKETS: tuple[float, ...] = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class OutboundQueue:
+    """
+    Ограниченная очередь исходящих сообщений клиента.
+    Запись в сокет выполняет отдельная задача, поэтому медленный
+    клиент не задерживает доставку сообщений остальным.
+    max_depth - наибольшая глубина очереди за время подключения.
+    """
+    def __init__(
+        self,
+        writer: asyncio.StreamWriter,
+        maxsize: int,
+        policy: OverflowPolicy,
+        compressor: FrameCompressor | None = None,
+    ) -> None:
+        """
+        Инициализация очереди и запуск задачи записи.
+        compressor - сжатие пачек исходящих сообщений (если согласовано).
+        """
+        self.writer = writer
+        self.policy = policy
+        self.compressor = compressor
+        self.queue: asyncio.Queue[bytes] = asyncio.Queue(maxsize)
+        self.dropped: int = 0
+        self.max_depth: int = 0
+        self.closed: bool = False
+        self.task = asyncio.create_task(self.write_loop())
+
+    @property
+    def depth(self) -> int:
+        """
+        Текущее количество сообщений в очереди.
+        """
+        return self.queue.qsize()
+
+    async def put(self, data: bytes) -> None:
+        """
+        Постановка сообщения в очередь с учетом политики переполнения.
+        """
+        if self.closed:
+            return
+        if self.policy == 'backpressure':
+            await self.queue.put(data)
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+        else:
+            self.put_nowait(data)
+
+    def put_nowait(self, data: bytes) -> None:
+        """
+        Постановка сообщения в очередь без ожидания.
+        При переполнении удаляет самое старое сообщение
+        либо отключает клиента.
+        """
+        if self.closed:
+            return
+        if self.queue.full():
+            if self.policy == 'disconnect':
+                logger.info('outbound queue overflow, disconnecting client')
+                self.close()
+                return
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.dropped += 1
+        self.queue.put_nowait(data)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def write_loop(self) -> None:
+        """
+        Задача записи: забирает из очереди все накопленные сообщения
+        и отправляет их клиенту одной записью.
+        """
+        try:
+            while True:
+                chunks: list[bytes] = [await self.queue.get()]
+                while not self.queue.empty():
+                    chunks.append(self.queue.get_nowait())
+                data = b''.join(chunks)
+                if self.compressor is not None:
+                    data = self.compressor.pack(data)
+                self.writer.write(data)
+                await self.writer.drain()
+                for _ in chunks:
+                    self.queue.task_done()
+        except ConnectionError:
+            self.close()
+
+    async def flush(self) -> None:
+        """
+        Ожидание отправки всех сообщений, поставленных в очередь
+        (или закрытия соединения).
+        """
+        if self.closed:
+            return
+        joined = asyncio.ensure_future(self.queue.join())
+        await asyncio.wait((joined, self.task), return_when=asyncio.FIRST_COMPLETED)
+        joined.cancel()
+
+    def close(self) -> None:
+        """
+        Остановка задачи записи и закрытие соединения.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.task.cancel()
+        self.writer.close()
@@ -0,0 +1,412 @@
+import os
+import shutil
+import struct
+import time
+from array import array
+from typing import Callable, Iterator
+from urllib.parse import quote, unquote
+
+from scheduler import Scheduler, Timer
+
+# Запись файла вытеснения: время постановки в очередь (timestamp),
+# длина текста в байтах, затем текст в UTF-8.
+SPILL_RECORD = struct.Struct('!dI')
+SPILL_SUFFIX: str = '.spill'
+SENDING_SUFFIX: str = '.sending'
+SPILL_READ_SIZE: int = 64 * 1024
+
+
+class OfflineQueue:
+    """
+    Недоставленные приватные сообщения одного получателя.
+    Старые сообщения хранятся в памяти, а после превышения лимитов
+    новые дописываются в файл на диске (порядок сообщений сохраняется:
+    пока файл не пуст, все новые сообщения идут в него).
+    """
+    __slots__ = (
+        'messages', 'queued_at', 'size', 'spilled', 'spilled_until', 'timer', 'spill_timer',
+    )
+
+    def __init__(self) -> None:
+        """
+        Инициализация пустой очереди.
+        """
+        self.messages: list[str] = []
+        self.queued_at = array('d')
+        self.size: int = 0
+        self.spilled: int = 0
+        self.spilled_until: float = 0.0
+        self.timer: Timer | None = None
+        self.spill_timer: Timer | None = None
+
+
+class PrivateQueues:
+    """
+    Очереди приватных сообщений для отключенных пользователей.
+    Количество и объем сообщений получателя в памяти ограничены,
+    сообщения сверх лимита вытесняются в файл получателя, размер
+    которого тоже ограничен. Истекшие сообщения удаляются по таймерам
+    (один таймер на очередь в памяти и один на файл).
+    """
+    def __init__(
+        self,
+        directory: str,
+        scheduler: Scheduler,
+        ttl: int,
+        max_messages: int,
+        max_bytes: int,
+        spill_max_bytes: int,
+        expired: Callable[[str, int], None],
+    ) -> None:
+        """
+        Инициализация очередей.
+        expired(recipient, count) вызывается после удаления
+        истекших сообщений из памяти получателя.
+        """
+        self.directory = directory
+        self.scheduler = scheduler
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.spill_max_bytes = spill_max_bytes
+        self.expired = expired
+        self.queues: dict[str, OfflineQueue] = {}
+        # Очереди, извлеченные take() и еще не доставленные:
+        # их сообщения остаются в снимке состояния.
+        self.sending: dict[str, list[OfflineQueue]] = {}
+        self.count: int = 0
+        self.spilled: int = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def spill_path(self, recipient: str, suffix: str = SPILL_SUFFIX) -> str:
+        """
+        Путь к файлу вытесненных сообщений получателя.
+        """
+        return os.path.join(self.directory, quote(recipient, safe='') + suffix)
+
+    def restore(self, messages: dict[str, list[str]]) -> None:
+        """
+        Восстановление очередей после перезапуска: сообщения из журнала
+        возвращаются в память без учета лимитов (они старше вытесненных),
+        вытесненные сообщения остаются в файлах. Время постановки
+        в очередь в журнале не хранится, срок жизни отсчитывается заново.
+        """
+        now = time.time()
+        for recipient, texts in messages.items():
+            queue = self.queues.setdefault(recipient, OfflineQueue())
+            for text in texts:
+                queue.messages.append(text)
+                queue.queued_at.append(now)
+                queue.size += len(text.encode())
+            self.count += len(texts)
+            self.schedule_expiry(recipient, queue)
+        with os.scandir(self.directory) as entries:
+            sending = [entry.name for entry in entries if entry.name.endswith(SENDING_SUFFIX)]
+        for name in sending:
+            # Доставка прервана остановкой сервера: сообщения файла
+            # возвращаются в очередь перед вытесненными позже.
+            self.return_file(unquote(name[:-len(SENDING_SUFFIX)]))
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(SPILL_SUFFIX):
+                    recipient = unquote(entry.name[:-len(SPILL_SUFFIX)])
+                    queue = self.queues.setdefault(recipient, OfflineQueue())
+                    queue.spilled = entry.stat().st_size
+                    queue.spilled_until = now
+                    self.spilled += queue.spilled
+                    self.schedule_spill_expiry(recipient, queue)
+
+    def snapshot(self) -> dict[str, list[str]]:
+        """
+        Сообщения в памяти (для снимка состояния в журнале),
+        в том числе отправляемые сейчас.
+        """
+        snapshot: dict[str, list[str]] = {}
+        for recipient, taken in self.sending.items():
+            snapshot[recipient] = [message for queue in taken for message in queue.messages]
+        for recipient, queue in self.queues.items():
+            snapshot.setdefault(recipient, []).extend(queue.messages)
+        return {recipient: messages for recipient, messages in snapshot.items() if messages}
+
+    def put(self, recipient: str, message: str) -> bool | None:
+        """
+        Постановка сообщения в очередь получателя.
+        Возвращает True, если сообщение сохранено в памяти,
+        False - если вытеснено на диск, None - если лимит файла
+        получателя исчерпан и сообщение не сохранено.
+        """
+        queue = self.queues.get(recipient)
+        if queue is None:
+            queue = self.queues[recipient] = OfflineQueue()
+        now = time.time()
+        size = len(message.encode())
+        if (
+            not queue.spilled
+            and len(queue.messages) < self.max_messages
+            and queue.size + size <= self.max_bytes
+        ):
+            queue.messages.append(message)
+            queue.queued_at.append(now)
+            queue.size += size
+            self.count += 1
+            self.schedule_expiry(recipient, queue)
+            return True
+        if not self.spill(recipient, queue, message, now):
+            if not queue.messages and not queue.spilled:
+                del self.queues[recipient]
+            return None
+        return False
+
+    def spill(self, recipient: str, queue: OfflineQueue, message: str, now: float) -> bool:
+        """
+        Запись сообщения в файл получателя. Если лимит файла исчерпан,
+        файл сначала переписывается без истекших сообщений.
+        """
+        data = message.encode()
+        record = SPILL_RECORD.pack(now, len(data)) + data
+        path = self.spill_path(recipient)
+        if queue.spilled + len(record) > self.spill_max_bytes and queue.spilled:
+            self.spilled -= queue.spilled
+            queue.spilled = self.compact(path, now - self.ttl)
+            self.spilled += queue.spilled
+        if queue.spilled + len(record) > self.spill_max_bytes:
+            return False
+        with open(path, 'ab') as file:
+            file.write(record)
+        queue.spilled += len(record)
+        queue.spilled_until = now
+        self.spilled += len(record)
+        self.schedule_spill_expiry(recipient, queue)
+        return True
+
+    @staticmethod
+    def read(path: str, border: float) -> Iterator[list[tuple[float, bytes]]]:
+        """
+        Чтение файла вытесненных сообщений блоками по SPILL_READ_SIZE.
+        Возвращает время постановки в очередь и текст (UTF-8)
+        сообщений, поставленных в очередь позже border.
+        """
+        with open(path, 'rb') as file:
+            buffer = b''
+            while chunk := file.read(SPILL_READ_SIZE):
+                buffer += chunk
+                messages: list[tuple[float, bytes]] = []
+                position = 0
+                while len(buffer) - position >= SPILL_RECORD.size:
+                    queued_at, length = SPILL_RECORD.unpack_from(buffer, position)
+                    end = position + SPILL_RECORD.size + length
+                    if end > len(buffer):
+                        break
+                    if queued_at > border:
+                        messages.append(
+                            (queued_at, buffer[position + SPILL_RECORD.size:end])
+                        )
+                    position = end
+                buffer = buffer[position:]
+                yield messages
+
+    def compact(self, path: str, border: float) -> int:
+        """
+        Перезапись файла без истекших сообщений. Возвращает новый размер.
+        """
+        records = [
+            SPILL_RECORD.pack(queued_at, len(message)) + message
+            for messages in self.read(path, border) for queued_at, message in messages
+        ]
+        if not records:
+            os.remove(path)
+            return 0
+        with open(path + '.tmp', 'wb') as file:
+            file.writelines(records)
+        os.replace(path + '.tmp', path)
+        return sum(map(len, records))
+
+    def take(self, recipient: str) -> tuple[OfflineQueue, str | None]:
+        """
+        Извлечение очереди получателя для доставки. Возвращает очередь
+        (сообщения в памяти) и путь к файлу вытесненных сообщений (или None);
+        файл переименовывается, новые сообщения попадут в новый файл.
+        Файл читается через stream(). После отправки файл удаляется
+        (delivered()), а если отправка не удалась, сообщения возвращаются
+        в очередь (put_back()).
+        """
+        queue = self.queues.pop(recipient, None)
+        if queue is None:
+            return OfflineQueue(), None
+        self.cancel(queue)
+        self.count -= len(queue.messages)
+        self.sending.setdefault(recipient, []).append(queue)
+        if not queue.spilled:
+            return queue, None
+        self.spilled -= queue.spilled
+        path = self.spill_path(recipient, SENDING_SUFFIX)
+        os.replace(self.spill_path(recipient), path)
+        return queue, path
+
+    def stream(self, path: str) -> Iterator[list[bytes]]:
+        """
+        Чтение переданного take() файла (без истекших сообщений).
+        """
+        for messages in self.read(path, time.time() - self.ttl):
+            yield [message for _, message in messages]
+
+    def delivered(self, recipient: str, taken: OfflineQueue, path: str | None) -> None:
+        """
+        Завершение доставки очереди и файла, переданных take().
+        """
+        self.finish_sending(recipient, taken)
+        if path is not None:
+            os.remove(path)
+
+    def finish_sending(self, recipient: str, taken: OfflineQueue) -> None:
+        """
+        Удаление очереди, извлеченной take(), из отправляемых.
+        """
+        sending = self.sending.get(recipient, [])
+        for number, queue in enumerate(sending):
+            if queue is taken:
+                del sending[number]
+                break
+        if not sending:
+            self.sending.pop(recipient, None)
+
+    def put_back(self, recipient: str, taken: OfflineQueue, path: str | None) -> None:
+        """
+        Возврат в очередь сообщений, извлеченных take(), если их отправка
+        не удалась. Порядок сохраняется: сообщения, поставленные в очередь
+        за время отправки, идут после возвращенных (если был файл, они
+        дописываются в него).
+        """
+        self.finish_sending(recipient, taken)
+        queue = self.queues.pop(recipient, None) or OfflineQueue()
+        self.cancel(queue)
+        self.count += len(taken.messages)
+        self.spilled -= queue.spilled
+        if path is None:
+            taken.messages += queue.messages
+            taken.queued_at.extend(queue.queued_at)
+            taken.size += queue.size
+            taken.spilled, taken.spilled_until = queue.spilled, queue.spilled_until
+        else:
+            with open(path, 'ab') as file:
+                for queued_at, message in zip(queue.queued_at, queue.messages):
+                    data = message.encode()
+                    file.write(SPILL_RECORD.pack(queued_at, len(data)) + data)
+            self.count -= len(queue.messages)
+            taken.spilled = self.return_file(recipient)
+            taken.spilled_until = max(taken.spilled_until, queue.spilled_until, *queue.queued_at)
+        self.spilled += taken.spilled
+        if taken.messages or taken.spilled:
+            self.queues[recipient] = taken
+            self.schedule_expiry(recipient, taken)
+            self.schedule_spill_expiry(recipient, taken)
+
+    def return_file(self, recipient: str) -> int:
+        """
+        Переименование файла, переданного take(), обратно в файл
+        получателя; файл, вытесненный после take(), дописывается в конец.
+        Возвращает размер файла.
+        """
+        sending = self.spill_path(recipient, SENDING_SUFFIX)
+        path = self.spill_path(recipient)
+        if os.path.exists(path):
+            with open(sending, 'ab') as file, open(path, 'rb') as spilled:
+                shutil.copyfileobj(spilled, file)
+        os.replace(sending, path)
+        return os.path.getsize(path)
+
+    def discard(self, recipient: str, count: int) -> int:
+        """
+        Удаление первых count сообщений получателя в памяти и его файла
+        (сообщения доставлены другим процессом).
+        Возвращает количество удаленных из памяти сообщений.
+        """
+        queue = self.queues.get(recipient)
+        if queue is None:
+            return 0
+        count = min(count, len(queue.messages))
+        self.remove(queue, count)
+        if queue.spilled:
+            os.remove(self.spill_path(recipient))
+            self.spilled -= queue.spilled
+            queue.spilled = 0
+        if not queue.messages:
+            self.cancel(queue)
+            del self.queues[recipient]
+        return count
+
+    def remove(self, queue: OfflineQueue, count: int) -> None:
+        """
+        Удаление первых count сообщений очереди из памяти.
+        """
+        queue.size -= sum(len(message.encode()) for message in queue.messages[:count])
+        del queue.messages[:count]
+        del queue.queued_at[:count]
+        self.count -= count
+
+    def cancel(self, queue: OfflineQueue) -> None:
+        """
+        Отмена таймеров очереди.
+        """
+        for timer in (queue.timer, queue.spill_timer):
+            if timer is not None:
+                self.scheduler.cancel(timer)
+        queue.timer = queue.spill_timer = None
+
+    def schedule_expiry(self, recipient: str, queue: OfflineQueue) -> None:
+        """
+        Планирование удаления первого сообщения очереди в памяти.
+        """
+        if queue.timer is None and queue.messages:
+            queue.timer = self.scheduler.call_later(
+                queue.queued_at[0] + self.ttl - time.time(), self.expire, recipient,
+            )
+
+    def expire(self, recipient: str) -> None:
+        """
+        Удаление истекших сообщений из памяти получателя.
+        """
+        queue = self.queues[recipient]
+        queue.timer = None
+        border = time.time() - self.ttl
+        count: int = 0
+        while count < len(queue.messages) and queue.queued_at[count] <= border:
+            count += 1
+        if count:
+            self.remove(queue, count)
+            self.expired(recipient, count)
+        if not queue.messages and not queue.spilled:
+            self.cancel(queue)
+            del self.queues[recipient]
+        else:
+            self.schedule_expiry(recipient, queue)
+
+    def schedule_spill_expiry(self, recipient: str, queue: OfflineQueue) -> None:
+        """
+        Планирование удаления файла получателя после истечения
+        срока жизни последнего записанного в него сообщения.
+        """
+        if queue.spill_timer is None and queue.spilled:
+            queue.spill_timer = self.scheduler.call_later(
+                queue.spilled_until + self.ttl - time.time(), self.expire_spill, recipient,
+            )
+
+    def expire_spill(self, recipient: str) -> None:
+        """
+        Удаление файла получателя, если все сообщения в нем истекли.
+        """
+        queue = self.queues[recipient]
+        queue.spill_timer = None
+        if queue.spilled_until + self.ttl > time.time():
+            self.schedule_spill_expiry(recipient, queue)
+            return
+        if queue.spilled:
+            os.remove(self.spill_path(recipient))
+            self.spilled -= queue.spilled
+            queue.spilled = 0
+        if not queue.messages:
+            self.cancel(queue)
+            del self.queues[recipient]
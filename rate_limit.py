@@ -0,0 +1,132 @@
+import time
+from typing import Callable, Literal
+
+RateLimitPolicy = Literal['drop', 'delay']
+# Лимит: (сообщений в секунду, размер пачки).
+RateLimits = dict[str, tuple[float, float]]
+
+
+def traffic_kind(payload: memoryview) -> str:
+    """
+    Тип трафика по началу сообщения (без декодирования всего текста):
+    'chat' - сообщения и комментарии, которые рассылаются комнате,
+    'private' - приватные сообщения, 'command' - остальные команды.
+    """
+    if payload[:1] != b'@':
+        return 'chat'
+    head = bytes(payload[:8])
+    if head == b'@comment':
+        return 'chat'
+    if head.startswith((b'@help', b'@claim', b'@join', b'@leave', b'@rooms', b'@search')):
+        return 'command'
+    return 'private'
+
+
+class TokenBucket:
+    """
+    Корзина токенов: пополняется со скоростью rate токенов в секунду
+    до burst токенов, каждое сообщение расходует один токен.
+    """
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst: float, now: float) -> None:
+        """
+        Инициализация полной корзины в момент now.
+        """
+        self.tokens = burst
+        self.updated = now
+
+    def wait_time(self, rate: float, burst: float, now: float) -> float:
+        """
+        Пополнение корзины к моменту now. Возвращает время ожидания
+        следующего токена (0, если токен есть).
+        """
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / rate
+
+
+class RateLimiter:
+    """
+    Ограничение частоты сообщений по пользователю и по IP-адресу
+    отдельно для каждого типа трафика. Тип трафика без лимита
+    не ограничивается. Корзины адреса общие для всех подключений
+    с него и удаляются после отключения последнего.
+    """
+    def __init__(
+        self,
+        limits: RateLimits,
+        ip_limits: RateLimits,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Инициализация ограничителя.
+        clock - часы, по которым пополняются корзины.
+        """
+        self.limits = limits
+        self.ip_limits = ip_limits
+        self.clock = clock
+        self.users: dict[str, dict[str, TokenBucket]] = {}
+        self.ips: dict[str, dict[str, TokenBucket]] = {}
+        self.connections: dict[str, int] = {}
+
+    def configure(self, limits: RateLimits, ip_limits: RateLimits) -> None:
+        """
+        Замена лимитов без перезапуска; накопленные токены сохраняются.
+        """
+        self.limits = limits
+        self.ip_limits = ip_limits
+
+    def acquire(
+        self,
+        user_nickname: str,
+        ip: str,
+    ) -> tuple[dict[str, TokenBucket], dict[str, TokenBucket]]:
+        """
+        Регистрация подключения. Возвращает корзины пользователя и адреса.
+        """
+        self.connections[ip] = self.connections.get(ip, 0) + 1
+        return self.users.setdefault(user_nickname, {}), self.ips.setdefault(ip, {})
+
+    def release(self, user_nickname: str, ip: str) -> None:
+        """
+        Удаление корзин отключившегося пользователя (и адреса,
+        если с него больше нет подключений).
+        """
+        self.users.pop(user_nickname, None)
+        self.connections[ip] -= 1
+        if not self.connections[ip]:
+            del self.connections[ip], self.ips[ip]
+
+    def take(
+        self,
+        kind: str,
+        user_buckets: dict[str, TokenBucket],
+        ip_buckets: dict[str, TokenBucket],
+    ) -> float:
+        """
+        Расход токена на сообщение типа kind. Если токена нет
+        в корзине пользователя или адреса, токены не расходуются
+        и возвращается время ожидания (иначе 0).
+        """
+        user_limit = self.limits.get(kind)
+        ip_limit = self.ip_limits.get(kind)
+        now = self.clock()
+        wait: float = 0.0
+        if user_limit is not None:
+            user_bucket = user_buckets.get(kind)
+            if user_bucket is None:
+                user_bucket = user_buckets[kind] = TokenBucket(user_limit[1], now)
+            wait = user_bucket.wait_time(*user_limit, now)
+        if ip_limit is not None:
+            ip_bucket = ip_buckets.get(kind)
+            if ip_bucket is None:
+                ip_bucket = ip_buckets[kind] = TokenBucket(ip_limit[1], now)
+            wait = max(wait, ip_bucket.wait_time(*ip_limit, now))
+        if wait:
+            return wait
+        if user_limit is not None:
+            user_bucket.tokens -= 1
+        if ip_limit is not None:
+            ip_bucket.tokens -= 1
+        return 0.0
@@ -0,0 +1,42 @@
+import re
+
+from message_store import DEFAULT_ROOM, MessageStore
+from outbound import OutboundQueue
+from scheduler import Timer
+from search_index import SearchIndex
+
+ROOM_NAME = re.compile(r'[\w-]{1,32}')
+# Сколько комнат (с наибольшим числом участников) выводит команда @rooms.
+ROOMS_LISTED: int = 50
+
+
+def valid_room_name(name: str) -> bool:
+    """
+    Допустимое имя комнаты: от 1 до 32 букв, цифр, '_' или '-'.
+    """
+    return ROOM_NAME.fullmatch(name) is not None
+
+
+class Room:
+    """
+    Комната чата: собственная ограниченная история сообщений,
+    номер следующего сообщения и очереди исходящих сообщений участников,
+    подключенных к этому процессу (только им рассылаются сообщения комнаты).
+    """
+    __slots__ = ('name', 'messages', 'members', 'next_index', 'expiry')
+
+    def __init__(self, name: str, capacity: int, ttl: int, searchable: bool = True) -> None:
+        """
+        Инициализация пустой комнаты.
+        searchable - строить ли поисковый индекс по истории комнаты.
+        """
+        self.name = name
+        self.messages = MessageStore(
+            capacity,
+            ttl,
+            '' if name == DEFAULT_ROOM else f'#{name} ',
+            SearchIndex() if searchable else None,
+        )
+        self.members: dict[str, OutboundQueue] = {}
+        self.next_index: int = 0
+        self.expiry: Timer | None = None
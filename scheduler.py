@@ -0,0 +1,147 @@
+import asyncio
+import heapq
+import logging
+import time
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# Запись таймера: [срок (time.monotonic), функция, аргументы].
+Timer = list[Any]
+
+
+class Scheduler:
+    """
+    Планировщик отложенных вызовов на монотонных часах (колесо таймеров).
+    Время разбито на такты длиной resolution секунд; таймер попадает
+    в корзину такта, в котором наступает его срок, а номера непустых
+    тактов хранятся в двоичной куче. В цикле событий запланирован только
+    один вызов - на конец ближайшего непустого такта; при срабатывании
+    выполняются все таймеры наступивших тактов. Таймер срабатывает
+    не раньше своего срока и не позже чем через resolution секунд после него.
+    """
+    def __init__(self, resolution: float = 0.01) -> None:
+        """
+        Инициализация планировщика.
+        """
+        self.resolution = resolution
+        self.buckets: dict[int, list[Timer]] = {}
+        self.ticks: list[int] = []
+        self.pending: int = 0
+        self.cancelled: int = 0
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.wakeup: asyncio.TimerHandle | None = None
+        self.wakeup_tick: int | None = None
+
+    def __len__(self) -> int:
+        return self.pending
+
+    def call_at(self, deadline: float, callback: Callable[..., Any], *args: Any) -> Timer:
+        """
+        Вызов callback(*args) в момент deadline по time.monotonic().
+        Возвращает таймер, который можно передать в cancel().
+        """
+        timer: Timer = [deadline, callback, args]
+        tick = int(deadline // self.resolution) + 1
+        bucket = self.buckets.get(tick)
+        if bucket is None:
+            bucket = self.buckets[tick] = []
+            heapq.heappush(self.ticks, tick)
+            if self.loop is not None and (self.wakeup_tick is None or tick < self.wakeup_tick):
+                self.arm()
+        bucket.append(timer)
+        self.pending += 1
+        return timer
+
+    def call_later(self, delay: float, callback: Callable[..., Any], *args: Any) -> Timer:
+        """
+        Вызов callback(*args) через delay секунд.
+        """
+        return self.call_at(time.monotonic() + delay, callback, *args)
+
+    def cancel(self, timer: Timer) -> None:
+        """
+        Отмена таймера. Запись остается в корзине до наступления такта
+        или до чистки корзин.
+        """
+        if timer[1] is None:
+            return
+        timer[1] = timer[2] = None
+        self.pending -= 1
+        self.cancelled += 1
+        if self.cancelled > 1024 and self.cancelled > self.pending:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Удаление отмененных таймеров из корзин.
+        """
+        buckets: dict[int, list[Timer]] = {}
+        for tick, bucket in self.buckets.items():
+            bucket = [timer for timer in bucket if timer[1] is not None]
+            if bucket:
+                buckets[tick] = bucket
+        self.buckets = buckets
+        self.ticks = list(buckets)
+        heapq.heapify(self.ticks)
+        self.cancelled = 0
+
+    def run_due(self, now: float | None = None) -> int:
+        """
+        Выполнение всех таймеров наступивших тактов.
+        Возвращает количество выполненных вызовов.
+        """
+        if now is None:
+            now = time.monotonic()
+        ticks, buckets, resolution = self.ticks, self.buckets, self.resolution
+        executed: int = 0
+        while ticks and ticks[0] * resolution <= now:
+            for _, callback, args in buckets.pop(heapq.heappop(ticks)):
+                if callback is None:
+                    self.cancelled -= 1
+                    continue
+                self.pending -= 1
+                executed += 1
+                try:
+                    callback(*args)
+                except Exception:
+                    logger.exception('scheduled call %r failed', callback)
+        return executed
+
+    def arm(self) -> None:
+        """
+        Планирование пробуждения в цикле событий на ближайший такт.
+        """
+        if self.wakeup is not None:
+            self.wakeup.cancel()
+            self.wakeup = self.wakeup_tick = None
+        if self.ticks and self.loop is not None:
+            self.wakeup_tick = self.ticks[0]
+            self.wakeup = self.loop.call_later(
+                max(self.wakeup_tick * self.resolution - time.monotonic(), 0), self.fire,
+            )
+
+    def fire(self) -> None:
+        """
+        Срабатывание пробуждения: выполнение наступивших таймеров.
+        """
+        self.wakeup = self.wakeup_tick = None
+        self.run_due()
+        self.arm()
+
+    def start(self) -> None:
+        """
+        Привязка планировщика к текущему циклу событий. Таймеры,
+        добавленные до запуска цикла, срок которых уже наступил,
+        выполняются сразу.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.arm()
+
+    def stop(self) -> None:
+        """
+        Отвязка от цикла событий (таймеры сохраняются).
+        """
+        if self.wakeup is not None:
+            self.wakeup.cancel()
+        self.loop = self.wakeup = self.wakeup_tick = None
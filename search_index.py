@@ -0,0 +1,176 @@
+import re
+from array import array
+from bisect import bisect_right
+from typing import Iterator, NamedTuple
+
+TERM = re.compile(r'\w+')
+QUERY_TOKEN = re.compile(r'"([^"]*)"?|(\S+)')
+# Автор индексируется как термин, который не может встретиться в тексте.
+AUTHOR_PREFIX: str = 'from:'
+PAGE_PREFIX: str = 'page:'
+
+
+def terms_of(text: str) -> list[str]:
+    """
+    Термины текста: слова (буквы, цифры и '_') в нижнем регистре.
+    """
+    return TERM.findall(text.lower())
+
+
+def valid_page(text: str) -> bool:
+    """
+    Является ли текст номером страницы (цифры ASCII: int() принимает
+    не все символы, для которых isdigit() истинно, например '²').
+    """
+    return text.isascii() and text.isdigit()
+
+
+class SearchQuery(NamedTuple):
+    """
+    Поисковый запрос: слова (все должны быть в сообщении), фразы
+    (слова должны идти подряд), автор и номер страницы результатов.
+    """
+    terms: list[str]
+    phrases: list[list[str]]
+    author: str | None
+    page: int
+
+
+def parse_query(text: str) -> SearchQuery:
+    """
+    Разбор запроса вида 'from:<автор> page:<номер> слово "фраза из слов"'.
+    """
+    terms: list[str] = []
+    phrases: list[list[str]] = []
+    author: str | None = None
+    page: int = 1
+    for phrase, word in QUERY_TOKEN.findall(text):
+        if word.startswith(AUTHOR_PREFIX) and len(word) > len(AUTHOR_PREFIX):
+            author = word[len(AUTHOR_PREFIX):]
+        elif word.startswith(PAGE_PREFIX) and valid_page(word[len(PAGE_PREFIX):]):
+            page = max(int(word[len(PAGE_PREFIX):]), 1)
+        else:
+            words = terms_of(phrase or word)
+            terms.extend(words)
+            if len(words) > 1 and phrase:
+                phrases.append(words)
+    return SearchQuery(terms, phrases, author, page)
+
+
+def contains_phrase(terms: list[str], phrase: list[str]) -> bool:
+    """
+    Идут ли слова фразы подряд среди терминов текста.
+    """
+    first, length = phrase[0], len(phrase)
+    return any(
+        terms[position:position + length] == phrase
+        for position, term in enumerate(terms) if term == first
+    )
+
+
+class Postings:
+    """
+    Возрастающие номера сообщений с термином. Удаленные номера
+    в начале массива отбрасываются пачками (как в MessageStore).
+    """
+    __slots__ = ('indexes', 'start')
+
+    def __init__(self) -> None:
+        """
+        Инициализация пустого списка.
+        """
+        self.indexes = array('q')
+        self.start: int = 0
+
+    def __len__(self) -> int:
+        return len(self.indexes) - self.start
+
+
+class SearchIndex:
+    """
+    Инвертированный индекс сообщений хранилища: термин -> номера
+    сообщений, в которых он встречается. Сообщения добавляются
+    с возрастающими номерами, а удаляются только самые старые,
+    поэтому удаление сдвигает начало списков номеров.
+    """
+    def __init__(self) -> None:
+        """
+        Инициализация пустого индекса.
+        """
+        self.postings: dict[str, Postings] = {}
+
+    def __len__(self) -> int:
+        return len(self.postings)
+
+    @staticmethod
+    def message_terms(author: str, body: str) -> set[str]:
+        """
+        Индексируемые термины сообщения (слова текста и автор).
+        """
+        terms = set(terms_of(body))
+        terms.add(AUTHOR_PREFIX + author)
+        return terms
+
+    def add(self, index: int, author: str, body: str) -> None:
+        """
+        Добавление сообщения с номером больше всех проиндексированных.
+        """
+        postings = self.postings
+        for term in self.message_terms(author, body):
+            term_postings = postings.get(term)
+            if term_postings is None:
+                term_postings = postings[term] = Postings()
+            term_postings.indexes.append(index)
+
+    def remove(self, author: str, body: str) -> None:
+        """
+        Удаление самого старого из проиндексированных сообщений
+        (его номер стоит первым во всех его списках).
+        """
+        postings = self.postings
+        for term in self.message_terms(author, body):
+            term_postings = postings[term]
+            term_postings.start += 1
+            if not len(term_postings):
+                del postings[term]
+            elif term_postings.start > 64 and term_postings.start * 2 > len(term_postings.indexes):
+                del term_postings.indexes[:term_postings.start]
+                term_postings.start = 0
+
+    def clear(self) -> None:
+        """
+        Удаление всех сообщений.
+        """
+        self.postings.clear()
+
+    def match(self, terms: list[str]) -> Iterator[int]:
+        """
+        Номера сообщений, в которых есть все термины, от новых к старым.
+        Перебирается самый короткий список, номера ищутся в остальных
+        двоичным поиском с сужением верхней границы, поэтому первая
+        страница результатов не требует пересечения списков целиком.
+        """
+        lists: list[Postings] = []
+        for term in set(terms):
+            term_postings = self.postings.get(term)
+            if term_postings is None:
+                return
+            lists.append(term_postings)
+        if not lists:
+            return
+        lists.sort(key=len)
+        shortest, others = lists[0], lists[1:]
+        bounds = [len(other.indexes) for other in others]
+        indexes = shortest.indexes
+        for position in range(len(indexes) - 1, shortest.start - 1, -1):
+            index = indexes[position]
+            for number, other in enumerate(others):
+                high = bounds[number] = bisect_right(
+                    other.indexes, index, other.start, bounds[number],
+                )
+                if high == other.start:
+                    return
+                if other.indexes[high - 1] != index:
+                    break
+            else:
+                yield index
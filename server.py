@@ -1,47 +1,385 @@
 import asyncio
 import datetime
-import json
 import logging
-from typing import Any
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from typing import Any, AsyncIterator, Awaitable
 
-from server_settings import AppSettings, Message
+from auth import Authenticator
+from bus import BusClient, MessageBus
+from chat_protocol import ChatProtocol, install_uvloop
+from compression import COMPRESS_OPTION, FrameCompressor, negotiate_compression
+from framing import HEADER, FrameDecoder, FrameError, FrameType, encode_frame, read_frames
+from handover import (
+    finish_handover, hand_over, socket_address, take_over, wait_for_handover,
+)
+from message_log import LogRecordType, MessageLog
+from message_store import DEFAULT_ROOM, parse_legacy_message
+from metrics import Metrics
+from outbound import DEPTH_BUCKETS, OutboundQueue
+from private_queue import PrivateQueues
+from rate_limit import RateLimiter, TokenBucket, traffic_kind
+from rooms import ROOMS_LISTED, Room, valid_room_name
+from scheduler import Scheduler
+from search_index import parse_query
+from server_settings import AppSettings
+from user_cursors import CursorStore
+from user_registry import UserRegistry
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler())
 
 
-def load_user_database(filename: str) -> list[dict[str, Any]]:
-    """
-    Возвращает данные из БД пользователей.
-    """
-    with open(filename, 'r') as file:
-        data: list[dict[str, Any]] = json.load(file)
-    return data
-
-
 class Server:
     """
     Асинхронный мессенджер (сервер).
     """
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        worker_id: int | None = None,
+        sockets: list[socket.socket] | None = None,
+    ) -> None:
         """
         Инициализация экземпляра класса Сервер.
+        worker_id - номер рабочего процесса в многопроцессном режиме.
+        sockets - слушающие сокеты, полученные от прежнего процесса сервера
+        (см. handover.py); если их нет, сервер открывает порт сам.
         """
         app_settings = AppSettings()
-        self.message_current_index = app_settings.message_current_index
+        self.worker_id = worker_id
+        self.listen_sockets = sockets or []
+        self.bus: BusClient | None = None
+        self.bus_socket_path = app_settings.bus_socket_path
+        self.remote_clients: dict[str, int] = {}
         self.host = app_settings.host
         self.port = app_settings.port
         self.max_chat_messages = app_settings.max_chat_messages
         self.message_ttl = app_settings.message_ttl
         self.claims = app_settings.claims
         self.time_of_ban = app_settings.time_of_ban
-        self.private_messages = app_settings.private_messages
-        self.chat_messages = app_settings.chat_messages
+        self.max_rooms = app_settings.max_rooms
+        self.search_index = app_settings.search_index
+        self.search_page_size = app_settings.search_page_size
+        self.rooms: dict[str, Room] = {
+            DEFAULT_ROOM: Room(
+                DEFAULT_ROOM, self.max_chat_messages, self.message_ttl, self.search_index,
+            ),
+        }
+        self.rooms[DEFAULT_ROOM].next_index = app_settings.message_current_index
+        # Номер, с которого начинаются сообщения новых комнат: не меньше
+        # номеров удаленных комнат, чтобы у комнаты, созданной заново,
+        # номера не повторялись (и не совпадали с курсорами пользователей).
+        self.room_index_floor: int = 0
         self.connected_clients = app_settings.connected_clients
         self.claimed_users = app_settings.claimed_users
+        self.scheduler = Scheduler()
+        self.private_messages = PrivateQueues(
+            (
+                app_settings.private_spill_dir if worker_id is None
+                else os.path.join(app_settings.private_spill_dir, f'worker-{worker_id}')
+            ),
+            self.scheduler,
+            app_settings.private_message_ttl,
+            app_settings.private_queue_max_messages,
+            app_settings.private_queue_max_bytes,
+            app_settings.private_spill_max_bytes,
+            self.log_expired_private_messages,
+        )
         self.help_message = app_settings.help_message
+        self.help_frames: bytes = b''.join(
+            encode_frame(FrameType.HELP, line)
+            for line in self.help_message.splitlines()
+        )
+        self.max_frame_size = app_settings.max_frame_size
+        self.rate_limiter = RateLimiter(app_settings.rate_limits, app_settings.ip_rate_limits)
+        self.rate_limit_policy = app_settings.rate_limit_policy
+        self.rate_limited_frame: bytes = encode_frame(
+            FrameType.SERVER, 'Too many messages, some were dropped',
+        )
+        self.handover_socket_path = app_settings.handover_socket_path
+        self.shutdown_timeout = app_settings.shutdown_timeout
+        self.shutdown_grace = app_settings.shutdown_grace
+        self.listen_backlog = app_settings.listen_backlog
+        self.draining: bool = False
+        self.restarting_frame: bytes = encode_frame(
+            FrameType.SERVER, 'Server is restarting, please reconnect',
+        )
+        self.admin_host = app_settings.admin_host
+        self.admin_port = app_settings.admin_port
+        if self.admin_port and worker_id is not None:
+            self.admin_port += worker_id
+        self.loop_lag_interval = app_settings.loop_lag_interval
+        self.metrics = Metrics(app_settings.profiler_interval)
+        self.message_counts = self.metrics.counter(
+            'chat_messages_total', 'Messages received from clients by type.', 'type',
+        )
+        self.rate_limited = self.metrics.counter(
+            'chat_rate_limited_total', 'Messages over the rate limit by action taken.', 'action',
+        )
+        self.compressed_bytes = self.metrics.counter(
+            'chat_compression_bytes_total',
+            'Bytes of compressed frame batches before and after compression.', 'stage',
+        )
+        self.drain_wait = self.metrics.histogram(
+            'chat_drain_wait_seconds', 'Time spent waiting for writer.drain().', 'handler',
+        )
+        self.outbound_peak_depth = self.metrics.histogram(
+            'chat_outbound_queue_peak_depth',
+            'Largest outbound queue depth of each closed connection.', None, DEPTH_BUCKETS,
+        )['']
         self.user_database_filename = app_settings.user_database_filename
+        self.users = UserRegistry(self.user_database_filename)
+        self.cursors = CursorStore(app_settings.user_cursors_dir)
+        self.auth = Authenticator(
+            self.users,
+            app_settings.password_hash_iterations,
+            app_settings.credential_cache_ttl,
+            app_settings.auth_workers,
+        )
+        self.outbound_queue_size = app_settings.outbound_queue_size
+        self.outbound_overflow_policy = app_settings.outbound_overflow_policy
+        self.backlog_chunk_size = app_settings.backlog_chunk_size
+        self.compression = app_settings.compression
+        self.compression_level = app_settings.compression_level
+        self.compression_threshold = app_settings.compression_threshold
+        self.compression_window_bits = app_settings.compression_window_bits
+        self.compress_live_traffic = app_settings.compress_live_traffic
+        self.server_backend = app_settings.server_backend
+        self.use_uvloop = app_settings.use_uvloop
+        self.write_buffer_high_water = app_settings.write_buffer_high_water
+        self.write_buffer_low_water = app_settings.write_buffer_low_water
+        self.user_database_save_interval = app_settings.user_database_save_interval
+        self.message_log = MessageLog(
+            (
+                app_settings.message_log_dir if worker_id is None
+                else os.path.join(app_settings.message_log_dir, f'worker-{worker_id}')
+            ),
+            self.snapshot_state,
+            app_settings.message_log_segment_size,
+            app_settings.message_log_segments_to_keep,
+            app_settings.message_log_flush_interval,
+            app_settings.message_log_fsync,
+            app_settings.message_log_fsync_interval,
+        )
+        self.restore_state(self.message_log.recover())
+        self.register_gauges()
+
+    def register_gauges(self) -> None:
+        """
+        Регистрация метрик, значения которых вычисляются при запросе.
+        """
+        gauge = self.metrics.gauge
+        gauge(
+            'chat_connected_clients', 'Clients connected to this process.',
+            lambda: len(self.connected_clients),
+        )
+        gauge(
+            'chat_remote_clients', 'Clients connected to other worker processes.',
+            lambda: len(self.remote_clients),
+        )
+        gauge(
+            'chat_outbound_queue_depth', 'Outbound queue depth over connected clients.',
+            self.outbound_queue_stats, 'stat',
+        )
+        gauge(
+            'chat_outbound_dropped', 'Messages dropped by outbound queues of connected clients.',
+            lambda: sum(client['outbound'].dropped for client in self.connected_clients.values()),
+        )
+        gauge(
+            'chat_store_messages', 'Chat messages kept in room stores.',
+            lambda: sum(len(room.messages) for room in self.rooms.values()),
+        )
+        gauge('chat_rooms', 'Chat rooms.', lambda: len(self.rooms))
+        gauge(
+            'chat_search_terms', 'Distinct terms in room search indexes.',
+            lambda: sum(
+                len(room.messages.search_index) for room in self.rooms.values()
+                if room.messages.search_index is not None
+            ),
+        )
+        gauge(
+            'chat_queued_private_messages', 'Undelivered private messages kept in memory.',
+            lambda: len(self.private_messages),
+        )
+        gauge(
+            'chat_spilled_private_bytes', 'Undelivered private messages spilled to disk, bytes.',
+            lambda: self.private_messages.spilled,
+        )
+        gauge('chat_banned_users', 'Banned users.', lambda: len(self.claimed_users))
+        gauge('chat_registered_users', 'Registered users.', lambda: len(self.users.users))
+        gauge('chat_scheduled_timers', 'Pending scheduler timers.', lambda: len(self.scheduler))
+        gauge(
+            'chat_message_log_pending_records', 'Message log records waiting for flush.',
+            lambda: len(self.message_log.pending),
+        )
+
+    def reload_settings(self) -> None:
+        """
+        Перечитывание настроек, которые можно менять без перезапуска
+        (по сигналу SIGHUP): лимиты частоты сообщений, время жизни
+        сообщений, время бана, размер страницы поиска; настройки
+        очередей исходящих сообщений и сжатия действуют для новых подключений.
+        """
+        app_settings = AppSettings()
+        self.rate_limiter.configure(app_settings.rate_limits, app_settings.ip_rate_limits)
+        self.rate_limit_policy = app_settings.rate_limit_policy
+        self.time_of_ban = app_settings.time_of_ban
+        self.search_page_size = app_settings.search_page_size
+        self.private_messages.ttl = app_settings.private_message_ttl
+        self.outbound_queue_size = app_settings.outbound_queue_size
+        self.outbound_overflow_policy = app_settings.outbound_overflow_policy
+        self.compression = app_settings.compression
+        self.compression_level = app_settings.compression_level
+        self.compression_threshold = app_settings.compression_threshold
+        self.compress_live_traffic = app_settings.compress_live_traffic
+        if app_settings.message_ttl != self.message_ttl:
+            self.message_ttl = app_settings.message_ttl
+            for room in list(self.rooms.values()):
+                room.messages.ttl = self.message_ttl
+                if room.expiry is not None:
+                    self.scheduler.cancel(room.expiry)
+                self.expire_messages(room)
+        logger.info('---Settings reloaded---')
+
+    def snapshot_state(self) -> dict[str, Any]:
+        """
+        Снимок состояния сервера для журнала сообщений.
+        """
+        return {
+            'room_indexes': {name: room.next_index for name, room in self.rooms.items()},
+            'room_index_floor': self.room_index_floor,
+            'chat_messages': [
+                [*message, room.name]
+                for room in self.rooms.values() for message in room.messages
+            ],
+            'private_messages': self.private_messages.snapshot(),
+            'claims': self.claims,
+            'claimed_users': self.claimed_users,
+        }
+
+    def restore_state(self, state: dict[str, Any]) -> None:
+        """
+        Восстановление состояния сервера из журнала сообщений.
+        """
+        general = self.rooms[DEFAULT_ROOM]
+        # Журнал, записанный до появления комнат: один счетчик общего чата.
+        general.next_index = state.get('message_current_index', general.next_index)
+        for record in state['chat_messages']:
+            if len(record) == 3:
+                # Запись в прежнем формате: номер, время, готовый текст.
+                index, created_at, text = record
+                record = [index, created_at, *parse_legacy_message(index, text)]
+            room = self.get_room(record[5] if len(record) > 5 else DEFAULT_ROOM)
+            if room is not None:
+                room.messages.append(*record[:5])
+        floor = state.get('room_index_floor', 0)
+        for name, next_index in state.get('room_indexes', {}).items():
+            room = self.rooms.get(name)
+            if room is not None:
+                room.next_index = next_index
+            else:
+                # Комнаты без истории не восстанавливаются.
+                floor = max(floor, next_index)
+        self.room_index_floor = floor
+        for room in list(self.rooms.values()):
+            self.expire_messages(room)
+        self.private_messages.restore(state['private_messages'])
+        self.claims.update(state['claims'])
+        current_time = time.time()
+        for user, until in state['claimed_users'].items():
+            if until is not None and until > current_time:
+                self.ban_user(user, until)
+
+    def get_room(self, name: str) -> Room | None:
+        """
+        Комната с именем name; новая комната создается, пока их меньше
+        max_rooms (иначе возвращается None). Комнаты без участников
+        и истории удаляются (reclaim_room).
+        """
+        room = self.rooms.get(name)
+        if room is None and len(self.rooms) < self.max_rooms:
+            room = self.rooms[name] = Room(
+                name, self.max_chat_messages, self.message_ttl, self.search_index,
+            )
+            if self.bus is None:
+                # В многопроцессном режиме номера сообщений назначает шина.
+                room.next_index = self.room_index_floor
+        return room
+
+    def reclaim_room(self, room: Room) -> None:
+        """
+        Удаление комнаты (кроме общей), в которой не осталось участников
+        и сообщений: иначе пустые комнаты занимали бы память и место
+        в max_rooms до перезапуска сервера.
+        """
+        if room.name == DEFAULT_ROOM or room.members or len(room.messages):
+            return
+        if self.rooms.get(room.name) is room:
+            del self.rooms[room.name]
+            self.room_index_floor = max(self.room_index_floor, room.next_index)
+
+    def join_room(self, user_nickname: str, name: str) -> Room | None:
+        """
+        Вход подключенного пользователя в комнату; комната становится
+        текущей (в нее отправляются сообщения пользователя).
+        Возвращает None, если создать комнату нельзя.
+        """
+        room = self.get_room(name)
+        if room is not None:
+            client = self.connected_clients[user_nickname]
+            room.members[user_nickname] = client['outbound']
+            client['rooms'].add(name)
+            client['room'] = name
+        return room
+
+    def save_chat_message(
+        self,
+        room: Room,
+        index: int,
+        created_at: float,
+        user_nickname: str,
+        message: str,
+        parent: int | None,
+    ) -> bytes:
+        """
+        Сохранение сообщения комнаты в ее хранилище и журнале.
+        Возвращает нагрузку кадра с текстом сообщения.
+        """
+        payload = room.messages.append(index, created_at, user_nickname, message, parent)
+        self.message_log.append(
+            LogRecordType.CHAT, [index, created_at, user_nickname, message, parent, room.name],
+        )
+        self.schedule_message_expiry(room)
+        return payload
+
+    def schedule_message_expiry(self, room: Room) -> None:
+        """
+        Планирование удаления самого старого сообщения комнаты
+        по истечении его времени жизни.
+        """
+        if room.expiry is not None:
+            return
+        oldest = room.messages.oldest()
+        if oldest is not None:
+            room.expiry = self.scheduler.call_later(
+                oldest.created_at + self.message_ttl - time.time(),
+                self.expire_messages,
+                room,
+            )
+
+    def expire_messages(self, room: Room) -> None:
+        """
+        Удаление сообщений комнаты, время жизни которых истекло,
+        и планирование следующего удаления.
+        """
+        room.expiry = None
+        room.messages.expire(time.time())
+        self.schedule_message_expiry(room)
+        self.reclaim_room(room)
 
     async def client_connected(
         self,
@@ -49,70 +387,417 @@ class Server:
         writer: asyncio.StreamWriter,
     ) -> None:
         """
-        Обработка подключения нового клиента к серверу.
+        Обработка подключения нового клиента к серверу (asyncio.start_server).
+        """
+        await self.serve_client(read_frames(reader, FrameDecoder(self.max_frame_size)), writer)
+
+    def create_protocol(self) -> ChatProtocol:
+        """
+        Подключение нового клиента к серверу на основе asyncio.Protocol.
+        """
+        return ChatProtocol(
+            self.serve_client,
+            self.max_frame_size,
+            self.write_buffer_high_water,
+            self.write_buffer_low_water,
+        )
+
+    async def serve_client(
+        self,
+        frames: AsyncIterator[tuple[FrameType, memoryview]],
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """
+        Обслуживание клиента: вход, история и обработка сообщений.
+        writer - StreamWriter или ProtocolWriter (в зависимости от server_backend).
         """
         address: str = writer.get_extra_info('peername')
+        session = await self.start_session(frames, writer)
+        if session is None:
+            writer.close()
+            return
 
-        user_nickname: str = (await reader.readline()).decode().strip()
-        if user_nickname != "":
-            self.connected_clients[user_nickname] = {
-                'writer': writer,
-            }
-            logger.info(
-                f'---User {user_nickname} is connected--- '
-                f'(ip={address[0]}, port={address[1]})'
+        user_nickname, client = session
+        buckets = self.rate_limiter.acquire(user_nickname, address[0])
+        try:
+            await self.handle_frames(frames, user_nickname, writer, buckets)
+        except FrameError as error:
+            logger.info(f'---Bad frame from {user_nickname}: {error}---')
+        except ConnectionError as error:
+            logger.info(f'---Connection of {user_nickname} lost: {error}---')
+        except asyncio.CancelledError:
+            # Принудительное отключение при остановке сервера (drain_clients).
+            if not self.draining:
+                raise
+            asyncio.current_task().uncancel()
+        finally:
+            client['task'] = None
+            self.rate_limiter.release(user_nickname, address[0])
+            await self.disconnect_client(user_nickname, client)
+
+    async def start_session(
+        self,
+        frames: AsyncIterator[tuple[FrameType, memoryview]],
+        writer: asyncio.StreamWriter,
+    ) -> tuple[str, dict[str, Any]] | None:
+        """
+        Вход клиента и отправка ему непрочитанных сообщений.
+        Возвращает имя пользователя и запись клиента (None, если
+        вход не удался или соединение оборвалось).
+        """
+        address = writer.get_extra_info('peername')
+        try:
+            authenticated = await self.authenticate_client(frames, writer)
+            if authenticated is None:
+                return None
+            user_nickname, compressor = authenticated
+            return user_nickname, await self.connect_client(user_nickname, writer, compressor)
+        except FrameError as error:
+            logger.info(f'---Bad frame from {address[0]}:{address[1]}: {error}---')
+        except ConnectionError as error:
+            logger.info(f'---Connection from {address[0]}:{address[1]} lost: {error}---')
+        return None
+
+    async def connect_client(
+        self,
+        user_nickname: str,
+        writer: asyncio.StreamWriter,
+        compressor: FrameCompressor | None,
+    ) -> dict[str, Any]:
+        """
+        Отправка вошедшему клиенту непрочитанных сообщений и его
+        регистрация в connected_clients и комнатах.
+        Возвращает запись клиента.
+        """
+        # Раньше курсоры хранились в БД пользователей,
+        # а до появления комнат - только для общего чата.
+        user = self.cursors.get(user_nickname) or self.users.get(user_nickname) or {}
+        cursors: dict[str, int | None] = dict(
+            user.get('rooms') or {DEFAULT_ROOM: user.get('last_read_index')}
+        )
+        await self.send_unread_messages(user_nickname, writer, cursors, compressor)
+        client: dict[str, Any] = {
+            'writer': writer,
+            'outbound': OutboundQueue(
+                writer,
+                self.outbound_queue_size,
+                self.outbound_overflow_policy,
+                compressor if self.compress_live_traffic else None,
+            ),
+            'compressor': compressor,
+            # Задача обработчика (отменяется при остановке сервера).
+            'task': asyncio.current_task(),
+            'room': DEFAULT_ROOM,
+            'rooms': set(),
+        }
+        self.connected_clients[user_nickname] = client
+        for name in cursors:
+            self.join_room(user_nickname, name)
+        current_room = user.get('room', DEFAULT_ROOM)
+        if current_room in client['rooms']:
+            client['room'] = current_room
+        self.publish({'type': 'connected', 'user': user_nickname, 'worker': self.worker_id})
+        address = writer.get_extra_info('peername')
+        logger.info(
+            f'---User {user_nickname} is connected--- '
+            f'(ip={address[0]}, port={address[1]})'
+        )
+        return client
+
+    async def disconnect_client(self, user_nickname: str, client: dict[str, Any]) -> None:
+        """
+        Отключение клиента (при любом завершении его обработчика):
+        сохранение курсоров, выход из комнат, закрытие очереди и учет
+        ее наибольшей глубины в метриках.
+        Запись в connected_clients удаляется, только если она принадлежит
+        этому подключению (пользователь мог войти еще раз с другого клиента).
+        """
+        logger.info(f'---User {user_nickname} disconnected---')
+        cursors = {}
+        for name in client['rooms']:
+            room = self.rooms.get(name)
+            if room is None:
+                # Комнату покинул и удалил другой сеанс этого пользователя.
+                continue
+            cursors[name] = room.next_index - 1
+            if room.members.get(user_nickname) is client['outbound']:
+                del room.members[user_nickname]
+                self.reclaim_room(room)
+        self.cursors.update(
+            user_nickname,
+            rooms=cursors,
+            room=client['room'],
+            last_visit=datetime.datetime.now().timestamp(),
+        )
+        if self.draining:
+            # При остановке сервера клиент получает все сообщения,
+            # учтенные в сохраненных курсорах.
+            try:
+                await asyncio.wait_for(client['outbound'].flush(), self.shutdown_timeout)
+            except TimeoutError:
+                pass
+        client['outbound'].close()
+        self.outbound_peak_depth.observe(client['outbound'].max_depth)
+        if self.connected_clients.get(user_nickname) is client:
+            del self.connected_clients[user_nickname]
+            self.publish({'type': 'disconnected', 'user': user_nickname, 'worker': self.worker_id})
+
+    async def send_unread_messages(
+        self,
+        user_nickname: str,
+        writer: asyncio.StreamWriter,
+        cursors: dict[str, int | None],
+        compressor: FrameCompressor | None,
+    ) -> None:
+        """
+        Отправка подключившемуся клиенту непрочитанных сообщений комнат,
+        в которых он состоит (cursors - номер последнего доставленного
+        сообщения каждой комнаты или None - тогда отправляются последние
+        max_chat_messages сообщений комнаты), и накопленных приватных сообщений.
+        Сообщения отправляются пачками, повтор цикла досылает сообщения,
+        появившиеся во время отправки. Вытесненные на диск приватные
+        сообщения читаются из файла и отправляются по мере чтения.
+        Если клиент согласовал сжатие, пачки отправляются сжатыми.
+        """
+        while True:
+            frames: list[bytes] = [
+                HEADER.pack(len(payload), FrameType.HISTORY) + payload
+                for payload in self.unread_messages(cursors)
+            ]
+            private_queue, spill_path = self.private_messages.take(user_nickname)
+            if not frames and not private_queue.messages and spill_path is None:
+                break
+            frames.extend(
+                encode_frame(FrameType.PRIVATE, message) for message in private_queue.messages
             )
+            try:
+                await self.write_batched(writer, frames, compressor)
+                if spill_path is not None:
+                    for messages in self.private_messages.stream(spill_path):
+                        await self.write_batched(writer, [
+                            HEADER.pack(len(message), FrameType.PRIVATE) + message
+                            for message in messages
+                        ], compressor)
+            except BaseException:
+                # Приватные сообщения не отправлены и остаются в очереди.
+                self.private_messages.put_back(user_nickname, private_queue, spill_path)
+                raise
+            if private_queue.messages or spill_path is not None:
+                self.private_messages.delivered(user_nickname, private_queue, spill_path)
+                self.private_delivered(user_nickname, len(private_queue.messages))
 
-            if self.chat_messages:
-                for message in self.chat_messages[-self.max_chat_messages:]:
-                    writer.write(f'History!{message.text}\n'.encode())
-                    await writer.drain()
-            if self.private_messages.get(user_nickname):
-                for message in self.private_messages[user_nickname]:
-                    writer.write(f'Private!{message}\n'.encode())
-                    await writer.drain()
-                del self.private_messages[user_nickname]
-
-            while True:
-                data = await reader.read(1024)
-                if not data:
-                    break
-                message: str = data.decode().strip()
-                if user_nickname in self.claimed_users:
-                    time_left = int(
-                        (
-                            self.claimed_users[user_nickname]
-                            - datetime.datetime.now().timestamp()
-                        ) // 60 + 1
-                    )
-                    writer.write(
-                        'Server!You are not allowed to send messages'
-                        f' ({time_left} minutes left)\n'.encode()
-                    )
-                    await writer.drain()
-                    continue
+    def unread_messages(self, cursors: dict[str, int | None]) -> list[bytes]:
+        """
+        Нагрузки кадров непрочитанных сообщений комнат с продвижением
+        курсоров. Комнаты, которые нельзя создать, пропускаются.
+        """
+        unread: list[bytes] = []
+        for name, last_read_index in cursors.items():
+            room = self.get_room(name)
+            if room is None:
+                continue
+            if last_read_index is None:
+                payloads = room.messages.last(self.max_chat_messages)
+            else:
+                payloads = room.messages.since(last_read_index)
+            if payloads:
+                cursors[name] = room.messages.last_index
+                unread += payloads
+        return unread
 
-                if message.startswith('@'):
-                    await self.handle_command(message, user_nickname, writer)
-                else:
-                    self.chat_messages.append(
-                        Message(
-                            message_date := datetime.datetime.now(),
-                            index := self.message_current_index,
-                            text := (
-                                f'[{index}] ({message_date.strftime("%d.%m.%y %H:%M:%S")}) '
-                                f'{user_nickname}: {message}'
-                            )
-                        )
-                    )
-                    self.message_current_index += 1
-                    logger.info(f'new message: {text}')
-                    await self.broadcast_message(text)
+    async def write_batched(
+        self,
+        writer: asyncio.StreamWriter,
+        frames: list[bytes],
+        compressor: FrameCompressor | None = None,
+    ) -> None:
+        """
+        Отправка кадров объединенными записями размером до backlog_chunk_size
+        (каждая запись сжимается, если передан compressor).
+        """
+        chunk: list[bytes] = []
+        size: int = 0
+        for frame in frames:
+            chunk.append(frame)
+            size += len(frame)
+            if size >= self.backlog_chunk_size:
+                data = b''.join(chunk)
+                writer.write(data if compressor is None else compressor.pack(data))
                 await writer.drain()
+                chunk.clear()
+                size = 0
+        if chunk:
+            data = b''.join(chunk)
+            writer.write(data if compressor is None else compressor.pack(data))
+            await writer.drain()
 
-            logger.info(f'---User {user_nickname} disconnected---')
-            writer.close()
-            del self.connected_clients[user_nickname]
+    async def handle_frames(
+        self,
+        frames: AsyncIterator[tuple[FrameType, memoryview]],
+        user_nickname: str,
+        writer: asyncio.StreamWriter,
+        buckets: tuple[dict[str, TokenBucket], dict[str, TokenBucket]],
+    ) -> None:
+        """
+        Обработка сообщений подключенного клиента.
+        Частота сообщений проверяется до разбора текста: при превышении
+        лимита сообщение отбрасывается (о первом отброшенном подряд
+        сообщении клиент получает уведомление) либо обработка откладывается,
+        и до ее окончания новые данные от клиента не читаются.
+        """
+        take = self.rate_limiter.take
+        notified: bool = False
+        async for frame_type, payload in frames:
+            if frame_type != FrameType.CHAT:
+                continue
+            kind = traffic_kind(payload)
+            wait = take(kind, *buckets)
+            if wait:
+                if self.rate_limit_policy == 'drop':
+                    self.rate_limited['drop'] += 1
+                    if not notified:
+                        notified = True
+                        writer.write(self.rate_limited_frame)
+                    continue
+                self.rate_limited['delay'] += 1
+                while wait:
+                    await asyncio.sleep(wait)
+                    wait = take(kind, *buckets)
+            notified = False
+            message: str = str(payload, 'utf-8', 'replace').strip()
+            if user_nickname in self.claimed_users:
+                self.message_counts['rejected'] += 1
+                time_left = int(
+                    (
+                        self.claimed_users[user_nickname]
+                        - datetime.datetime.now().timestamp()
+                    ) // 60 + 1
+                )
+                writer.write(encode_frame(
+                    FrameType.SERVER,
+                    'You are not allowed to send messages'
+                    f' ({time_left} minutes left)',
+                ))
+                await writer.drain()
+                continue
+
+            if message.startswith('@'):
+                await self.handle_command(message, user_nickname, writer)
+            else:
+                self.message_counts['chat'] += 1
+                await self.add_chat_message(
+                    self.connected_clients[user_nickname]['room'], user_nickname, message,
+                )
+            await writer.drain()
+
+    async def add_chat_message(
+        self,
+        room_name: str,
+        user_nickname: str,
+        message: str,
+        parent: int | None = None,
+    ) -> None:
+        """
+        Новое сообщение комнаты (parent - номер комментируемого сообщения).
+        В многопроцессном режиме номер сообщению назначает шина,
+        а доставка выполняется по событию от нее.
+        """
+        created_at = time.time()
+        if self.bus is None:
+            await self.deliver_chat_message(
+                room_name,
+                self.rooms[room_name].next_index,
+                created_at,
+                user_nickname,
+                message,
+                parent,
+            )
+        else:
+            self.bus.publish({
+                'type': 'chat',
+                'room': room_name,
+                'created_at': created_at,
+                'user': user_nickname,
+                'message': message,
+                'parent': parent,
+            })
+
+    async def deliver_chat_message(
+        self,
+        room_name: str,
+        index: int,
+        created_at: float,
+        user_nickname: str,
+        message: str,
+        parent: int | None,
+    ) -> None:
+        """
+        Сохранение сообщения комнаты и рассылка его участникам комнаты,
+        подключенным к этому процессу.
+        Текст сообщения форматируется и кодируется один раз.
+        """
+        room = self.get_room(room_name)
+        if room is None:
+            logger.info(f'---Too many rooms, message to {room_name} dropped---')
+            return
+        payload = self.save_chat_message(room, index, created_at, user_nickname, message, parent)
+        room.next_index = index + 1
+        logger.debug('new message: %r', payload)
+        await self.broadcast_message(payload, room)
+
+    async def authenticate_client(
+        self,
+        frames: AsyncIterator[tuple[FrameType, memoryview]],
+        writer: asyncio.StreamWriter,
+    ) -> tuple[str, FrameCompressor | None] | None:
+        """
+        Вход или регистрация клиента.
+        Первый кадр от клиента (AUTH): 'login <username> <password>'
+        или 'register <username> <password>', в конце может быть
+        предложение сжатия 'compress=<алгоритм>,<алгоритм>'; сервер
+        отвечает кадром AUTH с текстом 'OK' (или 'OK compress=<алгоритм>',
+        если сжатие согласовано) либо описанием ошибки.
+        Возвращает имя пользователя и сжатие для его подключения
+        (или None при неудаче).
+        """
+        frame = await anext(frames, None)
+        if frame is None:
+            return None
+        frame_type, payload = frame
+        tokens: list[str] = str(payload, 'utf-8', 'replace').split()
+        if (
+            frame_type != FrameType.AUTH
+            or len(tokens) not in (3, 4)
+            or tokens[0] not in ('login', 'register')
+        ):
+            writer.write(encode_frame(FrameType.AUTH, 'Wrong command format!'))
+            await writer.drain()
+            return None
+
+        command, username, password = tokens[:3]
+        if command == 'login':
+            if not await self.auth.login(username, password):
+                writer.write(encode_frame(FrameType.AUTH, 'Invalid username or password!'))
+                await writer.drain()
+                return None
+        elif not await self.auth.register(username, password):
+            writer.write(encode_frame(FrameType.AUTH, 'This name already occupied!'))
+            await writer.drain()
+            return None
+        algorithm = negotiate_compression(tokens[3], self.compression) if len(tokens) == 4 else None
+        if algorithm is None:
+            writer.write(encode_frame(FrameType.AUTH, 'OK'))
+            await writer.drain()
+            return username, None
+        writer.write(encode_frame(FrameType.AUTH, f'OK {COMPRESS_OPTION}{algorithm}'))
+        await writer.drain()
+        return username, FrameCompressor(
+            algorithm,
+            self.compression_level,
+            self.compression_threshold,
+            self.compression_window_bits,
+            self.compressed_bytes,
+        )
 
     async def handle_command(
         self,
@@ -124,12 +809,22 @@ class Server:
         Обработка команд мессенджера.
         """
         if message == '@help':
+            self.message_counts['help'] += 1
             await self.send_help_message(writer)
         elif message.startswith('@comment'):
+            self.message_counts['comment'] += 1
             await self.send_comment_message(message, user_nickname, writer)
         elif message.startswith('@claim'):
+            self.message_counts['claim'] += 1
             await self.add_claim_to_user(message, user_nickname, writer)
+        elif message.split(' ', 1)[0] == '@search':
+            self.message_counts['search'] += 1
+            await self.send_search_results(message, user_nickname, writer)
+        elif message.split(' ', 1)[0] in ('@join', '@leave', '@rooms'):
+            self.message_counts['room'] += 1
+            await self.handle_room_command(message, user_nickname, writer)
         else:
+            self.message_counts['private'] += 1
             await self.send_private_message(message, user_nickname, writer)
 
     async def send_comment_message(
@@ -144,32 +839,129 @@ class Server:
         tokens = message[:].removeprefix('@comment').split(' ', 1)
         if len(tokens) == 2:
             number, comment_text = tokens
-            founded_message: bool = False
-            for message in self.chat_messages:
-                if message.index == int(number):
-                    founded_message = True
-                    text = message.text
-                    self.chat_messages.append(
-                        Message(
-                            message_date := datetime.datetime.now(),
-                            index := self.message_current_index,
-                            text := (
-                                f'Commenting <{text}>\n'
-                                f'[{index}] ({message_date.strftime("%d.%m.%y %H:%M:%S")}) '
-                                f'{user_nickname}: {comment_text}'
-                            )
-                        )
-                    )
-                    self.message_current_index += 1
-                    logger.info(f'new message: {text}')
-                    await self.broadcast_message(text)
-                await writer.drain()
-            if not founded_message:
-                writer.write('Server!Message not found or deleted!\n'.encode())
-                await writer.drain()
+            room_name = self.connected_clients[user_nickname]['room']
+            if (
+                number.isascii() and number.isdigit()
+                and int(number) in self.rooms[room_name].messages
+            ):
+                await self.add_chat_message(room_name, user_nickname, comment_text, int(number))
+                await self.drain(writer, 'send_comment_message')
+            else:
+                writer.write(encode_frame(FrameType.SERVER, 'Message not found or deleted!'))
+                await self.drain(writer, 'send_comment_message')
         else:
-            writer.write('Server!Don\'t use @ symbol if its not a command!\n'.encode())
-            await writer.drain()
+            writer.write(encode_frame(
+                FrameType.SERVER,
+                'Don\'t use @ symbol if its not a command!',
+            ))
+            await self.drain(writer, 'send_comment_message')
+
+    async def send_search_results(
+        self,
+        message: str,
+        user_nickname: str,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """
+        Поиск по истории текущей комнаты: '@search [from:<автор>] [page:<n>]
+        <слова или "фраза">'. Найденные сообщения отправляются кадрами
+        истории от новых к старым, по search_page_size на странице.
+        Общее количество найденных сообщений не считается: поиск
+        останавливается, как только набрана запрошенная страница.
+        """
+        query = parse_query(message.removeprefix('@search'))
+        room = self.rooms[self.connected_clients[user_nickname]['room']]
+        if not query.terms and query.author is None:
+            writer.write(encode_frame(
+                FrameType.SERVER,
+                'Usage: @search [from:<user>] [page:<n>] <words or "phrase">',
+            ))
+            await self.drain(writer, 'send_search_results')
+            return
+        if room.messages.search_index is None:
+            writer.write(encode_frame(FrameType.SERVER, 'Search is disabled'))
+            await self.drain(writer, 'send_search_results')
+            return
+        size = self.search_page_size
+        # Одно лишнее сообщение показывает, есть ли следующая страница.
+        found = room.messages.search(query, query.page * size + 1)
+        page = found[(query.page - 1) * size:query.page * size]
+        more = ', more on the next page' if len(found) > query.page * size else ''
+        frames: list[bytes] = [encode_frame(
+            FrameType.SERVER,
+            f'Search in {room.name}, page {query.page}: {len(page)} messages{more}',
+        )]
+        for index in page:
+            payload = room.messages.payload(index)
+            frames.append(HEADER.pack(len(payload), FrameType.HISTORY) + payload)
+        compressor = self.connected_clients[user_nickname]['compressor']
+        data = b''.join(frames)
+        writer.write(data if compressor is None else compressor.pack(data))
+        await self.drain(writer, 'send_search_results')
+
+    async def handle_room_command(
+        self,
+        message: str,
+        user_nickname: str,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """
+        Команды комнат: '@join <комната>' - вход в комнату (или переход
+        в комнату, в которой пользователь уже состоит) с отправкой ее истории,
+        '@leave [<комната>]' - выход из комнаты (по умолчанию текущей),
+        '@rooms' - список комнат.
+        """
+        command, _, name = message.partition(' ')
+        name = name.strip()
+        client = self.connected_clients[user_nickname]
+        frames: list[bytes] = []
+        if command == '@rooms':
+            rooms = sorted(
+                self.rooms.values(), key=lambda room: len(room.members), reverse=True,
+            )[:ROOMS_LISTED]
+            listed = ', '.join(f'{room.name} ({len(room.members)})' for room in rooms)
+            frames.append(encode_frame(FrameType.SERVER, f'Rooms (members online): {listed}'))
+            frames.append(encode_frame(
+                FrameType.SERVER,
+                f'Your rooms: {", ".join(sorted(client["rooms"]))}; '
+                f'messages go to {client["room"]}',
+            ))
+        elif command == '@leave':
+            name = name or client['room']
+            if name == DEFAULT_ROOM:
+                frames.append(encode_frame(FrameType.SERVER, 'You can\'t leave the general room'))
+            elif name not in client['rooms']:
+                frames.append(encode_frame(FrameType.SERVER, f'You are not in room {name}'))
+            else:
+                client['rooms'].discard(name)
+                room = self.rooms[name]
+                del room.members[user_nickname]
+                self.reclaim_room(room)
+                if client['room'] == name:
+                    client['room'] = DEFAULT_ROOM
+                frames.append(encode_frame(
+                    FrameType.SERVER, f'You left room {name}, messages go to {client["room"]}',
+                ))
+        elif not valid_room_name(name):
+            frames.append(encode_frame(
+                FrameType.SERVER, 'Room name is 1-32 letters, digits, "_" or "-"',
+            ))
+        elif name in client['rooms']:
+            client['room'] = name
+            frames.append(encode_frame(FrameType.SERVER, f'Messages go to room {name}'))
+        else:
+            room = self.join_room(user_nickname, name)
+            if room is None:
+                frames.append(encode_frame(FrameType.SERVER, 'Too many rooms!'))
+            else:
+                frames.extend(
+                    HEADER.pack(len(payload), FrameType.HISTORY) + payload
+                    for payload in room.messages.last(self.max_chat_messages)
+                )
+                frames.append(encode_frame(
+                    FrameType.SERVER, f'You joined room {name}, messages go to it',
+                ))
+        await self.write_batched(writer, frames, client['compressor'])
 
     async def add_claim_to_user(
         self,
@@ -183,23 +975,57 @@ class Server:
         tokens = message[1:].split(' ', 1)
         if len(tokens) == 2:
             recipient = tokens[1]
-            if recipient in self.connected_clients:
-                self.claims[recipient] = self.claims.get(recipient, 0) + 1
-                if self.claims[recipient] == 3:
-                    del self.claims[recipient]
-                    self.claimed_users[recipient] = (
-                        datetime.datetime.now().timestamp()
-                        + self.time_of_ban
-                    )
-                writer.write(f'Server!User {recipient} claimed by {user_nickname}\n'.encode())
+            if self.is_connected(recipient):
+                claimed_at: float = datetime.datetime.now().timestamp()
+                self.apply_claim(recipient, claimed_at)
+                self.publish({'type': 'claim', 'recipient': recipient, 'claimed_at': claimed_at})
+                writer.write(encode_frame(
+                    FrameType.SERVER,
+                    f'User {recipient} claimed by {user_nickname}',
+                ))
                 await writer.drain()
             else:
-                writer.write(f'Server!User {recipient} is not connected\n'.encode())
+                writer.write(encode_frame(FrameType.SERVER, f'User {recipient} is not connected'))
                 await writer.drain()
         else:
-            writer.write('Server!Don\'t use @ symbol if its not a command!\n'.encode())
+            writer.write(encode_frame(
+                FrameType.SERVER,
+                'Don\'t use @ symbol if its not a command!',
+            ))
             await writer.drain()
 
+    def apply_claim(self, recipient: str, claimed_at: float) -> None:
+        """
+        Учет жалобы на пользователя; после третьей жалобы пользователь
+        блокируется на time_of_ban секунд.
+        """
+        self.claims[recipient] = self.claims.get(recipient, 0) + 1
+        if self.claims[recipient] == 3:
+            del self.claims[recipient]
+            self.ban_user(recipient, claimed_at + self.time_of_ban)
+            self.message_log.append(
+                LogRecordType.BAN, [recipient, self.claimed_users[recipient]],
+            )
+        else:
+            self.message_log.append(
+                LogRecordType.CLAIM, [recipient, self.claims[recipient]],
+            )
+
+    def ban_user(self, user_nickname: str, until: float) -> None:
+        """
+        Блокировка пользователя до момента until (timestamp).
+        """
+        self.claimed_users[user_nickname] = until
+        self.scheduler.call_later(until - time.time(), self.lift_ban, user_nickname, until)
+
+    def lift_ban(self, user_nickname: str, until: float) -> None:
+        """
+        Снятие блокировки, если она не была продлена.
+        """
+        if self.claimed_users.get(user_nickname) == until:
+            del self.claimed_users[user_nickname]
+            logger.info(f'---User {user_nickname} is unbanned---')
+
     async def send_private_message(
         self,
         message: str,
@@ -213,96 +1039,409 @@ class Server:
         if len(tokens) == 2:
             recipient, private_message = tokens
             private_message: str = (
-                f'Private!({datetime.datetime.now().strftime("%d.%m.%y %H:%M:%S")}) '
-                f'{user_nickname}: {private_message}\n'
+                f'({datetime.datetime.now().strftime("%d.%m.%y %H:%M:%S")}) '
+                f'{user_nickname}: {private_message}'
             )
-            if recipient in self.connected_clients:
-                recipient_writer = self.connected_clients[recipient].get('writer')
-                recipient_writer.write(
-                    private_message.encode()
-                )
-                writer.write(f'Server!Private message was sent to {recipient}\n'.encode())
-                await recipient_writer.drain()
+            if self.is_connected(recipient):
+                if recipient in self.connected_clients:
+                    await self.deliver_private_message(recipient, private_message)
+                else:
+                    self.publish({
+                        'type': 'private', 'recipient': recipient, 'message': private_message,
+                    })
+                writer.write(encode_frame(
+                    FrameType.SERVER,
+                    f'Private message was sent to {recipient}',
+                ))
+                await self.drain(writer, 'send_private_message')
             else:
-                user_exists = False
-                for user in load_user_database(self.user_database_filename):
-                    if user['username'] == recipient:
-                        user_exists = True
-                        break
-                if not user_exists:
-                    writer.write(f'Server!User {recipient} is not registered\n'.encode())
-                    await writer.drain()
+                if (
+                    recipient not in self.users
+                    and await self.users.lookup(recipient) is None
+                ):
+                    writer.write(encode_frame(
+                        FrameType.SERVER,
+                        f'User {recipient} is not registered',
+                    ))
+                    await self.drain(writer, 'send_private_message')
+                elif self.queue_private_message(recipient, private_message):
+                    writer.write(encode_frame(
+                        FrameType.SERVER,
+                        f'User {recipient} is not connected',
+                    ))
+                    await self.drain(writer, 'send_private_message')
                 else:
-                    writer.write(f'Server!User {recipient} is not connected\n'.encode())
-                    await writer.drain()
-                    self.private_messages.setdefault(recipient, []).append(private_message)
+                    writer.write(encode_frame(
+                        FrameType.SERVER,
+                        f'User {recipient} is not connected, mailbox is full',
+                    ))
+                    await self.drain(writer, 'send_private_message')
         else:
-            writer.write('Server!Don\'t use @ symbol if its not a command!\n'.encode())
-            await writer.drain()
+            writer.write(encode_frame(
+                FrameType.SERVER,
+                'Don\'t use @ symbol if its not a command!',
+            ))
+            await self.drain(writer, 'send_private_message')
+
+    async def deliver_private_message(self, recipient: str, message: str) -> None:
+        """
+        Доставка приватного сообщения клиенту, подключенному к этому процессу
+        (или постановка в очередь, если клиент уже отключился).
+        """
+        if recipient in self.connected_clients:
+            await self.connected_clients[recipient]['outbound'].put(
+                encode_frame(FrameType.PRIVATE, message)
+            )
+        else:
+            self.queue_private_message(recipient, message)
+
+    def queue_private_message(self, recipient: str, message: str, publish: bool = True) -> bool:
+        """
+        Сохранение приватного сообщения для отключенного пользователя.
+        В журнал записываются только сообщения, оставленные в памяти
+        (вытесненные на диск хранятся в файле получателя).
+        Возвращает False, если очередь получателя переполнена.
+        """
+        in_memory = self.private_messages.put(recipient, message)
+        if in_memory is None:
+            logger.info(f'---Private queue of {recipient} is full, message dropped---')
+            return False
+        if in_memory:
+            self.message_log.append(LogRecordType.PRIVATE, [recipient, message])
+        if publish:
+            self.publish({'type': 'private_queued', 'recipient': recipient, 'message': message})
+        return True
+
+    def private_delivered(self, recipient: str, count: int) -> None:
+        """
+        Запись в журнал и отправка другим процессам сведений о доставке
+        первых count приватных сообщений получателя (из памяти)
+        и его вытесненных на диск сообщений.
+        """
+        self.message_log.append(LogRecordType.PRIVATE_DELIVERED, [recipient, count])
+        self.publish({'type': 'private_delivered', 'recipient': recipient, 'count': count})
+
+    def log_expired_private_messages(self, recipient: str, count: int) -> None:
+        """
+        Запись в журнал об удалении истекших приватных сообщений из памяти.
+        """
+        self.message_log.append(LogRecordType.PRIVATE_EXPIRED, [recipient, count])
+
+    def is_connected(self, user_nickname: str) -> bool:
+        """
+        Подключен ли пользователь к этому или другому рабочему процессу.
+        """
+        return user_nickname in self.connected_clients or user_nickname in self.remote_clients
+
+    def publish(self, event: dict[str, Any]) -> None:
+        """
+        Отправка события другим рабочим процессам (в многопроцессном режиме).
+        """
+        if self.bus is not None:
+            self.bus.publish(event)
+
+    async def handle_bus_event(self, event: dict[str, Any]) -> None:
+        """
+        Обработка события, полученного от других рабочих процессов.
+        """
+        event_type = event['type']
+        if event_type == 'chat':
+            await self.deliver_chat_message(
+                event['room'],
+                event['index'],
+                event['created_at'],
+                event['user'],
+                event['message'],
+                event['parent'],
+            )
+        elif event_type == 'private':
+            await self.deliver_private_message(event['recipient'], event['message'])
+        elif event_type == 'private_queued':
+            self.queue_private_message(event['recipient'], event['message'], publish=False)
+        elif event_type == 'private_delivered':
+            count = self.private_messages.discard(event['recipient'], event['count'])
+            if count:
+                self.message_log.append(
+                    LogRecordType.PRIVATE_DELIVERED, [event['recipient'], count],
+                )
+        elif event_type == 'claim':
+            self.apply_claim(event['recipient'], event['claimed_at'])
+        elif event_type == 'connected':
+            self.remote_clients[event['user']] = event['worker']
+        elif event_type == 'disconnected':
+            if self.remote_clients.get(event['user']) == event['worker']:
+                del self.remote_clients[event['user']]
 
     async def send_help_message(self, writer: asyncio.StreamWriter) -> None:
         """
         Отсылает пользователю сообщение справки.
         """
-        writer.write(self.help_message.encode())
+        writer.write(self.help_frames)
         await writer.drain()
 
-    async def broadcast_message(self, message: str) -> None:
+    async def broadcast_message(self, message: str | bytes, room: Room) -> None:
         """
-        Рассылка сообщения всем пользователям чата.
+        Рассылка сообщения участникам комнаты, подключенным к этому процессу.
         """
-        for _, client_writer in self.connected_clients.items():
-            client_writer.get('writer').write(f'Chat!{message}\n'.encode())
-            await client_writer.get('writer').drain()
+        payload: bytes = encode_frame(FrameType.CHAT, message)
+        started = time.perf_counter()
+        for outbound in list(room.members.values()):
+            await outbound.put(payload)
+        self.drain_wait['broadcast_message'].observe(time.perf_counter() - started)
 
-    async def check_and_delete_old_messages(self) -> None:
+    async def drain(self, writer: asyncio.StreamWriter, handler: str) -> None:
         """
-        Проверка и удаление старых сообщений.
+        Ожидание отправки данных клиенту с учетом времени ожидания в метриках.
         """
-        while True:
-            await asyncio.sleep(10)
-            current_time = datetime.datetime.now()
-            while True:
-                for message in self.chat_messages:
-                    if (current_time - message[0]).total_seconds() > self.message_ttl:
-                        self.chat_messages.remove(message)
-                    else:
-                        break
-                break
+        started = time.perf_counter()
+        await writer.drain()
+        self.drain_wait[handler].observe(time.perf_counter() - started)
 
-    async def check_users_claims(self) -> None:
+    def outbound_queue_stats(self) -> dict[str, int]:
         """
-        Проверяет пользователей с жалобами.
-        Раз в минуту проверяет пользователей с жалобами.
+        Суммарная и максимальная глубина очередей исходящих сообщений.
+        """
+        depths = self.outbound_queue_depths().values()
+        return {'sum': sum(depths), 'max': max(depths, default=0)}
+
+    def outbound_queue_depths(self) -> dict[str, int]:
+        """
+        Текущая глубина очереди исходящих сообщений каждого клиента.
+        """
+        return {
+            user_nickname: client['outbound'].depth
+            for user_nickname, client in self.connected_clients.items()
+        }
+
+    async def save_cursors(self) -> None:
+        """
+        Периодическая запись изменений курсоров пользователей на диск
+        и перечитывание БД пользователей, если ее изменил другой процесс
+        (например, при регистрации на другом рабочем процессе).
         """
         while True:
-            await asyncio.sleep(30)
-            if self.claimed_users:
-                revealed: list[str | None] = []
-                for user in self.claimed_users:
-                    if (datetime.datetime.now().timestamp() > self.claimed_users[user]):
-                        self.claimed_users[user] = None
-                        revealed.append(user)
-                        logger.info(user)
-                if revealed:
-                    for revealed_user in revealed:
-                        del self.claimed_users[revealed_user]
+            await asyncio.sleep(self.user_database_save_interval)
+            await self.cursors.flush()
+            await self.users.refresh()
+
+    async def drain_clients(self) -> None:
+        """
+        Отключение клиентов при остановке сервера. Клиенты получают
+        уведомление и в течение shutdown_grace секунд могут отключиться сами;
+        их сообщения, полученные до отключения, обрабатываются как обычно.
+        Затем обработчики оставшихся клиентов отменяются. При отключении
+        курсоры клиента сохраняются, а очередь исходящих сообщений
+        отправляется (не дольше shutdown_timeout).
+        """
+        self.draining = True
+        for client in self.connected_clients.values():
+            client['outbound'].put_nowait(self.restarting_frame)
+        deadline = time.monotonic() + self.shutdown_grace
+        while self.connected_clients and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        for client in self.connected_clients.values():
+            if client['task'] is not None:
+                client['task'].cancel()
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self.connected_clients and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+    async def start_servers(self) -> list[asyncio.Server]:
+        """
+        Открытие порта для клиентов (или использование слушающих сокетов,
+        полученных от прежнего процесса сервера).
+        """
+        loop = asyncio.get_running_loop()
+        if self.server_backend == 'protocol':
+            if self.listen_sockets:
+                return [
+                    await loop.create_server(
+                        self.create_protocol, sock=sock, backlog=self.listen_backlog,
+                    )
+                    for sock in self.listen_sockets
+                ]
+            return [await loop.create_server(
+                self.create_protocol, self.host, self.port,
+                reuse_port=self.bus is not None, backlog=self.listen_backlog,
+            )]
+        if self.listen_sockets:
+            return [
+                await asyncio.start_server(
+                    self.client_connected, sock=sock, backlog=self.listen_backlog,
+                )
+                for sock in self.listen_sockets
+            ]
+        return [await asyncio.start_server(
+            self.client_connected, self.host, self.port,
+            reuse_port=self.bus is not None, backlog=self.listen_backlog,
+        )]
 
     async def listen(self) -> None:
         """
         Запуск сервера.
+        По SIGHUP перечитываются настройки, по SIGTERM сервер плавно
+        останавливается (drain_clients) и записывает снимок состояния.
+        Если запущен новый процесс сервера (handover_socket_path), ему
+        передаются слушающие сокеты, после чего этот процесс так же
+        останавливается; новый процесс загружает снимок и принимает
+        подключения, ожидавшие в очереди сокета.
         """
-        srv = await asyncio.start_server(self.client_connected, self.host, self.port)
-        async with srv:
-            logger.info('Server started on %s:%s', self.host, self.port)
-            tasks = [
-                asyncio.create_task(self.check_and_delete_old_messages()),
-                asyncio.create_task(self.check_users_claims()),
-                srv.serve_forever(),
+        self.message_log.open()
+        tasks: list[Awaitable[Any]] = []
+        if self.worker_id is not None:
+            self.bus = BusClient(self.bus_socket_path, self.worker_id, self.handle_bus_event)
+            await self.bus.connect(
+                {name: room.next_index for name, room in self.rooms.items()},
+                self.room_index_floor,
+            )
+            tasks.append(asyncio.create_task(self.bus.listen()))
+        servers = await self.start_servers()
+        self.scheduler.start()
+        loop = asyncio.get_running_loop()
+        stop = loop.create_future()
+        loop.add_signal_handler(signal.SIGHUP, self.reload_settings)
+        loop.add_signal_handler(signal.SIGTERM, lambda: stop.done() or stop.set_result(None))
+        handover: asyncio.Task[socket.socket] | None = None
+        successor: socket.socket | None = None
+        stopped: bool = False
+        try:
+            logger.info(
+                'Server started on %s:%s (%s backend, %s)', self.host, self.port,
+                self.server_backend, type(loop).__module__,
+            )
+            if self.admin_port:
+                admin = await asyncio.start_server(
+                    self.metrics.handle_admin, self.admin_host, self.admin_port,
+                )
+                tasks.append(admin.serve_forever())
+            if self.handover_socket_path and self.worker_id is None:
+                handover = asyncio.create_task(wait_for_handover(
+                    self.handover_socket_path,
+                    {socket_address(sock) for srv in servers for sock in srv.sockets},
+                ))
+            tasks += [
+                asyncio.create_task(self.metrics.monitor_loop_lag(self.loop_lag_interval)),
+                asyncio.create_task(self.save_cursors()),
+                asyncio.create_task(self.message_log.flush_loop()),
+                *(srv.serve_forever() for srv in servers),
             ]
-            await asyncio.gather(*tasks)
+            serving = asyncio.gather(*tasks)
+            await asyncio.wait(
+                [serving, stop] + ([handover] if handover is not None else []),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if serving.done():
+                serving.result()
+            started = time.perf_counter()
+            if handover is not None and handover.done():
+                successor = handover.result()
+                hand_over(successor, [sock for srv in servers for sock in srv.sockets])
+            for srv in servers:
+                srv.close()
+            await self.drain_clients()
+            serving.cancel()
+            await asyncio.gather(serving, return_exceptions=True)
+            stopped = True
+        finally:
+            for srv in servers:
+                srv.close()
+            if handover is not None:
+                handover.cancel()
+            self.scheduler.stop()
+            if stopped:
+                self.message_log.checkpoint()
+                logger.info(
+                    '---Server stopped in %.3f s (handover: %s)---',
+                    time.perf_counter() - started, successor is not None,
+                )
+            else:
+                self.message_log.close()
+            self.cursors.close()
+            self.auth.close()
+            if successor is not None:
+                finish_handover(successor)
 
 
-if __name__ == '__main__':
-    server = Server()
+def run_server(server: Server) -> None:
+    """
+    Запуск сервера в цикле событий: для server_backend='protocol'
+    используется uvloop, если он установлен (и не отключен use_uvloop).
+    """
+    if server.server_backend == 'protocol' and server.use_uvloop and not install_uvloop():
+        logger.info('uvloop is not installed, using the asyncio event loop')
     asyncio.run(server.listen())
+
+
+def run_worker(worker_id: int) -> None:
+    """
+    Запуск рабочего процесса сервера.
+    """
+    server = Server(worker_id)
+    try:
+        run_server(server)
+    except ConnectionError as error:
+        logger.info(f'---Worker {worker_id} stopped: {error}---')
+
+
+async def serve_bus(bus: MessageBus, processes: list[multiprocessing.Process]) -> None:
+    """
+    Работа шины до SIGTERM. Сигнал пересылается рабочим процессам;
+    пока они плавно останавливаются (drain_clients и снимок журнала),
+    шина продолжает работать и останавливается после их завершения.
+    """
+    loop = asyncio.get_running_loop()
+    stop = loop.create_future()
+    loop.add_signal_handler(signal.SIGTERM, lambda: stop.done() or stop.set_result(None))
+    serving = asyncio.create_task(bus.serve())
+    try:
+        await asyncio.wait([serving, stop], return_when=asyncio.FIRST_COMPLETED)
+        if serving.done():
+            serving.result()
+        logger.info('---Stopping %d workers---', len(processes))
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            await asyncio.to_thread(process.join)
+    finally:
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+
+
+def run_workers(workers: int, bus_socket_path: str) -> None:
+    """
+    Многопроцессный режим: рабочие процессы принимают подключения на одном
+    порту (SO_REUSEPORT) и обмениваются событиями через шину,
+    которая работает в текущем процессе. По SIGTERM рабочие процессы
+    останавливаются так же, как сервер в однопроцессном режиме.
+    """
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=run_worker, args=(worker_id,))
+        for worker_id in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        asyncio.run(serve_bus(MessageBus(bus_socket_path, workers), processes))
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+
+if __name__ == '__main__':
+    app_settings = AppSettings()
+    if app_settings.workers > 1:
+        run_workers(app_settings.workers, app_settings.bus_socket_path)
+    else:
+        # Если сервер уже запущен, он передает этому процессу слушающие
+        # сокеты и сохраняет состояние, которое затем загружает Server().
+        sockets = (
+            take_over(
+                app_settings.handover_socket_path, app_settings.host, app_settings.port,
+                3 * app_settings.shutdown_timeout,
+            )
+            if app_settings.handover_socket_path else []
+        )
+        run_server(Server(sockets=sockets))
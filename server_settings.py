@@ -1,31 +1,88 @@
-from collections import namedtuple
 from typing import Any
 
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
-Message = namedtuple('Message', ['date', 'index', 'text'])
+from chat_protocol import ServerBackend
+from compression import CompressionAlgorithm
+from framing import MAX_FRAME_SIZE
+from message_log import FsyncPolicy
+from outbound import OverflowPolicy
+from rate_limit import RateLimitPolicy, RateLimits
 
 
 class AppSettings(BaseSettings):
     """
     Настройки приложения сервера.
+    Значения берутся из переменных окружения и файла .env;
+    часть настроек перечитывается по сигналу SIGHUP (Server.reload_settings).
     """
+    model_config = SettingsConfigDict(env_file='.env')
+
     message_current_index: int = 0
     host: str = '127.0.0.1'
     port: int = '8000'
     max_chat_messages: int = 100
     message_ttl: int = 10
+    max_rooms: int = 1000
+    search_index: bool = True
+    search_page_size: int = 10
     claims: dict[str, int] = {}
     time_of_ban: int = 120
-    private_messages: dict[str, Any] = {}
-    chat_messages: list[Message | None] = []
     connected_clients: dict[str, Any] = {}
     claimed_users: dict[str, int] = {}
+    private_message_ttl: int = 7 * 24 * 60 * 60
+    private_queue_max_messages: int = 20
+    private_queue_max_bytes: int = 4 * 1024
+    private_spill_max_bytes: int = 1024 * 1024
+    private_spill_dir: str = 'private_spill'
+    rate_limits: RateLimits = {'chat': (5, 20), 'private': (5, 20), 'command': (2, 10)}
+    ip_rate_limits: RateLimits = {
+        'chat': (200, 400), 'private': (200, 400), 'command': (50, 100),
+    }
+    rate_limit_policy: RateLimitPolicy = 'delay'
     help_message: str = (
-        'help!@<username> <message> -> send private message to user\n'
-        'help!@help -> show this message\n'
-        'help!@claim<username> -> claim a user\n'
-        'help!@comment<message id> <new message> -> comment a message\n'
-        'help!@exit -> exit from the messenger\n'
+        '@<username> <message> -> send private message to user\n'
+        '@help -> show this message\n'
+        '@claim<username> -> claim a user\n'
+        '@comment<message id> <new message> -> comment a message in the current room\n'
+        '@join <room> -> join a room (or switch to it) and send messages there\n'
+        '@leave [<room>] -> leave a room (the current one by default)\n'
+        '@rooms -> list rooms\n'
+        '@search [from:<user>] [page:<n>] <words or "phrase"> -> search the current room\n'
+        '@exit -> exit from the messenger\n'
     )
     user_database_filename: str = 'users_database.json'
+    user_database_save_interval: int = 5
+    user_cursors_dir: str = 'user_cursors'
+    password_hash_iterations: int = 200_000
+    credential_cache_ttl: int = 300
+    auth_workers: int | None = None
+    max_frame_size: int = MAX_FRAME_SIZE
+    outbound_queue_size: int = 1000
+    outbound_overflow_policy: OverflowPolicy = 'drop_oldest'
+    backlog_chunk_size: int = 64 * 1024
+    compression: list[CompressionAlgorithm] = ['zlib-stream', 'zlib']
+    compression_level: int = 1
+    compression_threshold: int = 512
+    compression_window_bits: int = 12
+    compress_live_traffic: bool = False
+    server_backend: ServerBackend = 'streams'
+    use_uvloop: bool = True
+    write_buffer_high_water: int = 64 * 1024
+    write_buffer_low_water: int = 16 * 1024
+    workers: int = 1
+    bus_socket_path: str = 'message_bus.sock'
+    handover_socket_path: str = ''
+    shutdown_grace: float = 1.0
+    shutdown_timeout: float = 10.0
+    listen_backlog: int = 1024
+    admin_host: str = '127.0.0.1'
+    admin_port: int = 8001
+    loop_lag_interval: float = 0.5
+    profiler_interval: float = 0.005
+    message_log_dir: str = 'message_log'
+    message_log_segment_size: int = 8 * 1024 * 1024
+    message_log_segments_to_keep: int = 3
+    message_log_flush_interval: float = 0.05
+    message_log_fsync: FsyncPolicy = 'interval'
+    message_log_fsync_interval: float = 1.0
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable
+
+import pytest
+
+from auth import HASH_ALGORITHM, Authenticator, hash_password, verify_password
+from server_settings import AppSettings
+from user_registry import UserRegistry, save_users
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ITERATIONS: int = 1000
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """
+    Пул потоков вместо пула процессов хеширования: считает вызовы.
+    """
+    def __init__(self) -> None:
+        super().__init__(1)
+        self.calls: list[str] = []
+
+    def submit(self, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        self.calls.append(function.__name__)
+        return super().submit(function, *args, **kwargs)
+
+
+def authenticator(
+    tmp_path: Path, users: list[dict[str, Any]], cache_ttl: int = 300,
+) -> tuple[Authenticator, CountingExecutor]:
+    """
+    Аутентификатор с БД пользователей users во временном каталоге.
+    """
+    filename = str(tmp_path / 'users_database.json')
+    save_users(filename, users)
+    auth = Authenticator(UserRegistry(filename), ITERATIONS, cache_ttl, 1)
+    auth.pool.shutdown()
+    auth.pool = executor = CountingExecutor()
+    return auth, executor
+
+
+def test_hash_and_verify() -> None:
+    """
+    Хеш PBKDF2 содержит число итераций и случайную соль
+    и проверяется только с верным паролем.
+    """
+    password_hash = hash_password('secret', ITERATIONS)
+    algorithm, iterations, salt, digest = password_hash.split('$')
+    assert (algorithm, iterations) == (HASH_ALGORITHM, str(ITERATIONS))
+    assert len(bytes.fromhex(salt)) == 16 and len(bytes.fromhex(digest)) == 32
+    assert password_hash != hash_password('secret', ITERATIONS)
+    assert verify_password('secret', password_hash)
+    assert not verify_password('Secret', password_hash)
+    assert not verify_password('', password_hash)
+
+
+def test_verify_plaintext() -> None:
+    """
+    Пароль, сохраненный до введения хеширования, сравнивается напрямую.
+    """
+    assert verify_password('secret', 'secret')
+    assert not verify_password('secre', 'secret')
+    assert not verify_password('pbkdf2_sha256', 'secret')
+
+
+def test_plaintext_login_rehashes(tmp_path: Path) -> None:
+    """
+    После входа с паролем, сохраненным открытым текстом, в БД
+    записывается его хеш; неверный пароль хеш не меняет.
+    """
+    auth, executor = authenticator(tmp_path, [{'username': 'alice', 'password': 'secret'}])
+
+    async def run() -> None:
+        assert not await auth.login('alice', 'wrong')
+        assert auth.users.get('alice')['password'] == 'secret'
+        assert await auth.login('alice', 'secret')
+        assert not await auth.login('bob', 'secret')
+
+    asyncio.run(run())
+    auth.close()
+    assert executor.calls == ['verify_password', 'verify_password', 'hash_password']
+    with open(auth.users.filename) as file:
+        [user] = json.load(file)
+    assert user['password'].startswith(f'{HASH_ALGORITHM}${ITERATIONS}$')
+    assert verify_password('secret', user['password'])
+
+
+def test_cache_hit(tmp_path: Path) -> None:
+    """
+    Повторный вход с проверенным паролем не хеширует пароль;
+    неверный пароль, смена хеша и истечение срока кеша
+    требуют проверки заново.
+    """
+    password_hash = hash_password('secret', ITERATIONS)
+    auth, executor = authenticator(tmp_path, [{'username': 'alice', 'password': password_hash}])
+
+    async def run() -> None:
+        assert await auth.login('alice', 'secret')
+        assert await auth.login('alice', 'secret')
+        assert executor.calls == ['verify_password']
+        assert not await auth.login('alice', 'wrong')
+        assert len(executor.calls) == 2
+        await auth.users.set_password('alice', hash_password('secret', ITERATIONS))
+        assert await auth.login('alice', 'secret')
+        assert len(executor.calls) == 3
+
+    asyncio.run(run())
+    auth.close()
+
+
+def test_cache_expiry(tmp_path: Path) -> None:
+    """
+    С нулевым сроком кеша каждый вход проверяет пароль.
+    """
+    password_hash = hash_password('secret', ITERATIONS)
+    auth, executor = authenticator(
+        tmp_path, [{'username': 'alice', 'password': password_hash}], cache_ttl=0,
+    )
+
+    async def run() -> None:
+        assert await auth.login('alice', 'secret')
+        assert await auth.login('alice', 'secret')
+
+    asyncio.run(run())
+    auth.close()
+    assert executor.calls == ['verify_password', 'verify_password']
+
+
+def test_register(tmp_path: Path) -> None:
+    """
+    Новый пользователь сохраняется с хешем пароля и сразу может войти;
+    занятое имя не регистрируется повторно.
+    """
+    auth, executor = authenticator(tmp_path, [])
+
+    async def run() -> None:
+        assert await auth.register('alice', 'secret')
+        assert not await auth.register('alice', 'other')
+        assert await auth.login('alice', 'secret')
+
+    asyncio.run(run())
+    auth.close()
+    assert executor.calls == ['hash_password']
+    assert verify_password('secret', UserRegistry(auth.users.filename).get('alice')['password'])
+
+
+@pytest.mark.parametrize('username, password', [('admin', 'admin'), ('user', 'password')])
+def test_shipped_database(username: str, password: str) -> None:
+    """
+    Хеши в поставляемой БД пользователей сделаны с числом итераций
+    по умолчанию и проверяются паролями из README.
+    """
+    users = UserRegistry(os.path.join(ROOT, 'users_database.json'))
+    password_hash = users.get(username)['password']
+    iterations = AppSettings.model_fields['password_hash_iterations'].default
+    assert password_hash.startswith(f'{HASH_ALGORITHM}${iterations}$')
+    assert verify_password(password, password_hash)
+    assert not verify_password(password + '!', password_hash)
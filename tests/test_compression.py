@@ -0,0 +1,113 @@
+import asyncio
+import zlib
+from typing import AsyncIterator
+
+import pytest
+
+from compression import (
+    CompressionAlgorithm, FrameCompressor, FrameDecompressor, negotiate_compression,
+)
+from framing import HEADER, MAX_FRAME_SIZE, FrameDecoder, FrameType, encode_frame
+
+
+@pytest.mark.parametrize('offered, enabled, expected', [
+    ('compress=zlib-stream,zlib', ['zlib-stream', 'zlib'], 'zlib-stream'),
+    ('compress=zlib-stream,zlib', ['zlib'], 'zlib'),
+    ('compress=zlib', ['zlib-stream', 'zlib'], 'zlib'),
+    ('compress=lz4', ['zlib-stream', 'zlib'], None),
+    ('compress=zlib', [], None),
+    ('zlib', ['zlib'], None),
+])
+def test_negotiate_compression(
+    offered: str, enabled: list[CompressionAlgorithm], expected: str | None,
+) -> None:
+    """
+    Выбирается первый включенный на сервере алгоритм из предложенных клиентом.
+    """
+    assert negotiate_compression(offered, enabled) == expected
+
+
+def batch(start: int, count: int) -> bytes:
+    return b''.join(
+        encode_frame(FrameType.CHAT, f'[{index}] (18.10.26 10:00:00) alice: message {index}')
+        for index in range(start, start + count)
+    )
+
+
+async def chunks(data: bytes, size: int) -> AsyncIterator[tuple[FrameType, memoryview]]:
+    """
+    Кадры потока data, полученного частями по size байт.
+    """
+    decoder = FrameDecoder()
+    for position in range(0, len(data), size):
+        decoder.feed(data[position:position + size])
+        for frame in decoder.frames():
+            yield frame
+
+
+def receive(algorithm: CompressionAlgorithm, data: bytes, size: int) -> list[tuple[int, bytes]]:
+    async def run() -> list[tuple[int, bytes]]:
+        decompressor = FrameDecompressor(algorithm, MAX_FRAME_SIZE)
+        return [
+            (frame_type, bytes(payload))
+            async for frame_type, payload in decompressor.frames(chunks(data, size))
+        ]
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('algorithm', ['zlib', 'zlib-stream'])
+@pytest.mark.parametrize('size', [7, 4096])
+def test_round_trip(algorithm: CompressionAlgorithm, size: int) -> None:
+    """
+    Пачки (сжатые и короче порога) распаковываются в исходные кадры,
+    в том числе если данные приходят частями произвольного размера;
+    'zlib-stream' распаковывает пачки в общем контексте.
+    """
+    counts = {'raw': 0, 'compressed': 0}
+    compressor = FrameCompressor(algorithm, 1, 512, 12, counts)
+    batches = [batch(0, 20), batch(20, 1), batch(21, 20), batch(41, 50), batch(91, 2)]
+    data = b''.join(compressor.pack(frames) for frames in batches)
+    decoder = FrameDecoder()
+    decoder.feed(b''.join(batches))
+    expected = [(frame_type, bytes(payload)) for frame_type, payload in decoder.frames()]
+    assert len(expected) == 93
+    assert receive(algorithm, data, size) == expected
+    compressed = [frames for frames in batches if len(frames) >= 512]
+    assert counts['raw'] == sum(map(len, compressed))
+    assert counts['compressed'] < counts['raw']
+
+
+def test_short_batch_is_not_compressed() -> None:
+    """
+    Пачка короче порога отправляется как есть.
+    """
+    counts = {'raw': 0, 'compressed': 0}
+    compressor = FrameCompressor('zlib', 1, 512, 12, counts)
+    assert compressor.pack(batch(0, 1)) == batch(0, 1)
+    assert counts == {'raw': 0, 'compressed': 0}
+
+
+def test_stream_shares_context() -> None:
+    """
+    'zlib-stream' сжимает пачку с повторами из прошлых пачек лучше,
+    чем 'zlib', который сжимает каждую пачку отдельно.
+    """
+    sizes = {}
+    for algorithm in ('zlib', 'zlib-stream'):
+        compressor = FrameCompressor(algorithm, 1, 512, 12, {'raw': 0, 'compressed': 0})
+        compressor.pack(batch(0, 20))
+        sizes[algorithm] = len(compressor.pack(batch(0, 20)))
+    assert sizes['zlib-stream'] < sizes['zlib'] // 2
+
+
+def test_compressed_frame_format() -> None:
+    """
+    Сжатая пачка - кадр COMPRESSED с данными deflate без заголовка zlib.
+    """
+    frames = batch(0, 20)
+    packed = FrameCompressor('zlib', 1, 512, 12, {'raw': 0, 'compressed': 0}).pack(frames)
+    length, frame_type = HEADER.unpack_from(packed)
+    assert frame_type == FrameType.COMPRESSED
+    assert length == len(packed) - HEADER.size
+    assert zlib.decompress(packed[HEADER.size:], -15) == frames
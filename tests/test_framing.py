@@ -0,0 +1,134 @@
+import asyncio
+import random
+
+import pytest
+
+from framing import (
+    HEADER,
+    MAX_FRAME_SIZE,
+    READ_CHUNK_SIZE,
+    FrameDecoder,
+    FrameError,
+    FrameType,
+    encode_frame,
+    read_frames,
+)
+
+ALPHABET: str = 'abc йцук漢字😀\n'
+CHUNK_SIZES: tuple[int, ...] = (1, 2, 3, 5, 7, 100, 4096, READ_CHUNK_SIZE + 1)
+
+
+def random_messages(rnd: random.Random, count: int) -> list[tuple[FrameType, str]]:
+    """
+    Случайные кадры с многобайтными символами UTF-8 (в том числе пустые
+    и длиннее буфера декодера).
+    """
+    return [
+        (
+            rnd.choice(list(FrameType)),
+            ''.join(rnd.choice(ALPHABET) for _ in range(rnd.choice((0, 1, 50, 3000, 30000)))),
+        )
+        for _ in range(count)
+    ]
+
+
+def decode(stream: bytes, chunk_sizes: list[int]) -> list[tuple[FrameType, str]]:
+    """
+    Разбор потока, полученного частями указанных размеров.
+    Нагрузка копируется сразу: memoryview действительна до следующего feed().
+    """
+    decoder = FrameDecoder()
+    decoded: list[tuple[FrameType, str]] = []
+    position = 0
+    for size in chunk_sizes:
+        decoder.feed(stream[position:position + size])
+        position += size
+        decoded += [(frame_type, str(payload, 'utf-8')) for frame_type, payload in decoder.frames()]
+    return decoded
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_split_and_coalesced_reads(seed: int) -> None:
+    """
+    Поток кадров, разрезанный в случайных местах (внутри заголовка,
+    посреди символа UTF-8) и склеенный из нескольких кадров,
+    разбирается в исходные кадры.
+    """
+    rnd = random.Random(seed)
+    messages = random_messages(rnd, rnd.randint(1, 30))
+    stream = b''.join(encode_frame(frame_type, text) for frame_type, text in messages)
+    chunk_sizes: list[int] = []
+    while sum(chunk_sizes) < len(stream):
+        chunk_sizes.append(rnd.choice(CHUNK_SIZES))
+    assert decode(stream, chunk_sizes) == messages
+
+
+def test_byte_by_byte() -> None:
+    """
+    Кадры с многобайтными символами, полученные по одному байту.
+    """
+    messages = [(FrameType.CHAT, '😀漢'), (FrameType.PRIVATE, ''), (FrameType.HISTORY, 'й' * 10)]
+    stream = b''.join(encode_frame(frame_type, text) for frame_type, text in messages)
+    assert decode(stream, [1] * len(stream)) == messages
+
+
+def test_incomplete_frame_is_kept() -> None:
+    """
+    Незаконченный кадр не возвращается, пока не получен целиком.
+    """
+    frame = encode_frame(FrameType.CHAT, 'hello')
+    decoder = FrameDecoder()
+    decoder.feed(frame[:-1])
+    assert list(decoder.frames()) == []
+    decoder.feed(frame[-1:])
+    assert [(frame_type, bytes(payload)) for frame_type, payload in decoder.frames()] == [
+        (FrameType.CHAT, b'hello'),
+    ]
+
+
+def test_oversize_frame() -> None:
+    """
+    Кадр больше max_frame_size отклоняется по заголовку,
+    не дожидаясь нагрузки.
+    """
+    decoder = FrameDecoder(max_frame_size=100)
+    decoder.feed(encode_frame(FrameType.CHAT, 'x' * 100))
+    assert len(list(decoder.frames())) == 1
+    decoder.feed(HEADER.pack(101, FrameType.CHAT))
+    with pytest.raises(FrameError):
+        list(decoder.frames())
+    decoder = FrameDecoder()
+    decoder.feed(HEADER.pack(MAX_FRAME_SIZE + 1, FrameType.CHAT))
+    with pytest.raises(FrameError):
+        list(decoder.frames())
+
+
+def test_unknown_frame_type() -> None:
+    """
+    Кадр неизвестного типа - ошибка разбора.
+    """
+    decoder = FrameDecoder()
+    decoder.feed(HEADER.pack(1, 99) + b'x')
+    with pytest.raises(FrameError):
+        list(decoder.frames())
+
+
+def test_read_frames() -> None:
+    """
+    Чтение кадров из StreamReader до закрытия потока.
+    """
+    async def read() -> list[tuple[FrameType, bytes]]:
+        reader = asyncio.StreamReader()
+        reader.feed_data(encode_frame(FrameType.AUTH, 'login') + encode_frame(FrameType.CHAT, 'x'))
+        reader.feed_data(encode_frame(FrameType.SERVER, 'y' * READ_CHUNK_SIZE * 2))
+        reader.feed_eof()
+        return [
+            (frame_type, bytes(payload))
+            async for frame_type, payload in read_frames(reader, FrameDecoder())
+        ]
+
+    assert asyncio.run(read()) == [
+        (FrameType.AUTH, b'login'),
+        (FrameType.CHAT, b'x'),
+        (FrameType.SERVER, b'y' * READ_CHUNK_SIZE * 2),
+    ]
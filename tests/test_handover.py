@@ -0,0 +1,81 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+from handover import finish_handover, hand_over, socket_address, take_over, wait_for_handover
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Новый процесс сервера: получает слушающий сокет, сообщает о нем
+# и отвечает первому подключению из очереди сокета.
+SUCCESSOR: str = '''
+import sys
+from handover import take_over
+sockets = take_over(sys.argv[1], '127.0.0.1', int(sys.argv[2]), 10)
+print(len(sockets), flush=True)
+connection, _ = sockets[0].accept()
+connection.sendall(b'accepted by successor')
+connection.close()
+'''
+
+
+def test_hand_over_listening_socket(tmp_path: Path) -> None:
+    """
+    Слушающий сокет передается другому процессу через unix-сокет
+    (SCM_RIGHTS); подключение, ожидавшее в очереди сокета,
+    принимает новый процесс.
+    """
+    path = str(tmp_path / 'handover.sock')
+    listener = socket.create_server(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+
+    async def run() -> bytes:
+        handover = asyncio.create_task(wait_for_handover(path, {socket_address(listener)}))
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+        successor = subprocess.Popen(
+            [sys.executable, '-c', SUCCESSOR, path, str(port)],
+            cwd=ROOT, stdout=subprocess.PIPE,
+        )
+        connection = await asyncio.wait_for(handover, 10)
+        # Подключение ждет в очереди: прежний процесс его уже не примет.
+        client = socket.create_connection(('127.0.0.1', port))
+        hand_over(connection, [listener])
+        listener.close()
+        finish_handover(connection)
+        with client:
+            client.settimeout(10)
+            reply = client.recv(100)
+        assert successor.stdout.readline() == b'1\n'
+        assert successor.wait(10) == 0
+        successor.stdout.close()
+        assert not os.path.exists(path)
+        return reply
+
+    assert asyncio.run(run()) == b'accepted by successor'
+
+
+def test_refuse_other_address(tmp_path: Path) -> None:
+    """
+    Процессу, который слушал бы другой порт, сокеты не передаются,
+    и сервер продолжает ждать запроса.
+    """
+    path = str(tmp_path / 'handover.sock')
+    with socket.create_server(('127.0.0.1', 0)) as listener:
+        port = listener.getsockname()[1]
+
+        async def run() -> None:
+            handover = asyncio.create_task(
+                wait_for_handover(path, {socket_address(listener)}),
+            )
+            while not os.path.exists(path):
+                await asyncio.sleep(0.01)
+            sockets = await asyncio.to_thread(take_over, path, '127.0.0.1', port + 1, 10)
+            assert sockets == []
+            assert not handover.done()
+            handover.cancel()
+
+        asyncio.run(run())
+    assert take_over(path, '127.0.0.1', port, 1) == []
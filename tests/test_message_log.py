@@ -0,0 +1,199 @@
+import asyncio
+import os
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from message_log import (
+    RECORD_HEADER, LogRecordType, MessageLog, apply_record, empty_state,
+)
+from message_store import DEFAULT_ROOM
+
+
+class LoggedState:
+    """
+    Состояние, которое меняется вместе с записями журнала
+    (как состояние сервера): снимок сегмента совпадает с ним.
+    """
+    def __init__(self, directory: Path, segment_size: int = 1 << 20) -> None:
+        self.state = empty_state()
+        self.log = MessageLog(
+            str(directory), self.snapshot, segment_size, 2, 0.0, 'never', 1.0,
+        )
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            **self.state,
+            'chat_messages': list(self.state['chat_messages']),
+            'private_messages': {
+                recipient: list(messages)
+                for recipient, messages in self.state['private_messages'].items()
+            },
+        }
+
+    def append(self, record_type: LogRecordType, data: Any) -> None:
+        self.log.append(record_type, data)
+        apply_record(self.state, record_type, data)
+
+
+def fill(logged: LoggedState, count: int) -> None:
+    """
+    Сообщения чата, приватные сообщения и события модерации.
+    """
+    for index in range(count):
+        logged.append(
+            LogRecordType.CHAT, [index, 1000.0 + index, 'alice', f'message {index}', None, 'room'],
+        )
+        logged.append(LogRecordType.PRIVATE, ['bob', f'private {index}'])
+        if index % 3 == 2:
+            logged.append(LogRecordType.PRIVATE_DELIVERED, ['bob', 2])
+    logged.append(LogRecordType.CLAIM, ['carol', 1])
+    logged.append(LogRecordType.BAN, ['dave', 2000.0])
+
+
+def last_segment(directory: Path) -> Path:
+    return sorted(directory.glob('*.log'))[-1]
+
+
+def test_recover_after_close(tmp_path: Path) -> None:
+    """
+    Состояние восстанавливается по снимку и записям после него.
+    """
+    logged = LoggedState(tmp_path)
+    logged.log.open()
+    fill(logged, 10)
+    logged.log.close()
+    state = MessageLog.read_segment(str(last_segment(tmp_path)))
+    assert state == logged.state
+    assert state['room_indexes'] == {'room': 10}
+    assert state['private_messages'] == {'bob': [f'private {index}' for index in range(6, 10)]}
+    assert state['claims'] == {'carol': 1} and state['claimed_users'] == {'dave': 2000.0}
+    assert MessageLog(str(tmp_path), dict, 1 << 20, 2, 0.0, 'never', 1.0).recover() == state
+
+
+def test_torn_and_corrupt_tail(tmp_path: Path) -> None:
+    """
+    Недописанная или поврежденная (crc32) запись в конце сегмента
+    и все записи после нее отбрасываются.
+    """
+    logged = LoggedState(tmp_path)
+    logged.log.open()
+    fill(logged, 3)
+    expected = logged.snapshot()
+    logged.append(LogRecordType.PRIVATE, ['bob', 'lost'])
+    logged.log.close()
+    path = last_segment(tmp_path)
+    data = path.read_bytes()
+    last_record = len(MessageLog.encode_record(LogRecordType.PRIVATE, ['bob', 'lost']))
+
+    for cut in (1, RECORD_HEADER.size, last_record - 1):
+        path.write_bytes(data[:-cut])
+        assert MessageLog.read_segment(str(path)) == expected
+
+    corrupt = bytearray(data)
+    corrupt[-2] ^= 0xff
+    path.write_bytes(bytes(corrupt) + MessageLog.encode_record(LogRecordType.CLAIM, ['x', 1]))
+    assert MessageLog.read_segment(str(path)) == expected
+
+
+def test_legacy_records(tmp_path: Path) -> None:
+    """
+    Записи, сделанные до появления комнат (сообщение из трех полей)
+    и до учета количества доставленных сообщений, применяются к общему чату
+    и очереди получателя целиком.
+    """
+    log = MessageLog(str(tmp_path), empty_state, 1 << 20, 2, 0.0, 'never', 1.0)
+    log.open()
+    log.append(LogRecordType.CHAT, [7, 1000.0, '[7] (18.10.26 10:00:00) alice: hi'])
+    log.append(LogRecordType.PRIVATE, ['bob', 'one'])
+    log.append(LogRecordType.PRIVATE, ['bob', 'two'])
+    log.append(LogRecordType.PRIVATE_DELIVERED, 'bob')
+    log.close()
+    state = log.recover()
+    assert state['chat_messages'] == [[7, 1000.0, '[7] (18.10.26 10:00:00) alice: hi']]
+    assert state['room_indexes'] == {DEFAULT_ROOM: 8}
+    assert state['private_messages'] == {}
+
+
+def test_segment_rotation(tmp_path: Path) -> None:
+    """
+    При превышении размера сегмента начинается новый сегмент со снимком;
+    хранится не больше segments_to_keep сегментов, а состояние
+    восстанавливается по последнему.
+    """
+    logged = LoggedState(tmp_path, segment_size=4096)
+    logged.log.open()
+
+    async def write() -> None:
+        for _ in range(20):
+            fill(logged, 10)
+            await logged.log.flush()
+
+    asyncio.run(write())
+    logged.log.close()
+    segments = sorted(tmp_path.glob('*.log'))
+    assert len(segments) == 2
+    assert int(segments[-1].stem) > 2
+    assert logged.log.recover() == logged.state
+
+
+def test_torn_snapshot_falls_back(tmp_path: Path) -> None:
+    """
+    Если снимок нового сегмента не дописан, состояние восстанавливается
+    по предыдущему сегменту.
+    """
+    logged = LoggedState(tmp_path)
+    logged.log.open()
+    fill(logged, 5)
+    logged.log.close()
+    expected = logged.snapshot()
+    snapshot = MessageLog.encode_record(LogRecordType.SNAPSHOT, {**expected, 'claims': {}})
+    (tmp_path / f'{99:020d}.log').write_bytes(snapshot[:-1])
+    assert logged.log.recover() == expected
+
+
+def test_checkpoint(tmp_path: Path) -> None:
+    """
+    checkpoint() записывает сегмент из одного сжатого снимка.
+    """
+    logged = LoggedState(tmp_path)
+    logged.log.open()
+    fill(logged, 50)
+    logged.log.checkpoint()
+    assert logged.log.file is None
+    path = last_segment(tmp_path)
+    length, _, record_type = RECORD_HEADER.unpack_from(path.read_bytes())
+    assert record_type == LogRecordType.SNAPSHOT_ZLIB
+    assert os.path.getsize(path) == RECORD_HEADER.size + length
+    assert logged.log.recover() == logged.state
+
+
+def test_snapshot_synced_before_removing_segments(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    Старые сегменты удаляются только после fsync нового снимка
+    и каталога - даже при политике 'never'.
+    """
+    logged = LoggedState(tmp_path)
+    for _ in range(2):
+        logged.log.open()
+        fill(logged, 1)
+    calls: list[str] = []
+    real_fsync, real_remove = os.fsync, os.remove
+
+    def fsync(descriptor: int) -> None:
+        calls.append('fsync')
+        real_fsync(descriptor)
+
+    def remove(path: str) -> None:
+        calls.append('remove')
+        real_remove(path)
+
+    monkeypatch.setattr(os, 'fsync', fsync)
+    monkeypatch.setattr(os, 'remove', remove)
+    logged.log.open()
+    assert calls == ['fsync', 'fsync', 'remove']
+    logged.log.close()
+    assert len(list(tmp_path.glob('*.log'))) == 2
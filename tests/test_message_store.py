@@ -0,0 +1,100 @@
+from message_store import ChatMessage, MessageStore, parse_legacy_message
+from search_index import SearchIndex, parse_query
+
+
+def filled_store(count: int, capacity: int = 100, ttl: int = 60) -> MessageStore:
+    """
+    Хранилище с поисковым индексом и count сообщениями
+    (сообщение i создано в момент 1000 + i секунд).
+    """
+    store = MessageStore(capacity, ttl, search_index=SearchIndex())
+    for index in range(count):
+        store.append(index, 1000 + index, f'user{index % 3}', f'message {index} word{index % 5}')
+    return store
+
+
+def test_append_and_lookup() -> None:
+    """
+    Сообщения доступны по номеру, нагрузка кадра форматируется один раз.
+    """
+    store = MessageStore(10, 60, '#dev ')
+    payload = store.append(5, 1000, 'alice', 'hello', None)
+    store.append(6, 1001, 'bob', 'reply', 5)
+    assert payload == store.payload(5)
+    assert payload.endswith(b'alice: hello') and payload.startswith(b'#dev [5] (')
+    assert store.payload(6).startswith(b'#dev Commenting [5]\n[6] (')
+    assert store.get(6) == ChatMessage(6, 1001, 'bob', 'reply', 5)
+    assert 5 in store and 7 not in store and 4 not in store
+    assert store.get(7) is None
+    assert store.last_index == 6
+    assert [message.index for message in store] == [5, 6]
+
+
+def test_capacity() -> None:
+    """
+    При превышении лимита удаляются самые старые сообщения.
+    """
+    store = filled_store(250, capacity=100)
+    assert len(store) == 100
+    assert store.oldest().index == 150
+    assert 149 not in store and 150 in store
+    assert store.last(3) == [store.payload(index) for index in (247, 248, 249)]
+    assert store.since(246) == store.last(3)
+    assert store.since(249) == []
+
+
+def test_gap_drops_stored_messages() -> None:
+    """
+    Сообщение с номером не подряд (рабочий процесс пропустил
+    сообщения) заменяет всю историю.
+    """
+    store = filled_store(10)
+    store.append(20, 2000, 'alice', 'after a gap')
+    assert len(store) == 1 and store.oldest().index == 20
+    assert store.search(parse_query('message'), 10) == []
+
+
+def test_drop_updates_search_index() -> None:
+    """
+    drop() удаляет самые старые сообщения и из поискового индекса,
+    в том числе после сдвига массивов (больше 1024 удаленных записей).
+    """
+    store = filled_store(3000, capacity=5000)
+    store.drop(10)
+    assert store.oldest().index == 10 and len(store) == 2990
+    assert store.search(parse_query('word0'), 1000)[-1] == 10
+    store.drop(2000)
+    assert store.start == 0
+    assert store.oldest().index == 2010 and store.get(2999).body == 'message 2999 word4'
+    assert store.search(parse_query('from:user0 word0'), 1) == [2985]
+    assert min(store.search(parse_query('word0'), 10000)) == 2010
+    store.drop(len(store))
+    assert len(store) == 0 and len(store.search_index) == 0 and store.oldest() is None
+
+
+def test_expire() -> None:
+    """
+    Удаляются сообщения старше ttl; время создания хранится
+    с точностью до миллисекунд, поэтому сообщения не удаляются раньше срока.
+    """
+    store = MessageStore(10, 60)
+    store.append(0, 1000.9, 'alice', 'first')
+    store.append(1, 1001.5, 'alice', 'second')
+    assert store.expire(1060.5) == 0
+    assert store.expire(1060.9) == 1
+    assert store.oldest() == ChatMessage(1, 1001.5, 'alice', 'second', None)
+    assert store.expire(1061.4999) == 0
+    assert store.expire(1061.5) == 1
+    assert len(store) == 0
+
+
+def test_parse_legacy_message() -> None:
+    """
+    Разбор сообщения прежнего формата журнала с цепочкой комментариев.
+    """
+    text = (
+        'Commenting <[1] (18.10.26 10:00:00) alice: hi>\n'
+        '[2] (18.10.26 10:00:01) bob: hello: there'
+    )
+    assert parse_legacy_message(2, text) == ('bob', 'hello: there', 1)
+    assert parse_legacy_message(1, '[1] (18.10.26 10:00:00) alice: hi') == ('alice', 'hi', None)
@@ -0,0 +1,97 @@
+from pathlib import Path
+
+from private_queue import PrivateQueues
+from scheduler import Scheduler
+
+
+def make_queues(directory: Path) -> PrivateQueues:
+    """
+    Очереди не больше двух сообщений в памяти на получателя.
+    """
+    return PrivateQueues(str(directory), Scheduler(), 3600, 2, 1024, 4096, lambda *_: None)
+
+
+def pending(queues: PrivateQueues, recipient: str) -> list[str]:
+    """
+    Все сообщения получателя в порядке доставки (без их извлечения).
+    """
+    queue, path = queues.take(recipient)
+    messages = list(queue.messages)
+    if path is not None:
+        messages += [str(message, 'utf-8') for chunk in queues.stream(path) for message in chunk]
+    queues.put_back(recipient, queue, path)
+    return messages
+
+
+def test_spill_and_deliver(tmp_path: Path) -> None:
+    """
+    Сообщения сверх лимита вытесняются в файл; после доставки
+    очередь и файл удаляются.
+    """
+    queues = make_queues(tmp_path)
+    assert [queues.put('bob', f'm{number}') for number in range(4)] == [True, True, False, False]
+    queue, path = queues.take('bob')
+    assert queue.messages == ['m0', 'm1']
+    assert [list(chunk) for chunk in queues.stream(path)] == [[b'm2', b'm3']]
+    queues.delivered('bob', queue, path)
+    assert len(queues) == 0 and queues.snapshot() == {} and queues.spilled == 0
+    assert list(tmp_path.iterdir()) == []
+    assert queues.take('bob')[0].messages == []
+
+
+def test_put_back_keeps_order(tmp_path: Path) -> None:
+    """
+    Если отправка не удалась, извлеченные сообщения возвращаются
+    перед сообщениями, поставленными в очередь за время отправки.
+    """
+    queues = make_queues(tmp_path)
+    queues.put('bob', 'm0')
+    queue, path = queues.take('bob')
+    queues.put('bob', 'm1')
+    queues.put_back('bob', queue, path)
+    assert pending(queues, 'bob') == ['m0', 'm1']
+
+    for number in range(2, 5):
+        queues.put('bob', f'm{number}')
+    queue, path = queues.take('bob')
+    assert path is not None
+    queues.put('bob', 'm5')
+    queues.put('bob', 'm6')
+    queues.put('bob', 'm7')
+    queues.put_back('bob', queue, path)
+    assert pending(queues, 'bob') == [f'm{number}' for number in range(8)]
+    assert len(queues) == 2
+
+
+def test_restore_after_interrupted_delivery(tmp_path: Path) -> None:
+    """
+    Снимок состояния, записанный во время доставки, содержит
+    отправляемые сообщения, а файл, доставка которого прервана
+    остановкой сервера, после перезапуска возвращается в очередь:
+    ни одно сообщение не теряется.
+    """
+    queues = make_queues(tmp_path)
+    for number in range(4):
+        queues.put('bob', f'm{number}')
+    queues.take('bob')
+    for number in range(4, 7):
+        queues.put('bob', f'm{number}')
+    snapshot = queues.snapshot()
+    assert snapshot == {'bob': ['m0', 'm1', 'm4', 'm5']}
+    restored = make_queues(tmp_path)
+    restored.restore(snapshot)
+    assert sorted(pending(restored, 'bob')) == [f'm{number}' for number in range(7)]
+
+
+def test_discard(tmp_path: Path) -> None:
+    """
+    Сообщения, доставленные другим процессом, удаляются вместе с файлом.
+    """
+    queues = make_queues(tmp_path)
+    for number in range(3):
+        queues.put('bob', f'm{number}')
+    queues.put('alice', 'a0')
+    assert queues.discard('bob', 5) == 2
+    assert queues.discard('carol', 1) == 0
+    assert pending(queues, 'bob') == [] and pending(queues, 'alice') == ['a0']
+    assert [path.name for path in tmp_path.iterdir()] == []
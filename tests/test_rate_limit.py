@@ -0,0 +1,116 @@
+import pytest
+
+from rate_limit import RateLimiter, TokenBucket, traffic_kind
+
+
+class Clock:
+    """
+    Часы, которые идут только по команде теста.
+    """
+    def __init__(self) -> None:
+        self.now: float = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
+
+
+def test_bucket_refill_and_burst_cap() -> None:
+    """
+    Корзина пополняется со скоростью rate, но не выше burst.
+    """
+    bucket = TokenBucket(3, 0.0)
+    bucket.tokens = 0.0
+    assert bucket.wait_time(2, 3, 0.25) == pytest.approx(0.25)
+    assert bucket.tokens == pytest.approx(0.5)
+    assert bucket.wait_time(2, 3, 0.5) == 0.0
+    assert bucket.tokens == pytest.approx(1.0)
+    assert bucket.wait_time(2, 3, 100.0) == 0.0
+    assert bucket.tokens == 3
+
+
+def test_take_burst_then_reject(clock: Clock) -> None:
+    """
+    Пользователь отправляет burst сообщений подряд, следующее
+    отклоняется с временем ожидания токена; через 1/rate секунд
+    сообщение снова проходит.
+    """
+    limiter = RateLimiter({'chat': (2, 5)}, {}, clock)
+    user, ip = limiter.acquire('alice', '10.0.0.1')
+    assert [limiter.take('chat', user, ip) for _ in range(5)] == [0.0] * 5
+    assert limiter.take('chat', user, ip) == pytest.approx(0.5)
+    clock.now += 0.25
+    assert limiter.take('chat', user, ip) == pytest.approx(0.25)
+    clock.now += 0.25
+    assert limiter.take('chat', user, ip) == 0.0
+    assert limiter.take('chat', user, ip) == pytest.approx(0.5)
+
+
+def test_take_burst_cap_after_idle(clock: Clock) -> None:
+    """
+    После долгого простоя накапливается не больше burst токенов.
+    """
+    limiter = RateLimiter({'chat': (10, 3)}, {}, clock)
+    user, ip = limiter.acquire('alice', '10.0.0.1')
+    limiter.take('chat', user, ip)
+    clock.now += 3600
+    assert [limiter.take('chat', user, ip) for _ in range(3)] == [0.0] * 3
+    assert limiter.take('chat', user, ip) == pytest.approx(0.1)
+
+
+def test_take_unlimited_kind(clock: Clock) -> None:
+    """
+    Тип трафика без лимита не ограничивается и не создает корзин.
+    """
+    limiter = RateLimiter({'chat': (1, 1)}, {}, clock)
+    user, ip = limiter.acquire('alice', '10.0.0.1')
+    assert all(limiter.take('command', user, ip) == 0.0 for _ in range(100))
+    assert user == {} and ip == {}
+
+
+def test_ip_limit_shared_between_users(clock: Clock) -> None:
+    """
+    Лимит адреса общий для всех пользователей с него; отклоненное
+    сообщение не расходует токен пользователя.
+    """
+    limiter = RateLimiter({'private': (1, 2)}, {'private': (1, 3)}, clock)
+    alice = limiter.acquire('alice', '10.0.0.1')
+    bob = limiter.acquire('bob', '10.0.0.1')
+    carol = limiter.acquire('carol', '10.0.0.2')
+    assert limiter.take('private', *alice) == 0.0
+    assert limiter.take('private', *alice) == 0.0
+    assert limiter.take('private', *bob) == 0.0
+    assert limiter.take('private', *bob) == pytest.approx(1.0)
+    assert bob[0]['private'].tokens == pytest.approx(1.0)
+    assert limiter.take('private', *carol) == 0.0
+    clock.now += 1
+    assert limiter.take('private', *bob) == 0.0
+
+
+def test_release(clock: Clock) -> None:
+    """
+    Корзины адреса удаляются после отключения последнего пользователя с него.
+    """
+    limiter = RateLimiter({'chat': (1, 1)}, {'chat': (1, 1)}, clock)
+    limiter.take('chat', *limiter.acquire('alice', '10.0.0.1'))
+    limiter.acquire('bob', '10.0.0.1')
+    limiter.release('alice', '10.0.0.1')
+    assert 'alice' not in limiter.users and '10.0.0.1' in limiter.ips
+    limiter.release('bob', '10.0.0.1')
+    assert limiter.ips == {} and limiter.connections == {}
+
+
+@pytest.mark.parametrize('text, kind', [
+    ('hello', 'chat'),
+    ('@comment3 nice', 'chat'),
+    ('@bob hi', 'private'),
+    ('@search foo', 'command'),
+    ('@join room', 'command'),
+    ('', 'chat'),
+])
+def test_traffic_kind(text: str, kind: str) -> None:
+    assert traffic_kind(memoryview(text.encode())) == kind
@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+from scheduler import Scheduler
+
+
+def test_timers_run_in_order_and_not_early() -> None:
+    """
+    run_due() выполняет только таймеры наступивших тактов:
+    не раньше срока и не позже чем через resolution после него.
+    """
+    scheduler = Scheduler(resolution=0.01)
+    calls: list[str] = []
+    scheduler.call_at(100.0, calls.append, 'a')
+    scheduler.call_at(100.005, calls.append, 'b')
+    scheduler.call_at(100.5, calls.append, 'c')
+    assert len(scheduler) == 3
+    assert scheduler.run_due(99.999) == 0
+    assert scheduler.run_due(100.01) == 2
+    assert calls == ['a', 'b']
+    assert scheduler.run_due(100.49) == 0
+    assert scheduler.run_due(100.51) == 1
+    assert calls == ['a', 'b', 'c'] and len(scheduler) == 0
+
+
+def test_cancel() -> None:
+    """
+    Отмененный таймер не выполняется; повторная отмена ничего не меняет.
+    """
+    scheduler = Scheduler()
+    calls: list[int] = []
+    timer = scheduler.call_at(1.0, calls.append, 1)
+    scheduler.call_at(1.0, calls.append, 2)
+    scheduler.cancel(timer)
+    scheduler.cancel(timer)
+    assert len(scheduler) == 1
+    assert scheduler.run_due(2.0) == 1
+    assert calls == [2] and scheduler.cancelled == 0
+
+
+def test_compact() -> None:
+    """
+    Когда отмененных таймеров больше, чем ожидающих, корзины чистятся.
+    """
+    scheduler = Scheduler()
+    calls: list[int] = []
+    timers = [scheduler.call_at(float(number), calls.append, number) for number in range(3000)]
+    for timer in timers[:2000]:
+        scheduler.cancel(timer)
+    assert scheduler.cancelled < 1100
+    assert len(scheduler.buckets) < 2000
+    assert scheduler.run_due(10000.0) == 1000
+    assert calls == list(range(2000, 3000))
+
+
+def test_failing_callback() -> None:
+    """
+    Исключение в таймере не мешает выполнению остальных.
+    """
+    scheduler = Scheduler()
+    calls: list[int] = []
+    scheduler.call_at(1.0, lambda: 1 / 0)
+    scheduler.call_at(1.0, calls.append, 1)
+    assert scheduler.run_due(2.0) == 2
+    assert calls == [1]
+
+
+def test_event_loop() -> None:
+    """
+    В цикле событий таймеры срабатывают сами, в том числе
+    добавленные до start() и более ранние, чем уже запланированные.
+    """
+    async def run() -> list[tuple[str, float]]:
+        scheduler = Scheduler()
+        fired: list[tuple[str, float]] = []
+        started = time.monotonic()
+
+        def record(name: str) -> None:
+            fired.append((name, time.monotonic() - started))
+
+        scheduler.call_later(0, record, 'due before start')
+        scheduler.start()
+        scheduler.call_later(0.2, record, 'late')
+        scheduler.call_later(0.05, record, 'early')
+        await asyncio.sleep(0.3)
+        scheduler.stop()
+        return fired
+
+    fired = asyncio.run(run())
+    assert [name for name, _ in fired] == ['due before start', 'early', 'late']
+    assert fired[1][1] >= 0.05 and fired[2][1] >= 0.2
@@ -0,0 +1,83 @@
+import random
+
+from message_store import MessageStore
+from search_index import SearchIndex, SearchQuery, contains_phrase, parse_query, terms_of
+
+WORDS: list[str] = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta']
+
+
+def test_parse_query() -> None:
+    """
+    Разбор слов, фраз, автора и номера страницы.
+    """
+    assert parse_query('from:bob page:3 Hello "big  World" x') == SearchQuery(
+        ['hello', 'big', 'world', 'x'], [['big', 'world']], 'bob', 3,
+    )
+    assert parse_query('page:0 "single" "unclosed phrase') == SearchQuery(
+        ['single', 'unclosed', 'phrase'], [['unclosed', 'phrase']], None, 1,
+    )
+    assert parse_query('from: page:x') == SearchQuery(['from', 'page', 'x'], [], None, 1)
+
+
+def test_parse_query_non_ascii_page() -> None:
+    """
+    Номер страницы из цифр не ASCII считается словом запроса.
+    """
+    assert parse_query('page:² foo') == SearchQuery(['page', '²', 'foo'], [], None, 1)
+    assert parse_query('page:٣ foo') == SearchQuery(['page', '٣', 'foo'], [], None, 1)
+    assert parse_query('page:² page:2 foo').page == 2
+
+
+def test_contains_phrase() -> None:
+    """
+    Слова фразы должны идти подряд.
+    """
+    terms = terms_of('The quick brown fox, the lazy dog')
+    assert contains_phrase(terms, ['quick', 'brown'])
+    assert contains_phrase(terms, ['the', 'lazy'])
+    assert not contains_phrase(terms, ['quick', 'fox'])
+
+
+def test_match_agrees_with_scan() -> None:
+    """
+    match() находит те же сообщения, что и перебор, от новых
+    к старым - в том числе после удаления самых старых сообщений.
+    """
+    rnd = random.Random(1)
+    index = SearchIndex()
+    messages: dict[int, tuple[str, str]] = {}
+    first = 0
+    for number in range(3000):
+        author = f'user{rnd.randrange(4)}'
+        body = ' '.join(rnd.choices(WORDS, k=rnd.randint(1, 4)))
+        index.add(number, author, body)
+        messages[number] = author, body
+        if number % 7 == 0:
+            # Удаление самых старых сообщений (как в MessageStore.drop).
+            for _ in range(min(rnd.randint(1, 10), number - first)):
+                index.remove(*messages.pop(first))
+                first += 1
+        if number % 250 == 0:
+            for _ in range(10):
+                terms = rnd.sample(WORDS + ['from:user1', 'missing'], rnd.randint(1, 3))
+                expected = [
+                    found for found in sorted(messages, reverse=True)
+                    if set(terms) <= index.message_terms(*messages[found])
+                ]
+                assert list(index.match(terms)) == expected, terms
+
+
+def test_store_search() -> None:
+    """
+    Поиск в хранилище: слова, фразы, автор и ограничение количества.
+    """
+    store = MessageStore(100, 60, search_index=SearchIndex())
+    store.append(0, 1000, 'alice', 'the quick brown fox')
+    store.append(1, 1001, 'bob', 'brown quick fox')
+    store.append(2, 1002, 'alice', 'a quick brown dog')
+    assert store.search(parse_query('quick brown'), 10) == [2, 1, 0]
+    assert store.search(parse_query('"quick brown"'), 10) == [2, 0]
+    assert store.search(parse_query('"quick brown" from:alice fox'), 10) == [0]
+    assert store.search(parse_query('quick'), 2) == [2, 1]
+    assert store.search(parse_query('cat'), 10) == []
+    assert store.search(parse_query(''), 10) == []
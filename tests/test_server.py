@@ -0,0 +1,179 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import AsyncIterator, Iterator
+
+import pytest
+
+from client import Client
+from framing import FrameDecoder, FrameType, encode_frame
+from message_log import empty_state
+from message_store import DEFAULT_ROOM
+from outbound import OutboundQueue
+from server import Server
+
+
+class FrameWriter:
+    """
+    Соединение клиента, которое сохраняет отправленные кадры.
+    """
+    def __init__(self) -> None:
+        self.decoder = FrameDecoder()
+
+    def write(self, data: bytes) -> None:
+        self.decoder.feed(data)
+
+    async def drain(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def frames(self) -> list[tuple[FrameType, str]]:
+        return [
+            (frame_type, str(payload, 'utf-8')) for frame_type, payload in self.decoder.frames()
+        ]
+
+
+@pytest.fixture
+def server(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Server]:
+    """
+    Сервер (без открытия порта), файлы которого находятся во временном каталоге.
+    """
+    database = tmp_path / 'users_database.json'
+    database.write_text('[]')
+    for name, value in {
+        'USER_DATABASE_FILENAME': str(database),
+        'MESSAGE_LOG_DIR': str(tmp_path / 'message_log'),
+        'PRIVATE_SPILL_DIR': str(tmp_path / 'private_spill'),
+        'USER_CURSORS_DIR': str(tmp_path / 'user_cursors'),
+        'MESSAGE_TTL': '3600',
+        'AUTH_WORKERS': '1',
+        'PASSWORD_HASH_ITERATIONS': '1000',
+        'SHUTDOWN_GRACE': '0.3',
+        'SHUTDOWN_TIMEOUT': '5',
+    }.items():
+        monkeypatch.setenv(name, value)
+    server = Server()
+    server.connected_clients['alice'] = {'room': DEFAULT_ROOM, 'compressor': None}
+    yield server
+    server.message_log.close()
+    server.cursors.close()
+    server.auth.close()
+
+
+@pytest.mark.parametrize('number', ['²', '٣', '１', 'x', '-1', ''])
+def test_comment_to_missing_message(server: Server, number: str) -> None:
+    """
+    Комментарий к несуществующему сообщению (в том числе с номером
+    из цифр не ASCII) отклоняется, обработчик клиента продолжает работу.
+    """
+    writer = FrameWriter()
+    asyncio.run(server.handle_command(f'@comment{number} nice', 'alice', writer))
+    assert writer.frames() == [(FrameType.SERVER, 'Message not found or deleted!')]
+    assert len(server.rooms[DEFAULT_ROOM].messages) == 0
+
+
+def test_comment(server: Server) -> None:
+    """
+    Комментарий к существующему сообщению сохраняется в комнате.
+    """
+    writer = FrameWriter()
+    asyncio.run(server.add_chat_message(DEFAULT_ROOM, 'alice', 'hello'))
+    asyncio.run(server.handle_command('@comment0 nice', 'alice', writer))
+    assert writer.frames() == []
+    assert server.rooms[DEFAULT_ROOM].messages.get(1).parent == 0
+
+
+def test_search_with_non_ascii_page(server: Server) -> None:
+    """
+    'page:²' в запросе @search считается словом, а не номером страницы.
+    """
+    writer = FrameWriter()
+    asyncio.run(server.add_chat_message(DEFAULT_ROOM, 'alice', 'page:² foo'))
+    asyncio.run(server.handle_command('@search page:² foo', 'alice', writer))
+    assert [frame_type for frame_type, _ in writer.frames()] == [
+        FrameType.SERVER, FrameType.HISTORY,
+    ]
+
+
+def test_restore_legacy_chat_record(server: Server) -> None:
+    """
+    Сообщение из журнала прежнего формата (номер, время, готовый текст)
+    восстанавливается в общий чат с автором и текстом.
+    """
+    state = empty_state()
+    state['chat_messages'] = [[7, time.time(), '[7] (18.10.26 10:00:00) alice: hi']]
+    state['room_indexes'] = {DEFAULT_ROOM: 8}
+    server.restore_state(state)
+    message = server.rooms[DEFAULT_ROOM].messages.get(7)
+    assert (message.author, message.body, message.parent) == ('alice', 'hi', None)
+    assert server.rooms[DEFAULT_ROOM].next_index == 8
+
+
+async def next_frame(
+    frames: AsyncIterator[tuple[FrameType, memoryview]],
+) -> tuple[FrameType, str]:
+    frame_type, payload = await asyncio.wait_for(anext(frames), 5)
+    return frame_type, str(payload, 'utf-8')
+
+
+def test_drain_clients(server: Server) -> None:
+    """
+    При остановке клиенты получают уведомление; клиент, который
+    не отключился за shutdown_grace, отключается сервером. Курсоры
+    обоих сохраняются, сообщения, полученные до остановки, доставлены.
+    """
+    server.connected_clients.clear()
+
+    async def run() -> None:
+        listener = await asyncio.start_server(server.client_connected, '127.0.0.1', 0)
+        client = Client('127.0.0.1', listener.sockets[0].getsockname()[1], compression=())
+        carol, carol_writer = await client.connect('register', 'carol', 'secret')
+        dave, dave_writer = await client.connect('register', 'dave', 'secret')
+        while len(server.connected_clients) < 2:
+            await asyncio.sleep(0.01)
+        carol_writer.write(encode_frame(FrameType.CHAT, 'before restart'))
+        assert (await next_frame(dave))[1].endswith('carol: before restart')
+        assert (await next_frame(carol))[1].endswith('carol: before restart')
+
+        listener.close()
+        drain = asyncio.create_task(server.drain_clients())
+        restarting = (FrameType.SERVER, 'Server is restarting, please reconnect')
+        assert await next_frame(carol) == restarting
+        assert await next_frame(dave) == restarting
+        dave_writer.close()
+        # carol не отключается: сервер закрывает соединение после shutdown_grace.
+        assert await asyncio.wait_for(anext(carol, None), 5) is None
+        await asyncio.wait_for(drain, 10)
+        carol_writer.close()
+        assert server.connected_clients == {}
+
+    asyncio.run(run())
+    for user in ('carol', 'dave'):
+        assert server.cursors.get(user)['rooms'] == {DEFAULT_ROOM: 0}
+
+
+def test_outbound_peak_depth(server: Server) -> None:
+    """
+    При отключении клиента наибольшая глубина его очереди исходящих
+    сообщений учитывается в гистограмме chat_outbound_queue_peak_depth.
+    """
+    server.connected_clients.clear()
+
+    async def run() -> None:
+        outbound = OutboundQueue(FrameWriter(), 100, 'drop_oldest')
+        for index in range(7):
+            outbound.put_nowait(encode_frame(FrameType.CHAT, f'message {index}'))
+        await outbound.flush()
+        outbound.put_nowait(encode_frame(FrameType.CHAT, 'one more'))
+        assert outbound.max_depth == 7
+        await server.disconnect_client('alice', {
+            'outbound': outbound, 'rooms': set(), 'room': DEFAULT_ROOM,
+        })
+
+    asyncio.run(run())
+    metrics = server.metrics.render()
+    assert 'chat_outbound_queue_peak_depth_bucket{le="5"} 0' in metrics
+    assert 'chat_outbound_queue_peak_depth_bucket{le="10"} 1' in metrics
+    assert 'chat_outbound_queue_peak_depth_sum 7.0' in metrics
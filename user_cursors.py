@@ -0,0 +1,88 @@
+import asyncio
+import json
+import os
+import tempfile
+from typing import Any
+from urllib.parse import quote
+
+CURSOR_SUFFIX: str = '.json'
+
+
+class CursorStore:
+    """
+    Курсоры пользователей: номер последнего доставленного сообщения
+    каждой комнаты, текущая комната и время последнего визита.
+    Курсоры меняются при каждом отключении, поэтому хранятся не в БД
+    пользователей, а в небольшом файле на пользователя (directory):
+    запись курсора не переписывает всю БД, а рабочие процессы читают
+    курсоры друг друга без ее перечитывания.
+    Изменения копятся в памяти и записываются пачкой в пуле потоков
+    (flush); после сбоя теряются только курсоры последней пачки,
+    и клиент повторно получает уже доставленные сообщения.
+    """
+    def __init__(self, directory: str) -> None:
+        """
+        Инициализация хранилища курсоров.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.pending: dict[str, dict[str, Any]] = {}
+        self.writing: dict[str, dict[str, Any]] = {}
+
+    def path(self, username: str) -> str:
+        """
+        Путь к файлу курсоров пользователя.
+        """
+        return os.path.join(self.directory, quote(username, safe='') + CURSOR_SUFFIX)
+
+    def get(self, username: str) -> dict[str, Any] | None:
+        """
+        Курсоры пользователя (None, если они еще не сохранялись).
+        """
+        cursors = self.pending.get(username) or self.writing.get(username)
+        if cursors is not None:
+            return cursors
+        try:
+            with open(self.path(username), 'rb') as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def update(self, username: str, **cursors: Any) -> None:
+        """
+        Замена курсоров пользователя без немедленной записи на диск.
+        """
+        self.pending[username] = cursors
+
+    def write(self, records: dict[str, dict[str, Any]]) -> None:
+        """
+        Атомарная запись файлов курсоров (через временный файл).
+        """
+        for username, cursors in records.items():
+            with tempfile.NamedTemporaryFile(
+                'w', dir=self.directory, suffix='.tmp', delete=False,
+            ) as file:
+                json.dump(cursors, file)
+            os.replace(file.name, self.path(username))
+
+    async def flush(self) -> None:
+        """
+        Запись накопленных изменений в пуле потоков.
+        """
+        if not self.pending or self.writing:
+            return
+        self.writing, self.pending = self.pending, {}
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.write, self.writing)
+        except BaseException:
+            self.pending = {**self.writing, **self.pending}
+            raise
+        finally:
+            self.writing = {}
+
+    def close(self) -> None:
+        """
+        Запись всех изменений при остановке сервера.
+        """
+        self.write({**self.writing, **self.pending})
+        self.pending.clear()
@@ -0,0 +1,169 @@
+import asyncio
+import datetime
+import json
+import os
+import tempfile
+from typing import Any
+
+
+def load_users(filename: str) -> tuple[dict[str, dict[str, Any]], int]:
+    """
+    Чтение БД пользователей. Возвращает пользователей и mtime файла.
+    Файл, записанный save_users(), разбирается по записи на строку:
+    при чтении в пуле потоков json.loads держит GIL только на время
+    одной записи, а не всего файла. Файлы другого вида (например,
+    с отступами) разбираются целиком.
+    """
+    mtime = os.stat(filename).st_mtime_ns
+    with open(filename, 'r') as file:
+        lines = file.read().splitlines()
+    records = lines[1:-1]
+    if lines[:1] == ['['] and lines[-1:] == [']'] and all(
+        line.startswith('{') for line in records
+    ):
+        data = [json.loads(line.rstrip(',')) for line in records]
+    else:
+        data = json.loads('\n'.join(lines))
+    return {user['username']: user for user in data}, mtime
+
+
+def save_users(filename: str, users: list[dict[str, Any]]) -> None:
+    """
+    Атомарная запись БД пользователей на диск (через временный файл
+    в том же каталоге): JSON-список с записью пользователя на строке.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    with tempfile.NamedTemporaryFile(
+        'w', dir=directory, suffix='.tmp', delete=False,
+    ) as file:
+        file.write('[\n')
+        file.write(',\n'.join(json.dumps(user) for user in users))
+        file.write('\n]\n')
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(file.name, filename)
+
+
+class UserRegistry:
+    """
+    Реестр зарегистрированных пользователей.
+    БД пользователей загружается в память один раз и перечитывается
+    (в пуле потоков) только при изменении файла; регистрация и смена
+    пароля записываются на диск до ответа клиенту, одновременные
+    записи объединяются в одну (курсоры пользователей хранятся
+    отдельно, см. user_cursors.py).
+    Записи пользователей не изменяются на месте, а заменяются,
+    поэтому их можно сериализовать в другом потоке.
+    """
+    def __init__(self, filename: str) -> None:
+        """
+        Инициализация реестра и загрузка БД пользователей.
+        """
+        self.filename = filename
+        self.users, self.mtime = load_users(filename)
+        # Изменения, которые еще не записаны на диск.
+        self.changes: dict[str, dict[str, Any]] = {}
+        self.version: int = 0
+        self.saved_version: int = 0
+        self.saving: asyncio.Future[None] | None = None
+        self.reloading: asyncio.Future[None] | None = None
+
+    def __contains__(self, username: str) -> bool:
+        return username in self.users
+
+    def get(self, username: str) -> dict[str, Any] | None:
+        """
+        Возвращает данные пользователя (или None, если он не зарегистрирован).
+        """
+        return self.users.get(username)
+
+    async def lookup(self, username: str) -> dict[str, Any] | None:
+        """
+        Данные пользователя с учетом изменений БД другими процессами.
+        """
+        await self.refresh()
+        return self.users.get(username)
+
+    async def refresh(self) -> None:
+        """
+        Перечитывает БД пользователей, если файл изменился с момента
+        последней загрузки или записи.
+        """
+        if self.reloading is None:
+            self.reloading = asyncio.ensure_future(self.reload())
+        await asyncio.shield(self.reloading)
+
+    async def reload(self) -> None:
+        """
+        Чтение измененной БД пользователей в пуле потоков
+        (поверх нее остаются еще не записанные изменения).
+        """
+        try:
+            if os.stat(self.filename).st_mtime_ns == self.mtime:
+                return
+            users, mtime = await asyncio.get_running_loop().run_in_executor(
+                None, load_users, self.filename,
+            )
+            users.update(self.changes)
+            self.users, self.mtime = users, mtime
+        finally:
+            self.reloading = None
+
+    async def register(self, username: str, password_hash: str) -> bool:
+        """
+        Регистрация нового пользователя.
+        Возвращает False, если имя пользователя уже занято.
+        """
+        if await self.lookup(username) is not None:
+            return False
+        self.change(username, {
+            'username': username,
+            'password': password_hash,
+            'last_visit': datetime.datetime.now().timestamp(),
+        })
+        await self.save()
+        return True
+
+    async def set_password(self, username: str, password_hash: str) -> None:
+        """
+        Замена хеша пароля пользователя.
+        """
+        self.change(username, dict(self.users[username], password=password_hash))
+        await self.save()
+
+    def change(self, username: str, user: dict[str, Any]) -> None:
+        """
+        Замена записи пользователя в памяти (до записи на диск).
+        """
+        self.users[username] = self.changes[username] = user
+        self.version += 1
+
+    async def save(self) -> None:
+        """
+        Ожидание записи на диск всех изменений, сделанных до вызова.
+        """
+        version = self.version
+        while self.saved_version < version:
+            if self.saving is None:
+                self.saving = asyncio.ensure_future(self.write())
+            await asyncio.shield(self.saving)
+
+    async def write(self) -> None:
+        """
+        Запись БД пользователей в пуле потоков (с изменениями,
+        которые другие процессы успели записать в файл).
+        """
+        try:
+            await self.refresh()
+            version = self.version
+            changes = dict(self.changes)
+            await asyncio.get_running_loop().run_in_executor(
+                None, save_users, self.filename, list(self.users.values()),
+            )
+            self.mtime = os.stat(self.filename).st_mtime_ns
+            self.saved_version = version
+            for username, user in changes.items():
+                if self.changes.get(username) is user:
+                    del self.changes[username]
+        finally:
+            self.saving = None